@@ -0,0 +1,226 @@
+from __future__ import annotations
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.safety import is_medical_advice_request
+from app.simple_detectors import detect_lang, extract_branch_name
+from app.store import CatalogStore, InMemoryStore, SQLiteStore
+from app.synthetic import Catalog, generate_catalog
+from app.tools import get_branch_by_name, get_medication_by_name, get_prescriptions_for_user, get_stock, verify_prescription
+
+# Microbenchmarks of the deterministic path (tools + detectors) over synthetic catalogs of growing size.
+#
+# For every scale (catalog rows, see synthetic.py) and benchmark:
+# - ops_per_s: calls per second over a rotating set of inputs (timed loop of --min-time seconds)
+# - peak_bytes_per_call: mean tracemalloc peak of a single call (temporary allocations)
+# - retained_bytes: memory still allocated after the traced calls (caches / leaks)
+# The inputs are drawn from the catalog; medication lookups are split by resolution path (exact name,
+# English / Hebrew alias, typo, not found, short fragment), the other inputs mix hits and misses.
+#
+# Regression check for CI: compare against a baseline file, exit 1 if a benchmark got slower / allocates
+# more than the tolerance allows. Baselines are absolute timings of one machine, so none is committed:
+# record one on the machine that runs the comparison (e.g. from the base commit in the same CI job),
+# app/bench_baseline.json is git-ignored.
+#
+#   python -m app.bench --scales 1000,10000,100000 --save-baseline app/bench_baseline.json
+#   python -m app.bench --scales 1000,10000,100000 --compare [app/bench_baseline.json] --tolerance 0.3
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "bench_baseline.json")
+N_INPUTS = 256
+WARMUP_CALLS = 32
+MIN_CALLS = 5
+ALLOC_CALLS = 200  # max traced calls per benchmark
+
+
+def build_store(catalog: Catalog, backend: str, workdir: str) -> CatalogStore:
+    rows = len(catalog.prescriptions)  # one file per scale
+    if backend == "memory":
+        return InMemoryStore(*catalog, version="bench")
+    if backend == "sqlite":
+        return SQLiteStore.create(os.path.join(workdir, f"bench_{rows}.sqlite3"), *catalog)
+    if backend == "mmap":
+        from app.mmap_store import MmapStore, write_mmap_catalog
+        path = os.path.join(workdir, f"bench_{rows}.mmap")
+        write_mmap_catalog(path, *catalog)
+        return MmapStore(path)
+    raise ValueError(f"Unknown backend: {backend!r} (expected 'memory', 'sqlite' or 'mmap')")
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    # one dropped / doubled character, like a user typing fast
+    i = rng.randrange(1, len(word))
+    return word[:i] + word[i + 1:] if rng.random() < 0.5 else word[:i] + word[i] + word[i:]
+
+
+def bench_cases(catalog: Catalog, store: CatalogStore, seed: int = 0) -> Dict[str, Tuple[Callable[[Any], Any], List[Any]]]:
+    """name -> (function of one input, inputs); the inputs are drawn from the catalog."""
+    rng = random.Random(seed)
+    meds, branches = catalog.medications, catalog.branches
+    pick = lambda seq: seq[rng.randrange(len(seq))]
+
+    # medication lookups per resolution path: they scale very differently with the catalog size
+    some_meds = [pick(meds) for _ in range(N_INPUTS)]
+    med_exact = [m.display_name for m in some_meds]
+    med_alias = [m.aliases[rng.randrange(4)] for m in some_meds]  # English or Hebrew alias
+    med_typo = [_typo(m.display_name, rng) for m in some_meds]
+    med_missing = ["zzqxv" + m.display_name.lower() for m in some_meds]
+    med_short = [m.display_name[:2] for m in some_meds]  # contains match on most of the catalog -> AMBIGUOUS
+    branch_names = [pick(b.aliases) if rng.random() < 0.8 else "nowhere " + b.display_name for b in (pick(branches) for _ in range(N_INPUTS))]
+    stock_keys = [(pick(branches).branch_id, pick(meds).med_id) for _ in range(N_INPUTS)]
+    rx_ids = [pick(catalog.prescriptions).rx_id if rng.random() < 0.9 else "RX-1" for _ in range(N_INPUTS)]
+    user_ids = [pick(catalog.users).user_id for _ in range(N_INPUTS)]
+    messages = [
+        rng.choice([
+            f"Do you have {pick(meds).display_name} in stock in {pick(branches).aliases[0]}?",
+            f"האם יש {pick(meds).aliases[2]} בסניף {pick(branches).aliases[1]}?",
+            f"What is the dosage of {pick(meds).display_name} for my child?",
+            "Should I take this with food?",
+            "hello, what can you do?",
+            "מה המינון המומלץ לילדים?",])
+        for _ in range(N_INPUTS)]
+
+    return {
+        "get_medication_by_name:exact": (lambda x: get_medication_by_name(x, store=store), med_exact),
+        "get_medication_by_name:alias": (lambda x: get_medication_by_name(x, store=store), med_alias),
+        "get_medication_by_name:typo": (lambda x: get_medication_by_name(x, store=store), med_typo),
+        "get_medication_by_name:not_found": (lambda x: get_medication_by_name(x, store=store), med_missing),
+        "get_medication_by_name:short": (lambda x: get_medication_by_name(x, store=store), med_short),
+        "get_branch_by_name": (lambda x: get_branch_by_name(x, store=store), branch_names),
+        "get_stock": (lambda x: get_stock(x[0], x[1], store=store), stock_keys),
+        "verify_prescription": (lambda x: verify_prescription(x, store=store), rx_ids),
+        "get_prescriptions_for_user": (lambda x: get_prescriptions_for_user(x, store=store), user_ids),
+        "extract_branch_name": (lambda x: extract_branch_name(x, store=store), messages),
+        "is_medical_advice_request": (is_medical_advice_request, messages),
+        "detect_lang": (detect_lang, messages),
+    }
+
+
+def measure(fn: Callable[[Any], Any], inputs: List[Any], min_time: float) -> dict:
+    """
+    ops/sec + per-call allocation numbers. Both loops cycle through the inputs and stop once
+    min_time has passed (slow paths, e.g. fuzzy lookups on 10^7 rows, get fewer calls).
+    """
+    n = len(inputs)
+    for x in inputs[:WARMUP_CALLS]:  # lazy indices, caches, regex compilation
+        fn(x)
+    calls, t0 = 0, time.perf_counter()
+    while True:
+        fn(inputs[calls % n])
+        calls += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time and calls >= MIN_CALLS:
+            break
+    ops = calls / elapsed
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        peak_total, traced, t0 = 0, 0, time.perf_counter()
+        while traced < ALLOC_CALLS and (traced < MIN_CALLS or time.perf_counter() - t0 < min_time):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            fn(inputs[traced % n])
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+            traced += 1
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "calls": calls,
+        "ops_per_s": round(ops, 1),
+        "us_per_op": round(1e6 / ops, 3),
+        "peak_bytes_per_call": int(peak_total / traced),
+        "retained_bytes": max(0, current - base),
+    }
+
+
+def run(scales: List[int], backend: str = "memory", min_time: float = 0.2, only: Optional[List[str]] = None,
+        seed: int = 0, log=print) -> dict:
+    """{"<scale>": {"<benchmark>": {...}}} plus the catalog build times."""
+    results: Dict[str, Any] = {"backend": backend, "scales": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in scales:
+            t0 = time.perf_counter()
+            catalog = generate_catalog(rows, seed)
+            t1 = time.perf_counter()
+            store = build_store(catalog, backend, workdir)
+            store.mentions  # built lazily by some backends, not part of the timed calls
+            t2 = time.perf_counter()
+            scale: Dict[str, Any] = {"generate_s": round(t1 - t0, 3), "build_store_s": round(t2 - t1, 3), "benchmarks": {}}
+            for name, (fn, inputs) in bench_cases(catalog, store, seed).items():
+                if only and name not in only:
+                    continue
+                scale["benchmarks"][name] = measure(fn, inputs, min_time)
+                log(format_row(rows, name, scale["benchmarks"][name]))
+            results["scales"][str(rows)] = scale
+            del store, catalog
+            gc.collect()
+    return results
+
+
+def format_row(rows: int, name: str, r: dict) -> str:
+    return f"{rows:>10}  {name:<34}{r['ops_per_s']:>14,.0f}{r['us_per_op']:>12.2f}{r['peak_bytes_per_call']:>12}{r['retained_bytes']:>12}"
+
+
+HEADER = f"{'rows':>10}  {'benchmark':<34}{'ops/s':>14}{'us/op':>12}{'peak B':>12}{'kept B':>12}"
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions against a baseline: slower than (1 - tolerance) x baseline ops/s, or peak
+    allocation above (1 + tolerance) x baseline (+ 1 KiB of slack for tiny numbers)."""
+    problems = []
+    for rows, scale in results["scales"].items():
+        base_scale = baseline.get("scales", {}).get(rows)
+        if not base_scale:
+            continue
+        for name, r in scale["benchmarks"].items():
+            b = base_scale["benchmarks"].get(name)
+            if not b:
+                continue
+            if r["ops_per_s"] < b["ops_per_s"] * (1 - tolerance):
+                problems.append(f"{rows} {name}: {r['ops_per_s']:,.0f} ops/s vs baseline {b['ops_per_s']:,.0f}")
+            if r["peak_bytes_per_call"] > b["peak_bytes_per_call"] * (1 + tolerance) + 1024:
+                problems.append(f"{rows} {name}: {r['peak_bytes_per_call']} peak B/call vs baseline {b['peak_bytes_per_call']}")
+    return problems
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Microbenchmarks of the deterministic tools / detectors")
+    ap.add_argument("--scales", default="1000,10000,100000", help="comma separated catalog row counts (10^3 .. 10^7)")
+    ap.add_argument("--backend", default="memory", choices=["memory", "sqlite", "mmap"])
+    ap.add_argument("--min-time", type=float, default=0.2, help="seconds per throughput measurement")
+    ap.add_argument("--only", default=None, help="comma separated benchmark names")
+    ap.add_argument("--out", default=None, help="write the results as JSON")
+    ap.add_argument("--save-baseline", default=None, help="write the results as the new baseline file")
+    ap.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, default=None,
+                    help="baseline file to check for regressions, exit 1 on regression (default file: app/bench_baseline.json)")
+    ap.add_argument("--tolerance", type=float, default=0.3)
+    args = ap.parse_args()
+    if args.compare and not os.path.exists(args.compare):
+        sys.exit(f"no baseline at {args.compare}, record one on this machine first with --save-baseline")
+
+    print(HEADER)
+    results = run([int(float(s)) for s in args.scales.split(",")], args.backend, args.min_time,
+                  args.only.split(",") if args.only else None)
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("backend") != results["backend"]:
+            sys.exit(f"baseline backend {baseline.get('backend')!r} != {results['backend']!r}")
+        problems = compare(results, baseline, args.tolerance)
+        for p in problems:
+            print("REGRESSION", p)
+        sys.exit(1 if problems else 0)
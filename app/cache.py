@@ -0,0 +1,198 @@
+from __future__ import annotations
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Small caches for expensive, repeatable calls (e.g. LLM routing results, rendered answers).
+# LRUCache lives in process memory; DiskLRUCache keeps the same interface in a SQLite file, so
+# entries survive restarts and are shared by the workers that point at the same file.
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live per entry.
+
+    - maxsize: max number of entries, the least recently used one is evicted first (0 disables the cache)
+    - ttl: seconds an entry stays valid after it was stored (None = no expiry); expired
+      entries are dropped lazily when read
+    - hit / miss / eviction / expiry counters for observability, see stats()
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at and self._clock() >= expires_at:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = self._clock() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used);
+-- row count kept by triggers, so put / len don't scan the table (COUNT(*) is a full index scan)
+CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER NOT NULL);
+CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache BEGIN UPDATE cache_size SET n = n + 1; END;
+CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache BEGIN UPDATE cache_size SET n = n - 1; END;
+INSERT OR IGNORE INTO cache_size SELECT 0, COUNT(*) FROM cache;
+"""
+
+
+class DiskLRUCache:
+    """
+    LRUCache on a SQLite file (same get / put / clear / stats interface).
+
+    - keys are strings or tuples of JSON-encodable parts, values must be JSON-encodable
+    - ttl is wall-clock based (time.time), so it keeps counting across restarts
+    - least recently used entries are evicted on put once the file holds more than maxsize
+    - counters are per process; size is read from the file
+    """
+
+    def __init__(self, path: str, maxsize: int = 1024, ttl: Optional[float] = None, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")  # readers in other workers don't block on writes
+        conn.executescript(_DISK_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread (sqlite3 connections are not shared across threads)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return key if isinstance(key, str) else json.dumps(list(key) if isinstance(key, tuple) else key, ensure_ascii=False)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT n FROM cache_size").fetchone()[0]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        k = self._key(key)
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (k,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return default
+        value, expires_at = row
+        now = self._clock()
+        if expires_at and now >= expires_at:
+            conn.execute("DELETE FROM cache WHERE key = ?", (k,))
+            self._count("expirations")
+            self._count("misses")
+            return default
+        conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, k))
+        self._count("hits")
+        return json.loads(value)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        now = self._clock()
+        expires_at = now + self.ttl if self.ttl else 0.0
+        conn = self._conn()
+        with conn:  # one transaction: insert + evict
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at, last_used = excluded.last_used",
+                (self._key(key), json.dumps(value, ensure_ascii=False), expires_at, now))
+            # only an insert of a new key grows the table (the upsert of an existing one fires no insert trigger)
+            over = conn.execute("SELECT n FROM cache_size").fetchone()[0] - self.maxsize
+            if over > 0:
+                evicted = conn.execute(
+                    "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY last_used LIMIT ?)", (over,)).rowcount
+                with self._lock:
+                    self.evictions += evicted
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
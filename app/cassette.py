@@ -0,0 +1,469 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+import hashlib
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from app import config
+
+# Record / replay cassettes of the LLM calls, to reproduce a slow or wrong turn offline.
+#
+# LLM_CASSETTE_MODE=record appends one JSONL line per LLM call made by llm.py (router, med name extractor,
+# answer renderer; sync and async clients) to LLM_CASSETTE_PATH:
+#   {"type": "llm", "turn_id", "fn", "prompt_hash", "model", "request", "output", "stream",
+#    "deltas": [[seconds since the request, text], ...], "ttft_s", "duration_s", "usage", "complete", "error", "started_at"}
+# and one line per turn (handle_turn / handle_turn_async) with the request, answer, flow and ToolCallRecords:
+#   {"type": "turn", "turn_id", "request", "answer", "flow", "tool_calls", "ttft_s", "duration_s", "complete", "error", "started_at"}
+# LLM calls carry the id of the turn that made them (speculative / background calls included).
+#
+# LLM_CASSETTE_MODE=replay serves every LLM call from the cassette instead of the API: matched by function
+# and prompt hash (same prompt again -> the next recording of it), deltas and errors replayed with their
+# recorded timing divided by LLM_CASSETTE_SPEED (0 = no delays). A call that is not in the cassette raises
+# CassetteMiss, or goes to the API with LLM_CASSETTE_ON_MISS=live.
+#
+# Re-run the recorded turns against the current code, e.g. as a `git bisect run` check:
+#   python -m app.cassette replay llm_cassette.jsonl [--speed 1] [--max-slowdown 1.2]
+# It prints recorded vs replayed turn latency and whether the answer / trace still match (exit 1 if not).
+
+_MODES = ("off", "record", "replay")
+_TURN: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("cassette_turn", default=None)
+_UNSTABLE_TRACE = ("catalog_snapshot", "speculative_extract")  # differ between runs of the same turn
+
+
+class CassetteMiss(LookupError):
+    """Replayed LLM call that is not in the cassette (its prompt changed, or it was never recorded)."""
+
+
+class ReplayedError(RuntimeError):
+    """A recorded LLM call failure, raised again on replay."""
+
+
+def request_hash(request: dict) -> str:
+    # everything that changes the model output (model, input, reasoning, max tokens) - not the timeout
+    body = {k: v for k, v in request.items() if k != "timeout"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class Recorder:
+    """Thread-safe JSONL appender; the file is opened on the first entry."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.written = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, entry: dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()  # a crashed / killed process keeps everything recorded so far
+            self.written += 1
+
+
+class Player:
+    """Recorded LLM calls by (fn, prompt hash), served in recorded order; the last one repeats."""
+
+    def __init__(self, path: str, speed: float = 1.0, on_miss: str = "error"):
+        self.path = path
+        self.speed = speed
+        self.on_miss = on_miss
+        self.calls: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        self.turns: List[dict] = []
+        self.hits = 0
+        self.misses = 0
+        self._served: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._lock = threading.Lock()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get("type") == "llm":
+                    self.calls[(entry["fn"], entry["prompt_hash"])].append(entry)
+                elif entry.get("type") == "turn":
+                    self.turns.append(entry)
+        for entries in self.calls.values():
+            entries.sort(key=lambda e: e.get("started_at") or 0)
+        self.turns.sort(key=lambda e: e.get("started_at") or 0)
+
+    def take(self, fn: str, request: dict) -> Optional[dict]:
+        """The recording of this call; None on a miss with on_miss="live", else CassetteMiss."""
+        key = (fn, request_hash(request))
+        with self._lock:
+            entries = self.calls.get(key)
+            if not entries:
+                self.misses += 1
+                if self.on_miss == "live":
+                    return None
+                raise CassetteMiss(f"{fn}: no recorded call with prompt hash {key[1][:12]} in {self.path}")
+            i = self._served[key]
+            self._served[key] = i + 1
+            self.hits += 1
+        return entries[min(i, len(entries) - 1)]
+
+    def delay(self, seconds: Optional[float]) -> float:
+        return max(0.0, seconds or 0.0) / self.speed if self.speed > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {"mode": "replay", "path": self.path, "calls": sum(len(v) for v in self.calls.values()),
+                "turns": len(self.turns), "hits": self.hits, "misses": self.misses}
+
+
+_recorder: Optional[Recorder] = None
+_player: Optional[Player] = None
+
+
+def configure(mode: str, path: str, speed: float = 1.0, on_miss: str = "error") -> None:
+    """Switch the process to a cassette mode (done at import from LLM_CASSETTE_*)."""
+    global _recorder, _player
+    if mode not in _MODES:
+        raise ValueError(f"Unknown LLM_CASSETTE_MODE: {mode!r} (expected 'off', 'record' or 'replay')")
+    if on_miss not in ("error", "live"):
+        raise ValueError(f"Unknown LLM_CASSETTE_ON_MISS: {on_miss!r} (expected 'error' or 'live')")
+    _recorder = Recorder(path) if mode == "record" else None
+    _player = Player(path, speed, on_miss) if mode == "replay" else None
+
+
+def stats() -> dict:
+    if _player is not None:
+        return _player.stats()
+    if _recorder is not None:
+        return {"mode": "record", "path": _recorder.path, "written": _recorder.written}
+    return {"mode": "off"}
+
+
+class _Call:
+    # one LLM call being recorded
+    def __init__(self, fn: str, request: dict, stream: bool):
+        self.fn, self.request, self.stream = fn, request, stream
+        self.turn_id = _TURN.get()
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.deltas: List[list] = []
+        self.finished = False
+
+    def delta(self, text: str) -> None:
+        self.deltas.append([round(time.perf_counter() - self.t0, 4), text])
+
+    def finish(self, output: Optional[str] = None, usage: Optional[dict] = None, error: Optional[BaseException] = None, complete: bool = True) -> None:
+        self.finished = True
+        duration = round(time.perf_counter() - self.t0, 4)
+        if output is None:
+            output = "".join(d for _, d in self.deltas)
+        _recorder.write({
+            "type": "llm",
+            "turn_id": self.turn_id,
+            "fn": self.fn,
+            "prompt_hash": request_hash(self.request),
+            "model": self.request.get("model"),
+            "request": {k: v for k, v in self.request.items() if k != "timeout"},
+            "output": output,
+            "stream": self.stream,
+            "deltas": self.deltas if self.stream else None,
+            "ttft_s": (self.deltas[0][0] if self.deltas else None) if self.stream else duration,
+            "duration_s": duration,
+            "usage": usage,
+            "complete": complete and error is None,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "started_at": self.started_at,})
+
+
+def _replayed(entry: dict) -> str:
+    if entry.get("error"):
+        raise ReplayedError(entry["error"])
+    return entry["output"]
+
+
+def complete(fn: str, request: dict, call: Callable[[], Tuple[str, Optional[dict]]]) -> str:
+    """Output text of a non-streamed LLM call; call() makes the real request -> (output_text, usage)."""
+    entry = _player.take(fn, request) if _player is not None else None
+    if entry is not None:
+        time.sleep(_player.delay(entry.get("duration_s")))
+        return _replayed(entry)
+    if _recorder is None:
+        return call()[0]
+    rec = _Call(fn, request, stream=False)
+    try:
+        text, usage = call()
+    except Exception as e:
+        rec.finish(error=e)
+        raise
+    rec.finish(output=text, usage=usage)
+    return text
+
+
+async def acomplete(fn: str, request: dict, call: Callable[[], Awaitable[Tuple[str, Optional[dict]]]]) -> str:
+    """``complete`` for the async client."""
+    entry = _player.take(fn, request) if _player is not None else None
+    if entry is not None:
+        await asyncio.sleep(_player.delay(entry.get("duration_s")))
+        return _replayed(entry)
+    if _recorder is None:
+        return (await call())[0]
+    rec = _Call(fn, request, stream=False)
+    try:
+        text, usage = await call()
+    except Exception as e:
+        rec.finish(error=e)
+        raise
+    rec.finish(output=text, usage=usage)
+    return text
+
+
+def stream(fn: str, request: dict, live: Callable[[], Iterator[str]], usage: Callable[[], Optional[dict]] = lambda: None) -> Iterator[str]:
+    """Text deltas of a streamed LLM call; live() starts the real stream, usage() is read when it is done."""
+    entry = _player.take(fn, request) if _player is not None else None
+    if entry is not None:
+        return _replay_stream(entry)
+    if _recorder is None:
+        return live()
+    return _record_stream(_Call(fn, request, stream=True), live(), usage)
+
+
+def astream(fn: str, request: dict, live: Callable[[], AsyncIterator[str]], usage: Callable[[], Optional[dict]] = lambda: None) -> AsyncIterator[str]:
+    """``stream`` for the async client."""
+    entry = _player.take(fn, request) if _player is not None else None
+    if entry is not None:
+        return _areplay_stream(entry)
+    if _recorder is None:
+        return live()
+    return _arecord_stream(_Call(fn, request, stream=True), live(), usage)
+
+
+def _replay_stream(entry: dict) -> Iterator[str]:
+    prev = 0.0
+    for t, delta in entry.get("deltas") or []:
+        time.sleep(_player.delay(t - prev))
+        prev = t
+        yield delta
+    time.sleep(_player.delay(entry.get("duration_s", prev) - prev))
+    if entry.get("error"):
+        raise ReplayedError(entry["error"])
+
+
+async def _areplay_stream(entry: dict) -> AsyncIterator[str]:
+    prev = 0.0
+    for t, delta in entry.get("deltas") or []:
+        await asyncio.sleep(_player.delay(t - prev))
+        prev = t
+        yield delta
+    await asyncio.sleep(_player.delay(entry.get("duration_s", prev) - prev))
+    if entry.get("error"):
+        raise ReplayedError(entry["error"])
+
+
+def _record_stream(rec: _Call, it: Iterator[str], usage: Callable[[], Optional[dict]]) -> Iterator[str]:
+    try:
+        for delta in it:
+            rec.delta(delta)
+            yield delta
+        rec.finish(usage=usage())
+    except Exception as e:
+        if not rec.finished:
+            rec.finish(error=e)
+        raise
+    finally:
+        if not rec.finished:  # closed before the end (client went away): keep what was streamed
+            it.close()
+            rec.finish(complete=False)
+
+
+async def _arecord_stream(rec: _Call, it: AsyncIterator[str], usage: Callable[[], Optional[dict]]) -> AsyncIterator[str]:
+    try:
+        async for delta in it:
+            rec.delta(delta)
+            yield delta
+        rec.finish(usage=usage())
+    except Exception as e:
+        if not rec.finished:
+            rec.finish(error=e)
+        raise
+    finally:
+        if not rec.finished:
+            await it.aclose()
+            rec.finish(complete=False)
+
+
+class _Turn:
+    # one turn being recorded: the last (delta, ChatResponse) update is the turn result
+    def __init__(self, req: Any):
+        self.turn_id = uuid.uuid4().hex
+        self.request = req.model_dump(mode="json")  # now: the turn updates req.flow in place
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.last: Any = None
+
+    def update(self, item: Any) -> None:
+        delta, self.last = item
+        if self.ttft is None and delta.strip():
+            self.ttft = round(time.perf_counter() - self.t0, 4)
+
+    def finish(self, error: Optional[BaseException] = None, complete: bool = True) -> None:
+        last = self.last
+        _recorder.write({
+            "type": "turn",
+            "turn_id": self.turn_id,
+            "request": self.request,
+            "answer": last.answer if last is not None else None,
+            "flow": last.flow.model_dump(mode="json") if last is not None else None,
+            "tool_calls": [tc.model_dump(mode="json") for tc in last.tool_calls] if last is not None else [],
+            "ttft_s": self.ttft,
+            "duration_s": round(time.perf_counter() - self.t0, 4),
+            "complete": complete and error is None,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "started_at": self.started_at,})
+
+
+def record_turn(req: Any, updates: Iterator[Any]) -> Iterator[Any]:
+    """The turn's (delta, ChatResponse) updates; when recording, its LLM calls are tagged and the turn is written."""
+    if _recorder is None:
+        return updates
+    return _record_turn(_Turn(req), updates)
+
+
+def arecord_turn(req: Any, updates: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """``record_turn`` for the async driver."""
+    if _recorder is None:
+        return updates
+    return _arecord_turn(_Turn(req), updates)
+
+
+def _record_turn(turn: _Turn, updates: Iterator[Any]) -> Iterator[Any]:
+    # the turn id is set around every step, whichever thread / context the consumer resumes us from
+    done = False
+    try:
+        while True:
+            token = _TURN.set(turn.turn_id)
+            try:
+                item = next(updates)
+            except StopIteration:
+                break
+            finally:
+                _TURN.reset(token)
+            turn.update(item)
+            yield item
+        done = True
+        turn.finish()
+    except Exception as e:
+        done = True
+        turn.finish(error=e)
+        raise
+    finally:
+        if not done:
+            updates.close()
+            turn.finish(complete=False)
+
+
+async def _arecord_turn(turn: _Turn, updates: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    done = False
+    try:
+        while True:
+            token = _TURN.set(turn.turn_id)
+            try:
+                item = await updates.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                _TURN.reset(token)
+            turn.update(item)
+            yield item
+        done = True
+        turn.finish()
+    except Exception as e:
+        done = True
+        turn.finish(error=e)
+        raise
+    finally:
+        if not done:
+            await updates.aclose()
+            turn.finish(complete=False)
+
+
+configure(config.LLM_CASSETTE_MODE, config.LLM_CASSETTE_PATH, config.LLM_CASSETTE_SPEED, config.LLM_CASSETTE_ON_MISS)
+
+
+def _stable_trace(tool_calls: List[dict]) -> List[dict]:
+    return [json.loads(json.dumps(tc, sort_keys=True, default=str)) for tc in tool_calls if tc.get("name") not in _UNSTABLE_TRACE]
+
+
+async def replay_turns(path: str, speed: float = 1.0, log=print) -> List[dict]:
+    """
+    Re-run every recorded turn (in recorded order, with its history and flow) on the async driver,
+    LLM calls served from the cassette. One row per turn: recorded / replayed latency, answer and trace match.
+    """
+    from app.orchestrator_async import handle_turn_async
+    from app.schemas import ChatRequest
+
+    configure("replay", path, speed)
+    rows = []
+    for rec in _player.turns:
+        t0 = time.perf_counter()
+        ttft, last, error = None, None, None
+        try:
+            async for delta, partial in handle_turn_async(ChatRequest(**rec["request"])):
+                if ttft is None and delta.strip():
+                    ttft = time.perf_counter() - t0
+                last = partial
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        row = {
+            "turn_id": rec["turn_id"],
+            "message": rec["request"]["message"],
+            "recorded_s": rec["duration_s"],
+            "replayed_s": round(time.perf_counter() - t0, 4),
+            "recorded_ttft_s": rec.get("ttft_s"),
+            "replayed_ttft_s": round(ttft, 4) if ttft is not None else None,
+            "answer_match": last is not None and last.answer == rec.get("answer"),
+            "trace_match": last is not None and _stable_trace([tc.model_dump(mode="json") for tc in last.tool_calls]) == _stable_trace(rec.get("tool_calls") or []),
+            "error": error,}
+        rows.append(row)
+        log(format_row(row))
+    return rows
+
+
+HEADER = f"{'turn':<10}{'message':<42}{'recorded ms':>12}{'replayed ms':>12}{'answer':>8}{'trace':>7}"
+
+
+def format_row(row: dict) -> str:
+    ok = lambda b: "ok" if b else "DIFF"
+    msg = row["message"].replace("\n", " ")
+    msg = msg if len(msg) <= 40 else msg[:39] + "…"
+    line = f"{row['turn_id'][:8]:<10}{msg:<42}{row['recorded_s'] * 1000:>12.0f}{row['replayed_s'] * 1000:>12.0f}{ok(row['answer_match']):>8}{ok(row['trace_match']):>7}"
+    return line + (f"  {row['error']}" if row["error"] else "")
+
+
+def main() -> None:
+    import argparse
+    ap = argparse.ArgumentParser(description="Replay the turns of an LLM cassette against the current code")
+    ap.add_argument("command", choices=["replay"])
+    ap.add_argument("path", nargs="?", default=config.LLM_CASSETTE_PATH)
+    ap.add_argument("--speed", type=float, default=1.0, help="LLM timing: 1 = as recorded, 10 = 10x faster, 0 = no delays")
+    ap.add_argument("--max-slowdown", type=float, default=None,
+                    help="exit 1 when the replayed turns take longer than this x the recorded time in total (use with --speed 1)")
+    args = ap.parse_args()
+
+    print(HEADER)
+    rows = asyncio.run(replay_turns(args.path, args.speed))
+    recorded = sum(r["recorded_s"] for r in rows)
+    replayed = sum(r["replayed_s"] for r in rows)
+    diffs = [r for r in rows if r["error"] or not (r["answer_match"] and r["trace_match"])]
+    print(f"{len(rows)} turns, recorded {recorded:.2f}s, replayed {replayed:.2f}s, {len(diffs)} changed, {_player.misses} cassette misses")
+    slow = args.max_slowdown is not None and replayed > recorded * args.max_slowdown
+    if slow:
+        print(f"SLOWER than {args.max_slowdown}x the recorded time")
+    sys.exit(1 if diffs or slow else 0)
+
+
+if __name__ == "__main__":
+    # run on the package module (the one llm.py records / replays through), not on this __main__ copy
+    from app import cassette
+    cassette.main()
@@ -0,0 +1,88 @@
+import os
+from dotenv import load_dotenv
+
+# Runtime configuration, read once from the environment (.env supported like in llm.py)
+load_dotenv()
+
+# catalog storage backend: "memory" (synthetic lists from db.py) | "sqlite" | "mmap" | "snapshot"
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "memory").strip().lower()
+# sqlite file, created and seeded with the synthetic catalog if it doesn't exist yet
+CATALOG_SQLITE_PATH = os.getenv("CATALOG_SQLITE_PATH", "catalog.sqlite3")
+# memory-mapped catalog file shared by all workers, written from the synthetic catalog if it doesn't exist yet
+CATALOG_MMAP_PATH = os.getenv("CATALOG_MMAP_PATH", "catalog.mmap")
+# snapshot directory (<table>.json / <table>.csv), seeded with the synthetic catalog if empty
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "catalog")
+# seconds between checks for changed snapshot files, 0 disables hot reload
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "2"))
+
+# how many nearby branches with stock to suggest when the requested branch is out of stock
+NEAREST_BRANCHES_K = int(os.getenv("NEAREST_BRANCHES_K", "3"))
+
+# stock events applied per batch by the inventory ingestion pipeline (ingest.py)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+
+# intent routing cache in front of detect_intent_llm (keyed on the normalized message)
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "4096"))  # 0 disables the cache
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", "3600"))  # seconds, 0 = never expire
+INTENT_CACHE_MIN_CONFIDENCE = float(os.getenv("INTENT_CACHE_MIN_CONFIDENCE", "0"))  # only cache results at or above this
+
+# deterministic rule pre-router (ids / catalog mentions / greeting patterns) before the intent cache + LLM
+INTENT_PRE_ROUTER = os.getenv("INTENT_PRE_ROUTER", "1").lower() not in ("0", "false", "no")
+
+# intent router: "llm" | "local" (in-process model, no network) | "local_then_llm_on_low_confidence"
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "llm")
+INTENT_LOCAL_MIN_CONFIDENCE = float(os.getenv("INTENT_LOCAL_MIN_CONFIDENCE", "0.6"))  # below this the LLM decides (fallback mode)
+INTENT_MODEL_DATA = os.getenv("INTENT_MODEL_DATA", os.path.join(os.path.dirname(__file__), "intent_examples.jsonl"))
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "")  # saved model (.npz), trained from INTENT_MODEL_DATA on first use when unset/missing
+
+# LLM routing layer: one call returning intent + med/branch/rx/user slots (flows skip their own extraction)
+INTENT_EXTRACT_SLOTS = os.getenv("INTENT_EXTRACT_SLOTS", "1").lower() not in ("0", "false", "no")
+# with INTENT_EXTRACT_SLOTS=0: max LLM extractor calls started speculatively alongside the router (all turns), 0 disables
+SPECULATIVE_MAX_INFLIGHT = int(os.getenv("SPECULATIVE_MAX_INFLIGHT", "8"))
+# async turns (orchestrator_async.py): threads running the deterministic steps between LLM calls (catalog
+# lookups, fuzzy matching, SQLite queries) off the event loop; 0 runs them inline on the loop
+ASYNC_TURN_STEP_THREADS = int(os.getenv("ASYNC_TURN_STEP_THREADS", "4"))
+
+# shared LLM client (llm_client.py): bounded keep-alive pool, timeouts in seconds, startup warm-up
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "") or None  # e.g. the offline stub (llm_stub.py): http://127.0.0.1:8001/v1
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))  # idle connections kept open
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "0").lower() in ("1", "true", "yes")  # needs the h2 package
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))  # max wait for a free pooled connection
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # streamed answers (render calls)
+LLM_ROUTER_TIMEOUT = float(os.getenv("LLM_ROUTER_TIMEOUT", "20"))  # intent router / extractor calls
+LLM_WARMUP_CONNECTIONS = int(os.getenv("LLM_WARMUP_CONNECTIONS", "2"))  # 0 disables the warm-up
+
+# rendered-answer cache for the factual LLM renderers (med_info / stock_check / rx_verify), keyed on the prompt
+RENDER_CACHE_BACKEND = os.getenv("RENDER_CACHE_BACKEND", "memory").strip().lower()  # "memory" | "disk" | "off"
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "2048"))
+RENDER_CACHE_TTL = float(os.getenv("RENDER_CACHE_TTL", "86400"))  # seconds, 0 = never expire
+RENDER_CACHE_PATH = os.getenv("RENDER_CACHE_PATH", "render_cache.sqlite3")  # disk backend file
+RENDER_CACHE_CHUNK_CHARS = int(os.getenv("RENDER_CACHE_CHUNK_CHARS", "24"))  # replayed stream chunk size
+
+# answer rendering of the factual flows: "llm" (render_text_stream) | "template" (render_templates.py, no tokens)
+# | "template_with_llm_polish_async" (template now, LLM answer rendered in the background into the render
+# cache and served from it on the next identical request). RENDER_MODE is the default, per-flow settings override it.
+RENDER_MODE = os.getenv("RENDER_MODE", "llm").strip().lower()
+RENDER_MODE_MED_INFO = os.getenv("RENDER_MODE_MED_INFO", RENDER_MODE).strip().lower()
+RENDER_MODE_STOCK_CHECK = os.getenv("RENDER_MODE_STOCK_CHECK", RENDER_MODE).strip().lower()
+RENDER_MODE_RX_VERIFY = os.getenv("RENDER_MODE_RX_VERIFY", RENDER_MODE).strip().lower()
+RENDER_POLISH_MAX_INFLIGHT = int(os.getenv("RENDER_POLISH_MAX_INFLIGHT", "4"))  # background polish calls at once
+
+# offline OpenAI Responses API stub (python -m app.llm_stub), latencies in milliseconds
+LLM_STUB_TTFT_MS = float(os.getenv("LLM_STUB_TTFT_MS", "300"))  # before the first token
+LLM_STUB_TOKEN_MS = float(os.getenv("LLM_STUB_TOKEN_MS", "20"))  # between tokens
+LLM_STUB_JITTER = float(os.getenv("LLM_STUB_JITTER", "0.2"))  # +- fraction applied to every delay
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))  # fraction of requests that fail
+LLM_STUB_ERROR_STATUS = int(os.getenv("LLM_STUB_ERROR_STATUS", "500"))
+LLM_STUB_SEED = os.getenv("LLM_STUB_SEED") or None  # fixed seed -> reproducible delays / errors
+LLM_STUB_SCRIPT = os.getenv("LLM_STUB_SCRIPT", "")  # JSONL of {"match": regex, "output": text} scripted answers
+
+# LLM call cassettes (cassette.py): "off" | "record" (append every LLM call + turn trace to LLM_CASSETTE_PATH)
+# | "replay" (serve the LLM calls from LLM_CASSETTE_PATH, no API requests)
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").strip().lower()
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "llm_cassette.jsonl")
+LLM_CASSETTE_SPEED = float(os.getenv("LLM_CASSETTE_SPEED", "1"))  # replay timing: 1 = as recorded, 10 = 10x faster, 0 = no delays
+LLM_CASSETTE_ON_MISS = os.getenv("LLM_CASSETTE_ON_MISS", "error").strip().lower()  # replayed call not in the cassette: "error" | "live"
@@ -1,8 +1,9 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Literal, Tuple
+from typing import Callable, Dict, List, Optional, Literal, Tuple
 from datetime import date
-from app.utils import norm
+import bisect
+import threading
 
 #python decorators for simple classes that automatically creates __init__, __eq__ etc.
 #good for readability, and for data rather than behavior
@@ -27,9 +28,13 @@ class Branch:
     branch_id: str
     display_name: str
     aliases: List[str]
+    lat: Optional[float] = None   # WGS84 coordinates, used to rank nearby branches
+    lon: Optional[float] = None
 
 # simple inventory statuses
 InventoryStatus = Literal["IN_STOCK", "OUT_OF_STOCK", "LOW_STOCK", "UNKNOWN"]
+# fixed status vocabulary for compact storage (status code = position, code 0 = no record)
+INVENTORY_STATUSES: Tuple[InventoryStatus, ...] = ("UNKNOWN", "IN_STOCK", "LOW_STOCK", "OUT_OF_STOCK")
 
 @dataclass(frozen=True)
 class InventoryItem:
@@ -50,6 +55,7 @@ class Prescription:
 
 # synthetic data - located inside the app since it is synthetic, obviously it is not the focus of the assignment to 
 # connect the app to an external db
+# (the lookup indices over it are built by the catalog store, see store.py)
 
 MEDICATIONS: List[Medication] = [
     Medication(
@@ -92,6 +98,23 @@ MEDICATIONS: List[Medication] = [
         rx_required=True,
         label_summary="Statin medication used to lower LDL cholesterol.",
     ),
+    # brand products sharing an active ingredient with the entries above (generic equivalents)
+    Medication(
+        med_id="med_006",
+        display_name="Acamol",
+        aliases=["Acamol Forte","אקמול"],
+        active_ingredient="Paracetamol (Acetaminophen)",
+        rx_required=False,
+        label_summary="Brand of paracetamol, an analgesic/antipyretic used for pain and fever relief.",
+    ),
+    Medication(
+        med_id="med_007",
+        display_name="Moxypen",
+        aliases=["Moxypen Forte","מוקסיפן"],
+        active_ingredient="Amoxicillin",
+        rx_required=True,
+        label_summary="Brand of amoxicillin, a penicillin-class antibiotic for bacterial infections.",
+    ),
 ]
 
 USERS: List[User] = [
@@ -100,26 +123,25 @@ USERS: List[User] = [
     User(user_id="user_010", full_name="User 10"),] # has Atorvastatin
     
 
-# helper indices
-MED_BY_ID: Dict[str, Medication] = {m.med_id: m for m in MEDICATIONS}
-USER_BY_ID: Dict[str, User] = {u.user_id: u for u in USERS}
-
 
 BRANCHES: List[Branch] = [
     Branch(
         branch_id="br_001",
         display_name="Tel Aviv",
-        aliases=["tel aviv", "tlv", "תל אביב", "תא", "ת\"א"], 
+        aliases=["tel aviv", "tlv", "תל אביב", "תא", "ת\"א"],
+        lat=32.0853, lon=34.7818,
     ),
     Branch(
         branch_id="br_002",
         display_name="Jerusalem",
         aliases=["jerusalem", "jlm", "ירושלים", "י\"ם"],
+        lat=31.7683, lon=35.2137,
     ),
     Branch(
         branch_id="br_003",
         display_name="Haifa",
         aliases=["haifa", "חיפה"],
+        lat=32.7940, lon=34.9896,
     ),
 ]
 
@@ -128,10 +150,12 @@ INVENTORY: List[InventoryItem] = [
     InventoryItem(branch_id="br_001", med_id="med_001", status="IN_STOCK"),   # Ibuprofen
     InventoryItem(branch_id="br_001", med_id="med_002", status="LOW_STOCK"),  # Paracetamol
     InventoryItem(branch_id="br_001", med_id="med_003", status="OUT_OF_STOCK"),# Amoxicillin
+    InventoryItem(branch_id="br_001", med_id="med_007", status="IN_STOCK"),   # Moxypen (amoxicillin)
     # Jerusalem
     InventoryItem(branch_id="br_002", med_id="med_001", status="OUT_OF_STOCK"),
     InventoryItem(branch_id="br_002", med_id="med_004", status="IN_STOCK"),   # Omeprazole
     InventoryItem(branch_id="br_002", med_id="med_005", status="IN_STOCK"),   # Atorvastatin
+    InventoryItem(branch_id="br_002", med_id="med_006", status="IN_STOCK"),   # Acamol (paracetamol)
     # Haifa
     InventoryItem(branch_id="br_003", med_id="med_002", status="IN_STOCK"),
     InventoryItem(branch_id="br_003", med_id="med_004", status="LOW_STOCK"),
@@ -147,16 +171,66 @@ PRESCRIPTIONS: List[Prescription] = [
 
 
 
-BRANCH_BY_ID: Dict[str, Branch] = {b.branch_id: b for b in BRANCHES}
-RX_BY_ID: Dict[str, Prescription] = {p.rx_id.upper(): p for p in PRESCRIPTIONS}
-
-# lookup maps
-BRANCH_ALIAS_MAP: Dict[str, str] = {
-    norm(alias): b.branch_id
-    for b in BRANCHES
-    for alias in ([b.display_name] + b.aliases)
-}
-
-# inventory map for O(1) lookup
-INVENTORY_MAP: Dict[Tuple[str, str], InventoryStatus] = {
-    (i.branch_id, i.med_id): i.status for i in INVENTORY}
+def final_rx_status(p: Prescription, today: date) -> RxStatus:
+    """
+    Final prescription status as of a given day:
+    - CANCELLED always cancelled
+    - EXPIRED if explicit status EXPIRED OR expired by date (today > expires_on)
+    - otherwise VALID
+    """
+    if p.status != "CANCELLED" and today > p.expires_on:
+        return "EXPIRED" #to verify expired meds which are valid in db but in fact expired 
+    return p.status
+
+
+class RxStatusView:
+    """
+    Materialized final prescription status (rx_id -> VALID / EXPIRED / CANCELLED),
+    see final_rx_status for the rules.
+
+    The only input that changes over time is the date, so the view is computed once and
+    then refreshed lazily on the first read after a day boundary: prescriptions that are
+    still VALID are kept sorted by expires_on and only the ones that expired since the
+    last refresh are flipped.
+    """
+
+    def __init__(self, prescriptions: List[Prescription], today: Callable[[], date] = date.today):
+        self._today = today
+        self._rows = list(prescriptions)
+        self._lock = threading.Lock()
+        self._rebuild(today())
+
+    def _rebuild(self, today: date) -> None:
+        status: Dict[str, RxStatus] = {}
+        pending: List[Tuple[date, str]] = []
+        for p in self._rows:
+            final = final_rx_status(p, today)
+            status[p.rx_id.upper()] = final
+            if final == "VALID":
+                pending.append((p.expires_on, p.rx_id.upper()))
+        pending.sort()
+        self._status = status
+        self._pending = pending  # still VALID, ordered by expiry date
+        self._cursor = 0
+        self.as_of = today
+
+    def _refresh(self, today: date) -> None:
+        with self._lock:
+            if today == self.as_of:
+                return
+            if today < self.as_of:
+                self._rebuild(today)  # clock went backwards, recompute from stored facts
+                return
+            # expired since the last refresh: expires_on < today
+            end = bisect.bisect_left(self._pending, (today, ""), lo=self._cursor)
+            for _, rx_id in self._pending[self._cursor:end]:
+                self._status[rx_id] = "EXPIRED"
+            self._cursor = end
+            self.as_of = today
+
+    def status(self, p: Prescription) -> RxStatus:
+        """Final status of a prescription as of today."""
+        today = self._today()
+        if today != self.as_of:
+            self._refresh(today)
+        return self._status.get(p.rx_id.upper(), p.status)
@@ -0,0 +1,550 @@
+from __future__ import annotations
+from array import array
+from collections import deque
+import heapq
+import math
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from app.utils import norm_text, fold_text
+
+# Read-only lookup structures built once from the synthetic catalog (see db.py).
+# They only hold normalized keys + integer ordinals, the records themselves stay in db.py.
+
+
+class AliasIndex:
+    """
+    Normalized alias index used for name -> entity resolution.
+
+    Every entry is an (owner_id, value, kind) triple, e.g. ("med_001", "Advil", "alias").
+    Entries are kept in insertion order, which is also the match priority
+    (owner order first, then canonical name before aliases).
+
+    - exact lookups: dict of normalized key -> entry ordinals
+    - contains lookups: n-gram posting lists (1..ngram chars) -> entry ordinals,
+      candidates from the shortest posting list are verified with a real substring test
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str, str]], ngram: int = 3):
+        self.ngram = ngram
+        self.owners: List[str] = []
+        self.values: List[str] = []
+        self.kinds: List[str] = []
+        self.keys: List[str] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._postings: Dict[str, array] = {}
+
+        for owner_id, value, kind in entries:
+            key = norm_text(value)
+            if not key:
+                continue
+            i = len(self.keys)
+            self.owners.append(owner_id)
+            self.values.append(value)
+            self.kinds.append(kind)
+            self.keys.append(key)
+            self._exact.setdefault(key, []).append(i)
+            for g in self._grams(key):
+                self._postings.setdefault(g, array("I")).append(i)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _grams(self, key: str) -> set[str]:
+        grams = set()
+        for n in range(1, self.ngram + 1):
+            for j in range(len(key) - n + 1):
+                grams.add(key[j:j + n])
+        return grams
+
+    def exact(self, q: str) -> List[int]:
+        """Ordinals of entries whose normalized key equals q (q must already be normalized)."""
+        return self._exact.get(q, [])
+
+    def contains(self, q: str, limit: Optional[int] = None) -> List[int]:
+        """
+        Ordinals of entries whose normalized key contains q, in priority order.
+        With limit, stops at the first entry of the (limit + 1)th owner (postings are in priority
+        order), so a one or two letter query doesn't verify every posting of a large catalog.
+        """
+        if not q:
+            return []
+        n = min(self.ngram, len(q))
+        shortest = None
+        for j in range(len(q) - n + 1):
+            posting = self._postings.get(q[j:j + n])
+            if posting is None:
+                return []  # a gram that appears nowhere - no key can contain q
+            if shortest is None or len(posting) < len(shortest):
+                shortest = posting
+        keys, owners = self.keys, self.owners
+        if limit is None:
+            return [i for i in shortest if q in keys[i]]
+        out: List[int] = []
+        seen = set()
+        for i in shortest:
+            if q in keys[i]:
+                if owners[i] not in seen:
+                    if len(seen) == limit:
+                        break
+                    seen.add(owners[i])
+                out.append(i)
+        return out
+
+    def first_per_owner(self, ordinals: Iterable[int]) -> List[Tuple[str, str, str]]:
+        """
+        Collapse ordinals to the first (highest priority) entry per owner,
+        returned as (owner_id, value, kind) in priority order.
+        """
+        seen = set()
+        out = []
+        for i in sorted(ordinals):
+            owner = self.owners[i]
+            if owner in seen:
+                continue
+            seen.add(owner)
+            out.append((owner, self.values[i], self.kinds[i]))
+        return out
+
+
+def levenshtein(a: str, b: str, max_dist: int | None = None) -> int:
+    """
+    Levenshtein edit distance. With max_dist, gives up as soon as the distance is known to
+    exceed it (length difference, or a whole DP row above the budget) and returns max_dist + 1.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_dist is not None and len(a) - len(b) > max_dist:
+        return max_dist + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if max_dist is not None and min(cur) > max_dist:
+            return max_dist + 1
+        prev = cur
+    return prev[-1] if max_dist is None else min(prev[-1], max_dist + 1)
+
+
+def fuzzy_budget(q: str) -> int:
+    """
+    Max edit distance allowed for a query of this length.
+    Very short inputs are never fuzzy matched - "ibu" is 1 edit away from too many things.
+    """
+    if len(q) < 4:
+        return 0
+    if len(q) <= 5:
+        return 1
+    return 2
+
+
+class FuzzyIndex:
+    """
+    Typo tolerant lookups with a bounded edit distance over the Hebrew-folded keys of an
+    AliasIndex. Shares entry ordinals (and therefore priority) with the AliasIndex it was built from.
+
+    Candidates come from a padded trigram index (q-gram filter): every edit touches at most 3
+    trigrams, so a key within k edits of the query shares at least max(len) + 2 - 3k trigrams
+    with it. Only the keys passing that count and the length bound get an edit distance
+    computation (with early exit), the rest of the catalog is never looked at.
+    """
+
+    Q = 3
+
+    def __init__(self, aliases: AliasIndex):
+        self.aliases = aliases
+        # folded key -> ordinals, so every distinct key is checked once
+        by_key: Dict[str, List[int]] = {}
+        for i, key in enumerate(aliases.keys):
+            by_key.setdefault(fold_text(key), []).append(i)
+        self._keys: List[str] = list(by_key)
+        self._ordinals: List[List[int]] = list(by_key.values())
+        self._lens = np.fromiter((len(k) for k in self._keys), dtype=np.int32, count=len(self._keys))
+
+        postings: Dict[Tuple[str, int], List[int]] = {}
+        for kid, key in enumerate(self._keys):
+            for g in self._grams(key):
+                postings.setdefault(g, []).append(kid)
+        self._postings: Dict[Tuple[str, int], np.ndarray] = {g: np.array(p, dtype=np.int32) for g, p in postings.items()}
+
+    @classmethod
+    def _grams(cls, s: str) -> List[Tuple[str, int]]:
+        # padded trigrams, repeats numbered (gram, nth) - set overlap of these is the multiset overlap the bound needs
+        pad = "\x00" * (cls.Q - 1)
+        s = pad + s + pad
+        seen: Dict[str, int] = {}
+        out = []
+        for j in range(len(s) - cls.Q + 1):
+            g = s[j:j + cls.Q]
+            n = seen.get(g, 0)
+            seen[g] = n + 1
+            out.append((g, n))
+        return out
+
+    def _candidates(self, q: str, max_dist: int) -> np.ndarray:
+        """Key ids that can be within max_dist of q (length + shared trigram count bounds)."""
+        lq = len(q)
+        if lq + self.Q - 1 - self.Q * max_dist <= 0:
+            # budget too large for the filter to prove anything: length bound only
+            return np.flatnonzero(np.abs(self._lens - lq) <= max_dist)
+        lists = [p for p in (self._postings.get(g) for g in self._grams(q)) if p is not None]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        kids, shared = np.unique(np.concatenate(lists), return_counts=True)
+        lens = self._lens[kids]
+        ok = (np.abs(lens - lq) <= max_dist) & (shared >= np.maximum(lens, lq) + self.Q - 1 - self.Q * max_dist)
+        return kids[ok]
+
+    def _search(self, q: str, max_dist: int) -> List[Tuple[int, int]]:
+        """(distance, ordinal) pairs within max_dist of the folded query."""
+        out: List[Tuple[int, int]] = []
+        keys, ordinals = self._keys, self._ordinals
+        for kid in self._candidates(q, max_dist).tolist():
+            d = levenshtein(q, keys[kid], max_dist)
+            if d <= max_dist:
+                out.extend((d, i) for i in ordinals[kid])
+        return out
+
+    def search(self, q: str, max_dist: int | None = None) -> List[Tuple[str, str, str, int, float]]:
+        """
+        Ranked fuzzy candidates for q, first (closest, then highest priority) entry per owner:
+        [(owner_id, value, kind, distance, score)], score = 1 - distance / longer length.
+        """
+        fq = fold_text(q)
+        if max_dist is None:
+            max_dist = fuzzy_budget(fq)
+        if not fq or max_dist <= 0:
+            return []
+
+        seen = set()
+        out = []
+        for d, i in sorted(self._search(fq, max_dist)):
+            owner = self.aliases.owners[i]
+            if owner in seen:
+                continue
+            seen.add(owner)
+            key = self.aliases.keys[i]
+            score = round(1 - d / max(len(fq), len(key)), 3)
+            out.append((owner, self.aliases.values[i], self.aliases.kinds[i], d, score))
+        return out
+
+
+class Mention(NamedTuple):
+    start: int
+    end: int          # exclusive
+    kind: str         # e.g. "branch" / "med"
+    entity_id: str
+    value: str        # the display name / alias as written in the catalog
+
+
+class MentionAutomaton:
+    """
+    Aho-Corasick automaton over entity names/aliases (lowercased, plain substring semantics).
+    Finds every entity mention in a message with a single pass over the text,
+    instead of testing every alias of every entity with `in`.
+
+    Patterns are (kind, entity_id, value) triples; their order is the priority used to
+    break ties between equally long mentions.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, str, str]]):
+        self.patterns: List[Tuple[str, str, str, int]] = []  # (kind, entity_id, value, length)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        seen = set()
+        for kind, entity_id, value in patterns:
+            key = (value or "").strip().lower()
+            if not key or (kind, key) in seen:
+                continue  # first occurrence wins (priority order)
+            seen.add((kind, key))
+            p = len(self.patterns)
+            self.patterns.append((kind, entity_id, value, len(key)))
+            state = 0
+            for ch in key:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(p)
+
+        # BFS to set failure links, merging outputs of the fail target so matching needs no extra walk
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _matches(self, text: str, kind: Optional[str]) -> List[Tuple[int, int]]:
+        """(pattern ordinal, end position) for every match in the lowercased text."""
+        t = (text or "").lower()
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        state = 0
+        found: List[Tuple[int, int]] = []
+        for i, ch in enumerate(t):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for p in out[state]:
+                if kind is None or patterns[p][0] == kind:
+                    found.append((p, i + 1))
+        return found
+
+    def _mention(self, p: int, end: int) -> Mention:
+        kind, entity_id, value, length = self.patterns[p]
+        return Mention(end - length, end, kind, entity_id, value)
+
+    def _rank(self, match: Tuple[int, int]) -> Tuple[int, int]:
+        # longer first, then pattern priority
+        return (-self.patterns[match[0]][3], match[0])
+
+    def find_all(self, text: str, kind: Optional[str] = None) -> List[Mention]:
+        """All (possibly overlapping) mentions, ordered by end position."""
+        return [self._mention(p, end) for p, end in self._matches(text, kind)]
+
+    def longest(self, text: str, kind: Optional[str] = None) -> Optional[Mention]:
+        """The longest mention in text (ties broken by pattern priority), or None."""
+        found = self._matches(text, kind)
+        return self._mention(*min(found, key=self._rank)) if found else None
+
+    def scan(self, text: str, kind: Optional[str] = None) -> List[Mention]:
+        """Non-overlapping mentions, longest preferred, returned in text order."""
+        chosen: List[Mention] = []
+        for p, end in sorted(self._matches(text, kind), key=self._rank):
+            m = self._mention(p, end)
+            if all(m.end <= c.start or m.start >= c.end for c in chosen):
+                chosen.append(m)
+        return sorted(chosen)
+
+
+class InventoryMatrix:
+    """
+    Dense stock status matrix: one uint8 cell per (branch, medication) instead of a dict
+    entry per pair. Ids are mapped to integer ordinals, statuses to codes (position in
+    `statuses`, code 0 is the "no record" status).
+
+    Single cell lookups are two dict hits and an array read, multi-branch / multi-med
+    questions are one vectorized operation over a column or a row.
+    """
+
+    def __init__(
+        self,
+        branch_ids: Iterable[str],
+        med_ids: Iterable[str],
+        items: Iterable[Tuple[str, str, str]],
+        statuses: Sequence[str],):
+        self.statuses = tuple(statuses)
+        self.status_code: Dict[str, int] = {st: i for i, st in enumerate(self.statuses)}
+        items = list(items)
+        self.branch_ids: List[str] = list(dict.fromkeys(list(branch_ids) + [b for b, _, _ in items]))
+        self.med_ids: List[str] = list(dict.fromkeys(list(med_ids) + [m for _, m, _ in items]))
+        self.branch_ord: Dict[str, int] = {b: i for i, b in enumerate(self.branch_ids)}
+        self.med_ord: Dict[str, int] = {m: i for i, m in enumerate(self.med_ids)}
+
+        self.cells = np.zeros((len(self.branch_ids), len(self.med_ids)), dtype=np.uint8)
+        for branch_id, med_id, status in items:
+            self.cells[self.branch_ord[branch_id], self.med_ord[med_id]] = self.status_code[status]
+        self._write_lock = threading.Lock()
+
+    def get(self, branch_id: str, med_id: str) -> str:
+        b = self.branch_ord.get(branch_id)
+        m = self.med_ord.get(med_id)
+        if b is None or m is None:
+            return self.statuses[0]
+        return self.statuses[self.cells[b, m]]
+
+    def _codes(self, statuses: Iterable[str]) -> np.ndarray:
+        return np.array([self.status_code[st] for st in statuses if st in self.status_code], dtype=np.uint8)
+
+    def column_mask(self, med_id: str, statuses: Iterable[str]) -> np.ndarray:
+        """Boolean mask over branch ordinals: True where med_id has one of the statuses."""
+        m = self.med_ord.get(med_id)
+        if m is None:
+            return np.zeros(len(self.branch_ids), dtype=bool)
+        return np.isin(self.cells[:, m], self._codes(statuses))
+
+    def branches_with(self, med_id: str, statuses: Iterable[str]) -> List[Tuple[str, str]]:
+        """(branch_id, status) for every branch where med_id has one of the statuses, in branch order."""
+        m = self.med_ord.get(med_id)
+        if m is None:
+            return []
+        column = self.cells[:, m]
+        hits = np.flatnonzero(self.column_mask(med_id, statuses))
+        return [(self.branch_ids[b], self.statuses[column[b]]) for b in hits]
+
+    def apply(self, updates: Iterable[Tuple[str, str, str]]) -> int:
+        """
+        Write a batch of (branch_id, med_id, status) updates, last update per cell wins.
+        Updates for unknown branches/medications or statuses are skipped; returns how many were applied.
+
+        Readers are never blocked: the shape never changes, cells are written in place with one
+        vectorized store and every single cell read is atomic. Writers are serialized.
+        """
+        b_ord, m_ord, codes = self.branch_ord, self.med_ord, self.status_code
+        width = len(self.med_ids)
+        latest: Dict[int, int] = {}  # flat cell index -> code
+        applied = 0
+        for branch_id, med_id, status in updates:
+            b = b_ord.get(branch_id)
+            m = m_ord.get(med_id)
+            code = codes.get(status)
+            if b is None or m is None or code is None:
+                continue
+            latest[b * width + m] = code
+            applied += 1
+        if latest:
+            idx = np.fromiter(latest.keys(), dtype=np.intp, count=len(latest))
+            vals = np.fromiter(latest.values(), dtype=np.uint8, count=len(latest))
+            with self._write_lock:
+                self.cells.reshape(-1)[idx] = vals
+        return applied
+
+    def row(self, branch_id: str) -> Dict[str, str]:
+        """med_id -> status for every medication with a stock record at the branch."""
+        b = self.branch_ord.get(branch_id)
+        if b is None:
+            return {}
+        row = self.cells[b]
+        return {self.med_ids[m]: self.statuses[row[m]] for m in np.flatnonzero(row)}
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class GeoGrid:
+    """
+    Uniform grid over point coordinates (lat/lon) for k-nearest queries, e.g. the closest
+    branches that have a medication in stock.
+
+    Points are projected once onto a local plane in km (equirectangular around the mean
+    latitude - well under 1% error at country scale) and bucketed in square cells.
+    A query walks rings of cells around the origin and stops once the k-th best distance
+    is closer than anything an outer ring can hold, so its cost depends on k and the local
+    density rather than on the number of points.
+
+    Queries can be restricted with a boolean mask over point ordinals; when only a few
+    points pass the mask they are ranked directly with one vectorized distance computation.
+    Points without coordinates are kept (ordinals stay aligned with the caller) but never returned.
+    """
+
+    def __init__(
+        self,
+        points: Iterable[Tuple[str, Optional[float], Optional[float]]],
+        cell_km: Optional[float] = None,
+        brute_force_max: int = 64,):
+        points = list(points)
+        self.ids: List[str] = [p[0] for p in points]
+        self.ord: Dict[str, int] = {pid: i for i, pid in enumerate(self.ids)}
+        self.brute_force_max = brute_force_max
+
+        lat = np.array([np.nan if p[1] is None else p[1] for p in points], dtype=np.float64)
+        lon = np.array([np.nan if p[2] is None else p[2] for p in points], dtype=np.float64)
+        self.located = ~(np.isnan(lat) | np.isnan(lon))
+        self._cos_lat0 = math.cos(math.radians(float(lat[self.located].mean()))) if self.located.any() else 1.0
+        self.x, self.y = self._project(lat, lon)
+        # plain float lists for the per-point loop (numpy scalar indexing is slow)
+        self._xs: List[float] = self.x.tolist()
+        self._ys: List[float] = self.y.tolist()
+
+        located = np.flatnonzero(self.located)
+        if cell_km is None:
+            # ~2 points per cell on average
+            if len(located):
+                w = float(np.ptp(self.x[located]))
+                h = float(np.ptp(self.y[located]))
+                cell_km = max(math.sqrt(max(w * h, 1.0) * 2 / len(located)), 0.5)
+            else:
+                cell_km = 1.0
+        self.cell_km = cell_km
+
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        for i in located:
+            self._cells.setdefault(self._cell(self._xs[i], self._ys[i]), []).append(int(i))
+        if self._cells:
+            cxs = [c[0] for c in self._cells]
+            cys = [c[1] for c in self._cells]
+            self._bounds = (min(cxs), max(cxs), min(cys), max(cys))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _project(self, lat, lon):
+        x = np.radians(lon) * self._cos_lat0 * EARTH_RADIUS_KM
+        y = np.radians(lat) * EARTH_RADIUS_KM
+        return x, y
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_km), math.floor(y / self.cell_km))
+
+    def _ring(self, cx: int, cy: int, r: int) -> Iterable[Tuple[int, int]]:
+        """Cells at Chebyshev distance r from (cx, cy), clipped to the occupied bounding box."""
+        bx0, bx1, by0, by1 = self._bounds
+        if r == 0:
+            yield (cx, cy)
+            return
+        x0, x1, y0, y1 = cx - r, cx + r, cy - r, cy + r
+        for x in range(max(x0, bx0), min(x1, bx1) + 1):
+            if by0 <= y0 <= by1:
+                yield (x, y0)
+            if by0 <= y1 <= by1:
+                yield (x, y1)
+        for y in range(max(y0 + 1, by0), min(y1 - 1, by1) + 1):
+            if bx0 <= x0 <= bx1:
+                yield (x0, y)
+            if bx0 <= x1 <= bx1:
+                yield (x1, y)
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int,
+        allowed: Optional[np.ndarray] = None,) -> List[Tuple[str, float]]:
+        """
+        The k closest points to (lat, lon) as [(id, distance_km)], closest first
+        (ties by ordinal). `allowed` is an optional boolean mask over point ordinals.
+        """
+        if k <= 0 or not self._cells:
+            return []
+        qx = math.radians(lon) * self._cos_lat0 * EARTH_RADIUS_KM
+        qy = math.radians(lat) * EARTH_RADIUS_KM
+
+        if allowed is not None:
+            candidates = np.flatnonzero(allowed & self.located)
+            if len(candidates) <= self.brute_force_max:
+                d = np.hypot(self.x[candidates] - qx, self.y[candidates] - qy)
+                top = np.lexsort((candidates, d))[:k]
+                return [(self.ids[candidates[j]], round(float(d[j]), 1)) for j in top]
+
+        xs, ys, cells = self._xs, self._ys, self._cells
+        cx, cy = self._cell(qx, qy)
+        bx0, bx1, by0, by1 = self._bounds
+        max_r = max(abs(cx - bx0), abs(cx - bx1), abs(cy - by0), abs(cy - by1))
+        best: List[Tuple[float, int]] = []  # max-heap of (-d2, -ordinal), size <= k
+        for r in range(max_r + 1):
+            for cell in self._ring(cx, cy, r):
+                for i in cells.get(cell, ()):
+                    if allowed is not None and not allowed[i]:
+                        continue
+                    d2 = (xs[i] - qx) ** 2 + (ys[i] - qy) ** 2
+                    item = (-d2, -i)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+            # every point outside rings 0..r is at least r cells away from the query
+            if len(best) == k and -best[0][0] <= (r * self.cell_km) ** 2:
+                break
+        return [(self.ids[-ni], round(math.sqrt(-nd2), 1)) for nd2, ni in sorted(best, reverse=True)]
@@ -0,0 +1,216 @@
+from __future__ import annotations
+import csv
+import io
+import json
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from app import config
+from app.store import CatalogStore, get_store
+
+# Inventory update ingestion: POS stock events -> batched writes to the catalog store.
+#
+# An event is one (branch_id, med_id, status) stock update, read from
+#   - JSONL: {"branch_id": "br_001", "med_id": "med_001", "status": "OUT_OF_STOCK", ...}
+#   - CSV:   header row with branch_id,med_id,status (extra columns are ignored)
+# from a local file, an http(s) URL (streamed line by line) or any iterable of lines
+# (e.g. the POST /inventory/events body in main.py).
+#
+# Events are applied in batches (one vectorized write / one transaction per batch) through
+# CatalogStore.apply_stock_updates, which never blocks readers of get_stock.
+
+StockEvent = Tuple[str, str, str]  # (branch_id, med_id, status)
+
+
+@dataclass
+class IngestStats:
+    events: int = 0          # well formed events read
+    applied: int = 0         # events written to the store
+    rejected: int = 0        # unknown branch / medication / status
+    malformed: int = 0       # lines that could not be parsed
+    batches: int = 0
+    elapsed_s: float = 0.0   # wall time of the whole run (read + parse + apply)
+    apply_s: float = 0.0     # time spent inside apply_stock_updates
+    max_apply_ms: float = 0.0
+
+    @property
+    def events_per_sec(self) -> float:
+        return self.events / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    @property
+    def mean_apply_ms(self) -> float:
+        return self.apply_s * 1000 / self.batches if self.batches else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "events": self.events,
+            "applied": self.applied,
+            "rejected": self.rejected,
+            "malformed": self.malformed,
+            "batches": self.batches,
+            "elapsed_s": round(self.elapsed_s, 4),
+            "events_per_sec": round(self.events_per_sec, 1),
+            "mean_apply_ms": round(self.mean_apply_ms, 3),
+            "max_apply_ms": round(self.max_apply_ms, 3),
+        }
+
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[Optional[StockEvent]]:
+    """One event per JSON line, None for a malformed line (blank lines are skipped)."""
+    loads = json.loads
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            d = loads(line)
+            yield (d["branch_id"], d["med_id"], d["status"])
+        except (ValueError, KeyError, TypeError):
+            yield None
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Optional[StockEvent]]:
+    """CSV with a header row naming branch_id, med_id and status; None for a short row."""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        return
+    cols = [c.strip().lower() for c in header]
+    try:
+        b, m, s = cols.index("branch_id"), cols.index("med_id"), cols.index("status")
+    except ValueError:
+        raise ValueError("CSV header must contain branch_id, med_id and status columns")
+    need = max(b, m, s)
+    for row in reader:
+        if not row:
+            continue
+        if len(row) <= need:
+            yield None
+            continue
+        yield (row[b], row[m], row[s])
+
+
+_PARSERS = {"jsonl": parse_jsonl, "csv": parse_csv}
+
+
+def _guess_format(source: str) -> str:
+    path = source.split("?", 1)[0].lower()
+    return "csv" if path.endswith(".csv") else "jsonl"
+
+
+def open_source(source: str, timeout: float = 30.0) -> Iterator[str]:
+    """Lines of a local file or an http(s) URL, streamed (the source is never loaded whole)."""
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source, timeout=timeout) as resp:
+            for raw in io.TextIOWrapper(resp, encoding="utf-8", newline=""):
+                yield raw
+        return
+    with open(source, encoding="utf-8", newline="") as f:
+        yield from f
+
+
+class InventoryIngestor:
+    """
+    Applies a stream of stock events to the catalog store in batches.
+
+    A batch is flushed when it reaches batch_size events, or when an event arrives and the
+    oldest pending event is older than flush_interval seconds (so a slow stream doesn't sit
+    on updates), and at the end of the stream. Cumulative metrics over all runs are kept in
+    `totals`; every run also returns its own IngestStats.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = config.INGEST_BATCH_SIZE,
+        flush_interval: float = 0.25,
+        store_provider: Callable[[], CatalogStore] = get_store,):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        # resolved per batch: after a catalog snapshot swap updates go to the new store
+        self.store_provider = store_provider
+        self.totals = IngestStats()
+        self._lock = threading.Lock()  # one writer at a time
+
+    def _flush(self, batch: List[StockEvent], stats: IngestStats) -> None:
+        t0 = time.perf_counter()
+        applied = self.store_provider().apply_stock_updates(batch)
+        dt = time.perf_counter() - t0
+        stats.applied += applied
+        stats.rejected += len(batch) - applied
+        stats.batches += 1
+        stats.apply_s += dt
+        stats.max_apply_ms = max(stats.max_apply_ms, dt * 1000)
+
+    def ingest(self, events: Iterable[Optional[StockEvent]]) -> IngestStats:
+        """Apply parsed events (None = malformed input line) and return this run's stats."""
+        stats = IngestStats()
+        start = time.perf_counter()
+        batch: List[StockEvent] = []
+        batch_started = 0.0
+        size, interval = self.batch_size, self.flush_interval
+        clock = time.perf_counter
+        with self._lock:
+            for ev in events:
+                if ev is None:
+                    stats.malformed += 1
+                    continue
+                if not batch:
+                    batch_started = clock()
+                batch.append(ev)
+                if len(batch) >= size or (interval and clock() - batch_started >= interval):
+                    stats.events += len(batch)
+                    self._flush(batch, stats)
+                    batch = []
+            if batch:
+                stats.events += len(batch)
+                self._flush(batch, stats)
+            stats.elapsed_s = time.perf_counter() - start
+            self._accumulate(stats)
+        return stats
+
+    def ingest_lines(self, lines: Iterable[str], fmt: str = "jsonl") -> IngestStats:
+        parser = _PARSERS.get(fmt)
+        if parser is None:
+            raise ValueError(f"Unknown event format: {fmt!r} (expected 'jsonl' or 'csv')")
+        return self.ingest(parser(lines))
+
+    def run(self, source: str, fmt: Optional[str] = None) -> IngestStats:
+        """Ingest a file path or http(s) URL; format from fmt or the source extension (.csv, else JSONL)."""
+        return self.ingest_lines(open_source(source), fmt or _guess_format(source))
+
+    def _accumulate(self, stats: IngestStats) -> None:
+        t = self.totals
+        t.events += stats.events
+        t.applied += stats.applied
+        t.rejected += stats.rejected
+        t.malformed += stats.malformed
+        t.batches += stats.batches
+        t.elapsed_s += stats.elapsed_s
+        t.apply_s += stats.apply_s
+        t.max_apply_ms = max(t.max_apply_ms, stats.max_apply_ms)
+
+
+_INGESTOR: Optional[InventoryIngestor] = None
+
+
+def get_ingestor() -> InventoryIngestor:
+    """Process-wide ingestor (shared metrics for the HTTP endpoint)."""
+    global _INGESTOR
+    if _INGESTOR is None:
+        _INGESTOR = InventoryIngestor()
+    return _INGESTOR
+
+
+if __name__ == "__main__":
+    # python -m app.ingest <file-or-url> [--format jsonl|csv] [--batch-size N]
+    # a separate process only shares state through the catalog file (CATALOG_BACKEND=sqlite),
+    # a running in-memory server is fed through POST /inventory/events instead
+    import argparse
+    ap = argparse.ArgumentParser(description="Apply POS stock events to the inventory store")
+    ap.add_argument("source", help="JSONL/CSV file path or http(s) URL")
+    ap.add_argument("--format", choices=sorted(_PARSERS), default=None)
+    ap.add_argument("--batch-size", type=int, default=config.INGEST_BATCH_SIZE)
+    args = ap.parse_args()
+    result = InventoryIngestor(batch_size=args.batch_size).run(args.source, args.format)
+    print(json.dumps(result.as_dict(), indent=2))
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Literal
+from typing import Literal, Optional
 
 IntentName = Literal["med_info", "small_talk","stock_check","rx_verify"] #small_talk is the fallback option
 
@@ -10,3 +10,11 @@ class IntentResult(BaseModel):
     notes: str = ""  # optional short rationale for debugging 
 
 
+
+
+class TurnParse(IntentResult):
+    """Intent + the slots mentioned in the same message (single router/extractor pass), None when absent."""
+    med_name: Optional[str] = None
+    branch_name: Optional[str] = None
+    rx_id: Optional[str] = None
+    user_id: Optional[str] = None
@@ -0,0 +1,221 @@
+from __future__ import annotations
+import json
+import math
+import os
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from app import config
+from app.intent import IntentResult
+from app.simple_detectors import detect_lang
+from app.utils import fold_text
+
+# Offline intent classifier: TF-IDF over character n-grams + a softmax (multinomial logistic
+# regression) layer, trained with NumPy. Character n-grams need no tokenizer, so Hebrew and
+# English (and typos / glued Hebrew prefixes) work the same way.
+#
+# Training data is a labeled JSONL file, one {"text": ..., "intent": ...} object per line
+# (app/intent_examples.jsonl, seeded from demo_inputs.md). The model trains in well under a
+# second, so by default it is trained on first use; `python -m app.intent_model --out <path>`
+# saves a trained model for INTENT_MODEL_PATH.
+
+NGRAM_RANGE = (2, 4)
+LABELS = ("med_info", "stock_check", "rx_verify", "small_talk")
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Counter:
+    """Character n-gram counts of the folded text, padded with spaces so word edges are features too."""
+    t = f" {fold_text(text)} "
+    lo, hi = ngram_range
+    grams: Counter = Counter()
+    for n in range(lo, hi + 1):
+        for i in range(len(t) - n + 1):
+            grams[t[i:i + n]] += 1
+    return grams
+
+
+def load_examples(path: str) -> List[Tuple[str, str]]:
+    """(text, intent) pairs from a labeled JSONL file; blank lines are skipped."""
+    out: List[Tuple[str, str]] = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            if d.get("intent") not in LABELS:
+                raise ValueError(f"{path}:{n}: unknown intent {d.get('intent')!r}")
+            out.append((d["text"], d["intent"]))
+    return out
+
+
+class IntentModel:
+    """
+    TF-IDF (sublinear tf, l2 normalized) over character n-grams + a linear softmax classifier.
+
+    Inference is a handful of dict lookups and one (k x labels) weighted sum, where k is
+    the number of distinct known n-grams in the message - tens of microseconds per message.
+    """
+
+    def __init__(self, vocab: Dict[str, int], idf: np.ndarray, weights: np.ndarray, bias: np.ndarray,
+                 labels: Sequence[str] = LABELS, ngram_range: Tuple[int, int] = NGRAM_RANGE):
+        self.vocab = vocab
+        self.idf = idf.astype(np.float32)
+        self.weights = weights.astype(np.float32)  # (vocab, labels)
+        self.bias = bias.astype(np.float32)        # (labels,)
+        self.labels = tuple(labels)
+        self.ngram_range = tuple(ngram_range)
+
+    def _features(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(vocab indices, tf-idf values) of the known n-grams of text."""
+        vocab = self.vocab
+        idx, tf = [], []
+        for gram, count in char_ngrams(text, self.ngram_range).items():
+            j = vocab.get(gram)
+            if j is not None:
+                idx.append(j)
+                tf.append(1.0 + math.log(count))
+        if not idx:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ix = np.asarray(idx, dtype=np.int64)
+        vals = np.asarray(tf, dtype=np.float32) * self.idf[ix]
+        return ix, vals / np.linalg.norm(vals)
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        ix, vals = self._features(text)
+        logits = self.bias + vals @ self.weights[ix] if len(ix) else self.bias.copy()
+        p = np.exp(logits - logits.max())
+        p /= p.sum()
+        return {label: float(p[i]) for i, label in enumerate(self.labels)}
+
+    def predict(self, text: str) -> IntentResult:
+        proba = self.predict_proba(text)
+        intent = max(proba, key=proba.get)
+        return IntentResult(intent=intent, confidence=round(proba[intent], 4), lang=detect_lang(text), notes="local intent model")
+
+    @classmethod
+    def train(cls, examples: Iterable[Tuple[str, str]], ngram_range: Tuple[int, int] = NGRAM_RANGE,
+              epochs: int = 400, lr: float = 2.0, l2: float = 1e-4, min_df: int = 1) -> "IntentModel":
+        """Fit the vectorizer and the softmax layer (full-batch gradient descent with momentum)."""
+        examples = list(examples)
+        if not examples:
+            raise ValueError("No training examples")
+        labels = LABELS
+        y = np.asarray([labels.index(intent) for _, intent in examples])
+        docs = [char_ngrams(text, ngram_range) for text, _ in examples]
+
+        df: Counter = Counter()
+        for d in docs:
+            df.update(d.keys())
+        vocab = {g: i for i, g in enumerate(sorted(g for g, c in df.items() if c >= min_df))}
+        n = len(docs)
+        idf = np.ones(len(vocab), dtype=np.float64)
+        for g, j in vocab.items():
+            idf[j] = math.log((1 + n) / (1 + df[g])) + 1.0  # smoothed idf
+
+        X = np.zeros((n, len(vocab)), dtype=np.float64)
+        for r, d in enumerate(docs):
+            for g, c in d.items():
+                j = vocab.get(g)
+                if j is not None:
+                    X[r, j] = (1.0 + math.log(c)) * idf[j]
+        X /= np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+        Y = np.eye(len(labels))[y]
+        W = np.zeros((len(vocab), len(labels)))
+        b = np.zeros(len(labels))
+        vW, vb = np.zeros_like(W), np.zeros_like(b)
+        for _ in range(epochs):
+            logits = X @ W + b
+            logits -= logits.max(axis=1, keepdims=True)
+            P = np.exp(logits)
+            P /= P.sum(axis=1, keepdims=True)
+            G = (P - Y) / n
+            vW = 0.9 * vW + X.T @ G + l2 * W
+            vb = 0.9 * vb + G.sum(axis=0)
+            W -= lr * vW
+            b -= lr * vb
+        return cls(vocab, idf, W, b, labels, ngram_range)
+
+    def save(self, path: str) -> None:
+        grams = sorted(self.vocab, key=self.vocab.get)
+        np.savez_compressed(
+            path, vocab=np.asarray(grams), idf=self.idf, weights=self.weights, bias=self.bias,
+            labels=np.asarray(self.labels), ngram_range=np.asarray(self.ngram_range),)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with np.load(path, allow_pickle=False) as z:
+            vocab = {str(g): i for i, g in enumerate(z["vocab"])}
+            return cls(vocab, z["idf"], z["weights"], z["bias"], [str(x) for x in z["labels"]], tuple(int(x) for x in z["ngram_range"]))
+
+
+_MODEL: Optional[IntentModel] = None
+_MODEL_LOCK = threading.Lock()
+
+
+def get_intent_model() -> IntentModel:
+    """Process-wide model: loaded from INTENT_MODEL_PATH if that file exists, else trained from INTENT_MODEL_DATA."""
+    global _MODEL
+    if _MODEL is None:
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                path = config.INTENT_MODEL_PATH
+                if path and os.path.exists(path):
+                    _MODEL = IntentModel.load(path)
+                else:
+                    _MODEL = IntentModel.train(load_examples(config.INTENT_MODEL_DATA))
+    return _MODEL
+
+
+def detect_intent_local(text: str) -> IntentResult:
+    """
+    Tool Name: detect_intent_local
+    Classify the user's latest message into a single supported intent with the in-process
+    intent model (no network call).
+
+    Purpose:
+        Drop-in replacement for ``detect_intent_llm`` in the "local" routing modes, removing
+        the router's per-turn LLM round trip.
+
+    Parameters:
+        text (str): The user's latest message.
+
+    Returns:
+        IntentResult: intent with the highest probability, its probability as confidence,
+        lang from ``detect_lang`` and notes="local intent model".
+
+    Error Handling:
+        Training data errors (missing file, unknown intent label) raise on first use.
+
+    Fallback Behavior:
+        In the "local_then_llm_on_low_confidence" mode the orchestrator calls
+        ``detect_intent_llm`` when confidence is below INTENT_LOCAL_MIN_CONFIDENCE.
+    """
+    return get_intent_model().predict(text)
+
+
+if __name__ == "__main__":
+    # python -m app.intent_model [--data examples.jsonl] [--out model.npz]
+    # prints leave-one-out accuracy on the labeled examples and the mean inference time
+    import argparse
+    import time
+    ap = argparse.ArgumentParser(description="Train the local intent model")
+    ap.add_argument("--data", default=config.INTENT_MODEL_DATA)
+    ap.add_argument("--out", default=None, help="save the trained model (.npz) for INTENT_MODEL_PATH")
+    args = ap.parse_args()
+
+    examples = load_examples(args.data)
+    correct = 0
+    for i, (text, intent) in enumerate(examples):
+        held_out = IntentModel.train(examples[:i] + examples[i + 1:])
+        correct += held_out.predict(text).intent == intent
+    model = IntentModel.train(examples)
+    t0 = time.perf_counter()
+    for text, _ in examples:
+        model.predict(text)
+    per_msg_us = (time.perf_counter() - t0) / len(examples) * 1e6
+    print(json.dumps({"examples": len(examples), "vocab": len(model.vocab), "loo_accuracy": round(correct / len(examples), 4),
+                      "predict_us": round(per_msg_us, 1)}, indent=2))
+    if args.out:
+        model.save(args.out)
@@ -1,14 +1,41 @@
-import os
-from openai import OpenAI
+from app import cassette, config
+from app.cache import DiskLRUCache, LRUCache
+from app.render_templates import med_info_text, rx_verify_text, stock_availability_text, stock_check_text
+from app.speculative import SpeculativeExecutor
+from app.llm_client import get_async_client, get_client
 from dotenv import load_dotenv
-from typing import Iterator
-from app.intent import IntentResult
+from typing import AsyncIterator, Callable, Iterator
+from app.intent import IntentResult, TurnParse
+import hashlib
 import json
 import re
+import threading
 
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# one shared, pooled client per process (llm_client.py) + its async twin for the async orchestrator
+client = get_client()
+aclient = get_async_client()
+
+
+# every model call goes through the cassette (cassette.py): recorded / replayed when LLM_CASSETTE_MODE is set
+def _usage(resp) -> dict | None:
+    return resp.usage.model_dump() if getattr(resp, "usage", None) is not None else None
+
+
+def _complete(fn: str, request: dict) -> str:
+    def call():
+        resp = client.responses.create(**request)
+        return resp.output_text, _usage(resp)
+    return cassette.complete(fn, request, call)
+
+
+async def _acomplete(fn: str, request: dict) -> str:
+    async def call():
+        resp = await aclient.responses.create(**request)
+        return resp.output_text, _usage(resp)
+    return await cassette.acomplete(fn, request, call)
+
 
 _JSON_OBJ_RE = re.compile(r"\{.*\}", re.DOTALL)
 
@@ -22,6 +49,17 @@ def _extract_json_object(text: str) -> str:
     return m.group(0)
 
 
+# intent contract shared by the router prompts (detect_intent_llm / route_and_extract_llm)
+_ROUTER_INTENTS = (
+    "Allowed intents:\n"
+    "- med_info: the user asks about a medication name or information such as dosage, usage instructions, prescription requirements and active ingredients. AVOID confusing when user asks for a medical advice or guidance unrelated to specific medicines.\n"
+    "- stock_check: the user asks if a medication is available or in stock in a branch/city/store.\n"
+    "- rx_verify: the user asks to verify his prescription or get a list of his prescriptions. Avoid confusing when user asks to confirm medication prescription requirements for a medicine.\n"
+    "- small_talk: greetings, thanks, 'what can you do', casual chit-chat, any message that is not related to specific medicines, including sales, encouragments or a behavior that is unsafe for the customer or that is out of the scope of a Pharmacist Assistant chatbot or that is not covered by the aforementioned intents.\n"
+    "Language:\n"
+    "- lang must be 'he' if the user wrote in Hebrew letters, else 'en'.\n\n"
+)
+
 def detect_intent_llm(text: str) -> IntentResult:
     """
     Tool Name: detect_intent_llm
@@ -81,7 +119,7 @@ def detect_intent_llm(text: str) -> IntentResult:
 
     Implementation Details:
         - Calls `client.responses.create(...)` with model="gpt-5" and minimal
-          reasoning effort.
+          reasoning effort (through `_complete`: recorded / replayed by the LLM cassette).
         - The model is instructed to output ONLY valid JSON matching the
           documented schema.
         - The function extracts the first JSON object from the raw model
@@ -105,21 +143,21 @@ def detect_intent_llm(text: str) -> IntentResult:
         - No straight fallback behavior implemented in current scope -  confidence could be used to prevent 
         wrong detection in the future.
     """
-    resp = client.responses.create(
+    return _parse_intent(_complete("detect_intent_llm", _intent_request(text)))
+
+
+def _intent_request(text: str) -> dict:
+    # responses.create kwargs of the intent router, shared by the sync and async clients
+    return dict(
         model="gpt-5",
         reasoning={"effort": "minimal"},
         max_output_tokens=120,
+        timeout=config.LLM_ROUTER_TIMEOUT,
         input=(
             "You are an intent router for a Pharmacist Assistant.\n"
             "Your goal is to return a JSON which classifies user's intent."
             "Return ONLY a valid JSON and nothing else.\n\n"
-            "Allowed intents:\n"
-            "- med_info: the user asks about a medication name or information such as dosage, usage instructions, prescription requirements and active ingredients. AVOID confusing when user asks for a medical advice or guidance unrelated to specific medicines.\n"
-            "- stock_check: the user asks if a medication is available or in stock in a branch/city/store.\n"
-            "- rx_verify: the user asks to verify his prescription or get a list of his prescriptions. Avoid confusing when user asks to confirm medication prescription requirements for a medicine.\n"
-            "- small_talk: greetings, thanks, 'what can you do', casual chit-chat, any message that is not related to specific medicines, including sales, encouragments or a behavior that is unsafe for the customer or that is out of the scope of a Pharmacist Assistant chatbot or that is not covered by the aforementioned intents.\n"
-            "Language:\n"
-            "- lang must be 'he' if the user wrote in Hebrew letters, else 'en'.\n\n"
+            + _ROUTER_INTENTS +
             "JSON schema:\n"
             "{\n"
             '  "intent": "med_info|small_talk|rx_verify|stock_check",\n'
@@ -129,14 +167,93 @@ def detect_intent_llm(text: str) -> IntentResult:
             "}\n\n"
             f"User message:\n{text}"
         ),)
-    
-    raw = resp.output_text or ""
-    json_str = _extract_json_object(raw)
-    data = json.loads(json_str)
 
+
+def _parse_intent(raw: str | None) -> IntentResult:
+    json_str = _extract_json_object(raw or "")
+    data = json.loads(json_str)
     # Validate using Pydantic
     return IntentResult.model_validate(data)
 
+
+async def detect_intent_llm_async(text: str) -> IntentResult:
+    """``detect_intent_llm`` on the async client (same prompt, parsing and errors)."""
+    return _parse_intent(await _acomplete("detect_intent_llm", _intent_request(text)))
+
+
+def route_and_extract_llm(text: str) -> TurnParse:
+    """
+    Tool Name: route_and_extract_llm
+    Classify the user's latest message (same contract as ``detect_intent_llm``) and extract the
+    slots the flows need from it, in a single LLM call.
+
+    Purpose:
+        A typical "is Advil in stock in Tel Aviv?" turn otherwise makes two sequential LLM calls
+        before any tool runs (router, then ``extract_med_name`` inside the flow). The orchestrator
+        pre-fills ``flow.slots`` from this payload so the flows skip their own extraction call.
+
+    Parameters:
+        text (str):
+            The user's latest message.
+
+    Returns:
+        TurnParse:
+            IntentResult fields (intent, confidence, lang, notes) plus
+            - med_name (str | None): medicine name exactly as written (typos kept, the lookup tool resolves them)
+            - branch_name (str | None): branch / city as written
+            - rx_id (str | None): prescription id such as RX-10001
+            - user_id (str | None): user id such as user_009
+
+    Error Handling:
+        Same as ``detect_intent_llm``: raises when the model output has no valid JSON object or
+        fails Pydantic validation.
+
+    Fallback Behavior:
+        Slots that are missing or null are extracted by the flows as before.
+    """
+    return _parse_turn(_complete("route_and_extract_llm", _route_extract_request(text)))
+
+
+def _route_extract_request(text: str) -> dict:
+    return dict(
+        model="gpt-5",
+        reasoning={"effort": "minimal"},
+        max_output_tokens=200,
+        timeout=config.LLM_ROUTER_TIMEOUT,
+        input=(
+            "You are an intent router and entity extractor for a Pharmacist Assistant.\n"
+            "Your goal is to return a JSON which classifies user's intent and extracts the entities mentioned in the message."
+            "Return ONLY a valid JSON and nothing else.\n\n"
+            + _ROUTER_INTENTS +
+            "Entities (null when not mentioned, never guess):\n"
+            "- med_name: the medicine name exactly as written, in the same language, DO NOT correct spelling mistakes.\n"
+            "- branch_name: the branch / city / store name exactly as written.\n"
+            "- rx_id: a prescription id such as RX-10001.\n"
+            "- user_id: a user id such as user_009.\n\n"
+            "JSON schema:\n"
+            "{\n"
+            '  "intent": "med_info|small_talk|rx_verify|stock_check",\n'
+            '  "confidence": <a float [0,1] that express your confidence in the decision>,\n'
+            '  "lang": "he|en",\n'
+            '  "notes": <a short description on why you chose this intent>,\n'
+            '  "med_name": <string or null>,\n'
+            '  "branch_name": <string or null>,\n'
+            '  "rx_id": <string or null>,\n'
+            '  "user_id": <string or null>\n'
+            "}\n\n"
+            f"User message:\n{text}"
+        ),)
+
+
+def _parse_turn(raw: str | None) -> TurnParse:
+    data = json.loads(_extract_json_object(raw or ""))
+    return TurnParse.model_validate(data)
+
+
+async def route_and_extract_llm_async(text: str) -> TurnParse:
+    """``route_and_extract_llm`` on the async client."""
+    return _parse_turn(await _acomplete("route_and_extract_llm", _route_extract_request(text)))
+
 #Not used, most basic LLM query
 def qury_llm(message: str) -> str:  #not good for streaming
     response = client.chat.completions.create(
@@ -169,7 +286,11 @@ def extract_med_name(text: str) -> str | None:
     :return: 
     :rtype: str | None
     """
-    resp = client.responses.create(
+    return _parse_med_name(_complete("extract_med_name", _extract_med_request(text)))
+
+
+def _extract_med_request(text: str) -> dict:
+    return dict(
         model="gpt-5",
         input=[
             {
@@ -181,7 +302,7 @@ def extract_med_name(text: str) -> str | None:
                     "1. Read the user's text carefully.\n"
                     "2. Identify the name of the medicine mentioned.\n"
                     "3. Return ONLY the medicine name in the same language it was written.\n"
-                    "4. You are allowed to correct a spelling mistake ONLY if you are sure that is the case.\n"
+                    "4. Return the name exactly as written, DO NOT correct spelling mistakes (the lookup tool resolves typos).\n"
                     "5. If no medicine is identified, return null.\n"
                     "\n"
                     "Examples:\n"
@@ -195,7 +316,7 @@ def extract_med_name(text: str) -> str | None:
                     "Output: אדביל\n"
                     "\n"
                     "Input: ןאדביל\n"
-                    "Output: אדביל\n"
+                    "Output: ןאדביל\n"
                 ),
             },
             {
@@ -204,19 +325,25 @@ def extract_med_name(text: str) -> str | None:
             },
         ],
         reasoning={"effort": "minimal"},
-        max_output_tokens=30,)
+        max_output_tokens=30,
+        timeout=config.LLM_ROUTER_TIMEOUT,)
 
-    out = (resp.output_text or "").strip()
+
+def _parse_med_name(raw: str | None) -> str | None:
+    out = (raw or "").strip()
     if out.upper() == "NULL" or out == "":
         return None
     return out
 
 
+async def extract_med_name_async(text: str) -> str | None:
+    """``extract_med_name`` on the async client."""
+    return _parse_med_name(await _acomplete("extract_med_name", _extract_med_request(text)))
+
 
 
-client = OpenAI()
 
-def render_text_stream(lang: str, instruction: str, facts: str) -> Iterator[str]:
+def render_text_stream(lang: str, instruction: str, facts: str, renderer: str | None = None) -> "LLMTextStream":
     """ 
     Stream a strictly factual UI response in the user's language.
     :param lang: user used language
@@ -225,8 +352,10 @@ def render_text_stream(lang: str, instruction: str, facts: str) -> Iterator[str]
     :type instruction: str
     :param facts: factual info necessary to generate llm response based on
     :type facts: str
-    :return: streamed text iterator
-    :rtype: str | None
+    :param renderer: renderer name; factual renderers pass it to use the rendered-answer cache
+    :type renderer: str | None
+    :return: streamed text iterator (sync or async, see LLMTextStream)
+    :rtype: LLMTextStream
     """
     language = "Hebrew" if lang == "he" else "English"
 
@@ -251,19 +380,195 @@ Facts:
 {facts}
 """.strip()
 
-    with client.responses.stream(
+    request = dict(
         model="gpt-5",
         input=prompt,
         reasoning={"effort": "minimal"},
         max_output_tokens=160, #limiting the model for UX and avoid hallucinations and be token efficient
-        ) as stream:
-        for event in stream:
-            if event.type == "response.output_text.delta":
-                yield event.delta
+        timeout=config.LLM_TIMEOUT,)
+    cache_key = None
+    if renderer and _RENDER_CACHE is not None:
+        # same facts + instruction (the prompt) -> same answer; the template and model are part of the hash
+        digest = hashlib.sha256(f"{request['model']}\n{prompt}".encode("utf-8")).hexdigest()
+        cache_key = (renderer, lang, digest)
+    return LLMTextStream(cache_key=cache_key, **request)
+
+
+def _make_render_cache():
+    backend = config.RENDER_CACHE_BACKEND
+    ttl = config.RENDER_CACHE_TTL or None
+    if backend in ("off", "none", "0") or config.RENDER_CACHE_SIZE <= 0:
+        return None
+    if backend == "disk":
+        return DiskLRUCache(config.RENDER_CACHE_PATH, maxsize=config.RENDER_CACHE_SIZE, ttl=ttl)
+    if backend == "memory":
+        return LRUCache(maxsize=config.RENDER_CACHE_SIZE, ttl=ttl)
+    raise ValueError(f"Unknown RENDER_CACHE_BACKEND: {backend!r} (expected 'memory', 'disk' or 'off')")
+
+
+_RENDER_CACHE = _make_render_cache()
+
+
+def render_cache_stats() -> dict:
+    return _RENDER_CACHE.stats() if _RENDER_CACHE is not None else {"backend": "off"}
+
+
+def _replay_chunks(text: str, size: int) -> Iterator[str]:
+    # cached answer replayed as a stream: ~size chars per chunk, cut after whitespace so words stay whole
+    start = 0
+    while start < len(text):
+        end = start + max(1, size)
+        if end < len(text):
+            cut = text.find(" ", end)
+            end = len(text) if cut == -1 else cut + 1
+        yield text[start:end]
+        start = end
+
+
+class LLMTextStream:
+    """
+    Lazy streamed LLM answer: nothing is sent until it is iterated.
+    Iterate it (``for``) on the sync client or (``async for``) on the async client, the request is the same.
+    With a cache_key, a cached answer is replayed in chunks instead (no request), and a fully streamed
+    answer is stored; a stream closed early (client went away) is not.
+    """
+
+    def __init__(self, cache_key: tuple | None = None, **request):
+        self.request = request
+        self.cache_key = cache_key
+        self.cache_hit = False
+        self.usage: dict | None = None  # token usage of the completed request
+
+    def _cached(self) -> str | None:
+        if self.cache_key is None:
+            return None
+        text = _RENDER_CACHE.get(self.cache_key)
+        self.cache_hit = text is not None
+        return text
+
+    def _store(self, parts: list[str]) -> None:
+        text = "".join(parts)
+        if self.cache_key is not None and text.strip():
+            _RENDER_CACHE.put(self.cache_key, text)
+
+    def __iter__(self) -> Iterator[str]:
+        cached = self._cached()
+        if cached is not None:
+            yield from _replay_chunks(cached, config.RENDER_CACHE_CHUNK_CHARS)
+            return
+        yield from self._stream()
+
+    def _stream(self) -> Iterator[str]:
+        parts = []
+        for delta in cassette.stream("render_text_stream", self.request, self._deltas, lambda: self.usage):
+            parts.append(delta)
+            yield delta
+        self._store(parts)
+
+    def _deltas(self) -> Iterator[str]:
+        with client.responses.stream(**self.request) as stream:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+            self.usage = _usage(stream.get_final_response())
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        cached = self._cached()
+        if cached is not None:
+            for chunk in _replay_chunks(cached, config.RENDER_CACHE_CHUNK_CHARS):
+                yield chunk
+            return
+        parts = []
+        async for delta in cassette.astream("render_text_stream", self.request, self._adeltas, lambda: self.usage):
+            parts.append(delta)
+            yield delta
+        self._store(parts)
+
+    async def _adeltas(self) -> AsyncIterator[str]:
+        async with aclient.responses.stream(**self.request) as stream:
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+            self.usage = _usage(await stream.get_final_response())
+
+_RENDER_MODES = ("llm", "template", "template_with_llm_polish_async")
+_FLOW_RENDER_MODES = {
+    "med_info": config.RENDER_MODE_MED_INFO,
+    "stock_check": config.RENDER_MODE_STOCK_CHECK,
+    "rx_verify": config.RENDER_MODE_RX_VERIFY,}
+for _flow, _mode in _FLOW_RENDER_MODES.items():
+    if _mode not in _RENDER_MODES:
+        raise ValueError(f"Unknown render mode for {_flow}: {_mode!r} (expected one of {', '.join(_RENDER_MODES)})")
+
+_POLISH = SpeculativeExecutor(max_inflight=config.RENDER_POLISH_MAX_INFLIGHT)
+_POLISH_PENDING: set = set()  # cache keys being polished, one background call per answer
+_POLISH_LOCK = threading.Lock()
+
+
+def _text_stream(text: str) -> Iterator[str]:
+    yield text
+
+
+def _polish_in_background(stream: "LLMTextStream") -> None:
+    # render the LLM answer off the turn, LLMTextStream stores it in the render cache when complete
+    key = stream.cache_key
+    if key is None:  # render cache off: nowhere to keep the polished answer
+        return
+    with _POLISH_LOCK:
+        if key in _POLISH_PENDING:
+            return
+        _POLISH_PENDING.add(key)
+
+    def run():
+        try:
+            for _ in stream._stream():
+                pass
+        except Exception:
+            pass  # the template answer was already sent, the next request just tries again
+        finally:
+            with _POLISH_LOCK:
+                _POLISH_PENDING.discard(key)
+
+    if _POLISH.submit(run) is None:  # over the cap
+        with _POLISH_LOCK:
+            _POLISH_PENDING.discard(key)
+
+
+def _factual_stream(flow: str, llm_stream: Callable[[], "LLMTextStream"], template: Callable[[], str]):
+    """
+    Answer stream of a factual renderer in the flow's rendering mode (RENDER_MODE_<FLOW>):
+    - "llm": the LLM renderer (through the render cache)
+    - "template": the deterministic template, no model call
+    - "template_with_llm_polish_async": the LLM answer if it is already cached, else the template,
+      while the LLM answer is rendered in the background for the next identical request
+    """
+    mode = _FLOW_RENDER_MODES.get(flow, config.RENDER_MODE)
+    if mode == "llm":
+        return llm_stream()
+    if mode == "template_with_llm_polish_async":
+        stream = llm_stream()
+        polished = _RENDER_CACHE.get(stream.cache_key) if stream.cache_key is not None else None
+        if polished is not None:
+            return _replay_chunks(polished, config.RENDER_CACHE_CHUNK_CHARS)
+        _polish_in_background(stream)
+    return _text_stream(template())
 
 #med_info renderers
 
-def render_med_info_stream(lang: str, med: dict, match_info: dict | None) -> Iterator[str]:
+def _match_fact(med: dict, match_info: dict | None) -> str | None:
+    # how the tool resolved the user's input (closest spelling / alias), shared by the factual renderers
+    if not match_info:
+        return None
+    name = med["display_name"]
+    if match_info.get("match_type") == "fuzzy":
+        return f'User input was: "{match_info.get("input") or ""}", let the user know they see {name} because it is the closest spelling match.'
+    if match_info.get("matched_kind") == "alias":
+        alias = match_info.get("matched_value") or match_info.get("input") or ""
+        return f'User input was: "{alias}", let the user know they see {name} because it matched an alias.'
+    return None
+
+
+def render_med_info_stream(lang: str, med: dict, match_info: dict | None, equivalents: list[dict] | None = None) -> Iterator[str]:
     """
     Renders medicine info facts
     
@@ -271,6 +576,8 @@ def render_med_info_stream(lang: str, med: dict, match_info: dict | None) -> Ite
     :type lang: str
     :param med: medicine info
     :type med: dict
+    :param equivalents: other products with the same active ingredient (from get_equivalents)
+    :type equivalents: list[dict] | None
     :return: streamed text iterator
     :rtype: Iterator[str]
     """
@@ -281,19 +588,20 @@ def render_med_info_stream(lang: str, med: dict, match_info: dict | None) -> Ite
         f'Prescription required: {med["rx_required"]}',
         f'Summary: {med["label_summary"]}',
     ]
-
-    # Adding alias clarification only if tool told us it was an alias hit
-    if match_info and match_info.get("matched_kind") == "alias":
-        alias = match_info.get("matched_value") or match_info.get("input") or ""
-        match_type = match_info.get("match_type") or ""
-        # Keep it purely factual: "user input matched alias"
+    if equivalents:
         facts_lines.append(
-            f'User input was: "{alias}", let him know he sees {med["display_name"]} abecause it matched an alias"'
-            # + (f' (match_type={match_type}).' if match_type else ".")
-        )
+            "Other products with the same active ingredient: " + ", ".join(e["display_name"] for e in equivalents))
+
+    # typo / alias clarification when the tool resolved the name that way
+    note = _match_fact(med, match_info)
+    if note:
+        facts_lines.append(note)
 
     facts = "\n".join(facts_lines)
-    return render_text_stream(lang, instruction, facts)
+    return _factual_stream(
+        "med_info",
+        lambda: render_text_stream(lang, instruction, facts, renderer="render_med_info_stream"),
+        lambda: med_info_text(lang, med, match_info, equivalents),)
 
 
 def render_ambiguous_stream(lang: str, options: list[str]) -> Iterator[str]:
@@ -362,9 +670,17 @@ def render_refusal_stream(lang: str, user_text: str):
 
 #stock_check renderers:
 
-def render_stock_check_stream(lang: str, med: dict, branch: dict, stock_status: str, match_info: dict | None):
+def _branch_fact(b: dict) -> str:
+    # "Haifa (IN_STOCK, 81.2 km away)" - distance only when known
+    if b.get("distance_km") is not None:
+        return f'{b["display_name"]} ({b["stock_status"]}, {b["distance_km"]} km away)'
+    return f'{b["display_name"]} ({b["stock_status"]})'
+
+def render_stock_check_stream(lang: str, med: dict, branch: dict, stock_status: str, match_info: dict | None, alternatives: list[dict] | None = None, equivalents: list[dict] | None = None):
     # med is Medication dict from tool_result["medication"]
     # branch is {"branch_id":..., "display_name":...} from get_branch_by_name
+    # alternatives (optional) are the nearest other branches with stock from find_nearest_branches_with_stock
+    # equivalents (optional) are same-ingredient products with their stock status at this branch, from get_equivalents
     instructions = (
         "You are a pharmacist assistant. Provide factual stock availability only.\n"
         "No advice, no recommendations, no dosage, no diagnosis.\n"
@@ -377,14 +693,58 @@ def render_stock_check_stream(lang: str, med: dict, branch: dict, stock_status:
         f'Oficcial medication name: {med["display_name"]}',
         f'Stock status: {stock_status}',]
 
-    if match_info and match_info.get("matched_kind") == "alias":
-        alias = match_info.get("matched_value") or match_info.get("input") or ""
+    if alternatives is not None:
+        if alternatives:
+            facts_lines.append(
+                "Available at nearby branches (closest first): "
+                + ", ".join(_branch_fact(b) for b in alternatives))
+        else:
+            facts_lines.append("Available at other branches: none")
+
+    in_stock_equivalents = [e for e in (equivalents or []) if e.get("stock_status") in ("IN_STOCK", "LOW_STOCK")]
+    if in_stock_equivalents:
         facts_lines.append(
-            f'User input was: "{alias}", let him know he sees {med["display_name"]} abecause it matched an alias"'
-        )
+            f'Same active ingredient products at {branch["display_name"]} (catalog fact, not substitution advice): '
+            + ", ".join(f'{e["display_name"]} ({e["stock_status"]})' for e in in_stock_equivalents))
+
+    note = _match_fact(med, match_info)
+    if note:
+        facts_lines.append(note)
+
+    facts = "\n".join(facts_lines)
+    return _factual_stream(
+        "stock_check",
+        lambda: render_text_stream(lang, instructions, facts, renderer="render_stock_check_stream"),
+        lambda: stock_check_text(lang, med, branch, stock_status, match_info, alternatives, equivalents),)
+
+
+def render_stock_availability_stream(lang: str, med: dict, branches: list[dict], match_info: dict | None):
+    # branches: [{branch_id, display_name, stock_status}] from find_branches_with_stock
+    instructions = (
+        "You are a pharmacist assistant. Provide factual stock availability only.\n"
+        "The user asked where the medication is available, list the branches that have it.\n"
+        "No advice, no recommendations, no dosage, no diagnosis.\n"
+        "Do not encourage purchase.\n"
+        "Point out that availability may change.\n"
+        "NEVER offer additional help or ask for details such as batch number or dosage form.\n"
+        "Keep it short.\n")
+    facts_lines = [f'Oficcial medication name: {med["display_name"]}']
+    if branches:
+        facts_lines.append(
+            "Available at branches: "
+            + ", ".join(f'{b["display_name"]} ({b["stock_status"]})' for b in branches))
+    else:
+        facts_lines.append("Available at branches: none, currently not in stock in any branch")
+
+    note = _match_fact(med, match_info)
+    if note:
+        facts_lines.append(note)
 
     facts = "\n".join(facts_lines)
-    return render_text_stream(lang, instructions, facts)  
+    return _factual_stream(
+        "stock_check",
+        lambda: render_text_stream(lang, instructions, facts, renderer="render_stock_availability_stream"),
+        lambda: stock_availability_text(lang, med, branches, match_info),)
 
 
 def render_ask_branch_stream(lang: str) -> Iterator[str]: #simple - can be replaced by the LLM - based render_text_stream
@@ -466,7 +826,10 @@ def render_rx_verify_stream(lang: str, rx: dict) -> Iterator[str]:
         f"Prescription {rx.get('rx_id')}, Status: {rx.get('rx_status')}.\n"
             f"Medication: {rx.get('med_name')}.\n"
             f"Expires on: {rx.get('expires_on')}.\n")
-    return render_text_stream(lang, instructions, facts)  
+    return _factual_stream(
+        "rx_verify",
+        lambda: render_text_stream(lang, instructions, facts, renderer="render_rx_verify_stream"),
+        lambda: rx_verify_text(lang, rx),)
 
 def render_user_rx_list_stream(lang: str, user: dict, items: list[dict]) -> Iterator[str]:
     # user: {user_id,user_name} ; items: [{rx_id, med_name, rx_status, expires_on}]
@@ -0,0 +1,211 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from app import config
+
+# the transports below must come from the HTTP package the installed openai SDK is built on:
+# httpx, or httpx2 (same API) in newer SDKs
+try:
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+else:
+    if not issubclass(DefaultHttpxClient, httpx.Client):  # httpx2 is installed, but this SDK still uses httpx
+        import httpx
+
+# One shared OpenAI client per process (plus its async twin), on a bounded keep-alive connection pool.
+#
+# - base URL (LLM_BASE_URL, e.g. the offline stub in llm_stub.py), pool limits / keep-alive / HTTP/2 / timeouts come from config (LLM_* settings)
+# - warm_up() / awarm_up() open connections ahead of the first user turn (TLS handshake paid at startup)
+# - pool_stats(): connections in use / idle and how long requests waited for a connection
+#
+# The async client's connections belong to the event loop that opened them, so awarm_up() must run
+# on the loop that serves the turns (FastAPI lifespan, Gradio page load).
+
+
+class PoolStats:
+    """Per-client request counters; connection wait = time to get a connection, minus connecting a new one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.connect_s = 0.0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.pool = None  # the transport's connection pool, for the in use / idle snapshot (see _connection_pool)
+
+    def record(self, wait_s: float, connect_s: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.wait_s += wait_s
+            self.max_wait_s = max(self.max_wait_s, wait_s)
+            if connect_s:
+                self.new_connections += 1
+                self.connect_s += connect_s
+
+    def snapshot(self) -> dict:
+        if self.pool is not None:
+            conns = list(self.pool.connections)
+            idle = sum(1 for c in conns if c.is_idle())
+            in_pool = {"connections": len(conns), "in_use": len(conns) - idle, "idle": idle}
+        else:  # pool not reachable on this httpx version, the trace based counters below still work
+            in_pool = {"connections": None, "in_use": None, "idle": None}
+        return {
+            **in_pool,
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "mean_connect_ms": round(self.connect_s * 1000 / self.new_connections, 2) if self.new_connections else 0.0,
+            "mean_wait_ms": round(self.wait_s * 1000 / self.requests, 3) if self.requests else 0.0,
+            "max_wait_ms": round(self.max_wait_s * 1000, 3),
+        }
+
+
+class _RequestTiming:
+    """Fed by the HTTP core's per-request trace events (connect_tcp / start_tls / send_request_headers)."""
+
+    def __init__(self, stats: PoolStats):
+        self.stats = stats
+        self.t0 = time.perf_counter()
+        self.connect_started: Optional[float] = None
+        self.connect_s = 0.0
+        self.done = False
+
+    def on_event(self, name: str) -> None:
+        now = time.perf_counter()
+        if name.endswith("connect_tcp.started"):
+            self.connect_started = now
+        elif name.endswith(("connect_tcp.complete", "start_tls.complete")) and self.connect_started is not None:
+            self.connect_s = now - self.connect_started
+        elif name.endswith("send_request_headers.started") and not self.done:
+            self.done = True
+            self.stats.record(max(0.0, now - self.t0 - self.connect_s), self.connect_s)
+
+
+def _connection_pool(transport: Any) -> Any:
+    # httpx has no public accessor for the transport's connection pool; _pool is there on httpx 0.2x / httpx2.
+    # Anything else (renamed attribute, other pool type) just turns the in use / idle numbers off.
+    pool = getattr(transport, "_pool", None)
+    return pool if isinstance(getattr(pool, "connections", None), list) else None
+
+
+class _StatsTransport(httpx.HTTPTransport):
+    def __init__(self, stats: PoolStats, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.stats = stats
+        stats.pool = _connection_pool(self)
+
+    def handle_request(self, request):
+        timing = _RequestTiming(self.stats)
+        request.extensions = {**request.extensions, "trace": lambda name, info: timing.on_event(name)}
+        return super().handle_request(request)
+
+
+class _AsyncStatsTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: PoolStats, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.stats = stats
+        stats.pool = _connection_pool(self)
+
+    async def handle_async_request(self, request):
+        timing = _RequestTiming(self.stats)
+
+        async def trace(name, info):
+            timing.on_event(name)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        return await super().handle_async_request(request)
+
+
+def _transport_kwargs() -> dict:
+    return dict(
+        limits=httpx.Limits(
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_MAX_KEEPALIVE,
+            keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,),
+        http2=config.LLM_HTTP2,)  # HTTP/2 needs the h2 package
+
+
+def _timeout():
+    # default per request; router / extractor / render calls also pass their own (see llm.py)
+    return httpx.Timeout(config.LLM_TIMEOUT, connect=config.LLM_CONNECT_TIMEOUT, pool=config.LLM_POOL_TIMEOUT)
+
+
+_LOCK = threading.Lock()
+_CLIENT: Optional[OpenAI] = None
+_ASYNC_CLIENT: Optional[AsyncOpenAI] = None
+SYNC_STATS = PoolStats()
+ASYNC_STATS = PoolStats()
+
+
+def get_client() -> OpenAI:
+    """The process-wide OpenAI client (created on first use)."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _LOCK:
+            if _CLIENT is None:
+                http_client = DefaultHttpxClient(transport=_StatsTransport(SYNC_STATS, **_transport_kwargs()), timeout=_timeout())
+                _CLIENT = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=config.LLM_BASE_URL, http_client=http_client)
+    return _CLIENT
+
+
+def get_async_client() -> AsyncOpenAI:
+    """The process-wide AsyncOpenAI client (created on first use)."""
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        with _LOCK:
+            if _ASYNC_CLIENT is None:
+                http_client = DefaultAsyncHttpxClient(transport=_AsyncStatsTransport(ASYNC_STATS, **_transport_kwargs()), timeout=_timeout())
+                _ASYNC_CLIENT = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=config.LLM_BASE_URL, http_client=http_client)
+    return _ASYNC_CLIENT
+
+
+def _warm_request(client):
+    # cheapest authenticated call, opens (and keeps alive) one pooled connection
+    return client.with_options(timeout=config.LLM_CONNECT_TIMEOUT * 2, max_retries=0).models.list()
+
+
+def warm_up(connections: Optional[int] = None) -> int:
+    """Open `connections` (default LLM_WARMUP_CONNECTIONS) pooled connections on the sync client; returns how many succeeded."""
+    n = config.LLM_WARMUP_CONNECTIONS if connections is None else connections
+    if n <= 0:
+        return 0
+    client = get_client()
+
+    def one(_):
+        try:
+            _warm_request(client)
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=n) as pool:  # concurrent, so each request gets its own connection
+        return sum(pool.map(one, range(n)))
+
+
+_ASYNC_WARMED = False
+
+
+async def awarm_up(connections: Optional[int] = None, once: bool = False) -> int:
+    """warm_up for the async client, on the running event loop; with once=True only the first call warms."""
+    global _ASYNC_WARMED
+    n = config.LLM_WARMUP_CONNECTIONS if connections is None else connections
+    if n <= 0 or (once and _ASYNC_WARMED):
+        return 0
+    _ASYNC_WARMED = True
+    client = get_async_client()
+
+    async def one():
+        await _warm_request(client)
+
+    results = await asyncio.gather(*[one() for _ in range(n)], return_exceptions=True)
+    return sum(1 for r in results if not isinstance(r, BaseException))
+
+
+def pool_stats() -> dict:
+    return {"sync": SYNC_STATS.snapshot(), "async": ASYNC_STATS.snapshot()}
@@ -0,0 +1,210 @@
+from __future__ import annotations
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app import config
+from app.intent_model import detect_intent_local
+from app.simple_detectors import detect_lang, extract_branch_name, extract_rx_id, extract_user_id
+from app.store import get_store
+
+# Offline stand-in for the OpenAI Responses API, for load tests and benchmarks without network or tokens.
+#
+# Serves the endpoints llm.py uses: POST /v1/responses (responses.create, and responses.stream with
+# "stream": true as server-sent events) and GET /v1/models (connection warm-up). Point the app at it with
+# LLM_BASE_URL=http://127.0.0.1:8001/v1, no other change is needed.
+#
+# Outputs are rule based, by prompt:
+# - intent router / router + slot extractor -> JSON from the local intent model + catalog mentions / id regexes
+# - med name extractor -> the catalog medication mentioned in the message, or "null"
+# - answer renderer -> a short answer listing the facts of the prompt (fixed greeting / refusal for those prompts)
+# - anything else -> a fixed sentence
+# LLM_STUB_SCRIPT (JSONL of {"match": <regex over the prompt>, "output": <text>}) overrides them, first match wins.
+#
+# Latency / failures: LLM_STUB_TTFT_MS before the first token, LLM_STUB_TOKEN_MS between tokens, both
+# scaled by a random factor in [1 - LLM_STUB_JITTER, 1 + LLM_STUB_JITTER]; LLM_STUB_ERROR_RATE of the
+# requests fail with HTTP LLM_STUB_ERROR_STATUS. Non-streamed requests wait for the full generation time.
+#
+#   python -m app.llm_stub [--host 127.0.0.1] [--port 8001]
+
+app = FastAPI(title="OpenAI stub")
+
+_RNG = random.Random(config.LLM_STUB_SEED)
+_TOKEN_RE = re.compile(r"\s*\S+|\s+")
+
+
+def _load_script(path: str) -> list[tuple[re.Pattern, str]]:
+    if not path:
+        return []
+    rules = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                d = json.loads(line)
+                rules.append((re.compile(d["match"], re.DOTALL), d["output"]))
+    return rules
+
+
+_SCRIPT = _load_script(config.LLM_STUB_SCRIPT)
+
+
+def _prompt_text(inp: Any) -> str:
+    # "input" is a string or a list of {"role", "content"} messages (content: string or text parts)
+    if isinstance(inp, str):
+        return inp
+    parts = []
+    for msg in inp or []:
+        content = msg.get("content") if isinstance(msg, dict) else None
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(p.get("text", "") for p in content if isinstance(p, dict))
+    return "\n".join(parts)
+
+
+def _user_message(inp: Any, prompt: str) -> str:
+    if isinstance(inp, list) and inp and isinstance(inp[-1], dict) and isinstance(inp[-1].get("content"), str):
+        return inp[-1]["content"]
+    _, _, tail = prompt.rpartition("User message:\n")
+    return tail
+
+
+def _med_mention(text: str) -> Optional[str]:
+    m = get_store().mentions.longest(text.lower(), kind="med")
+    return m.value if m else None
+
+
+def _route_output(text: str, slots: bool) -> str:
+    res = detect_intent_local(text)
+    out = {"intent": res.intent, "confidence": res.confidence, "lang": detect_lang(text), "notes": "stub router"}
+    if slots:
+        out.update(med_name=_med_mention(text), branch_name=extract_branch_name(text),
+                   rx_id=extract_rx_id(text), user_id=extract_user_id(text))
+    return json.dumps(out, ensure_ascii=False)
+
+
+def _render_output(prompt: str) -> str:
+    he = "reply in Hebrew" in prompt
+    if "respond politely to small talk" in prompt:
+        return ("שלום! אני יכול לעזור במידע על תרופות, מלאי בסניפים ומרשמים." if he
+                else "Hello! I can help with medication information, branch stock and prescriptions.")
+    if "Refuse to provide medical advice" in prompt:
+        return ("אני לא יכול לתת ייעוץ רפואי, מומלץ לפנות לרוקח או לרופא." if he
+                else "I can't give medical advice, please consult a pharmacist or a doctor.")
+    facts = prompt.rpartition("Facts:\n")[2].strip()
+    lines = [l.strip() for l in facts.splitlines() if l.strip()]
+    return "\n".join(["הנה המידע שמצאתי:" if he else "Here is what I found:"] + lines)
+
+
+def stub_output(body: dict) -> str:
+    """The text the stub answers a /v1/responses request with (scripted, else rule based)."""
+    inp = body.get("input")
+    prompt = _prompt_text(inp)
+    for pattern, output in _SCRIPT:
+        if pattern.search(prompt):
+            return output
+    if "intent router and entity extractor" in prompt:
+        return _route_output(_user_message(inp, prompt), slots=True)
+    if "intent router for a Pharmacist" in prompt:
+        return _route_output(_user_message(inp, prompt), slots=False)
+    if "entity extractor specializing in medicine names" in prompt:
+        return _med_mention(_user_message(inp, prompt)) or "null"
+    if "Facts:" in prompt:
+        return _render_output(prompt)
+    return "This is a response from the offline LLM stub."
+
+
+def _tokens(text: str, limit: Optional[int]) -> List[str]:
+    # word-sized pieces stand in for model tokens
+    toks = _TOKEN_RE.findall(text)
+    return toks[:limit] if limit else toks
+
+
+def _jitter(ms: float) -> float:
+    j = config.LLM_STUB_JITTER
+    return max(0.0, ms * (1 + _RNG.uniform(-j, j))) / 1000 if ms else 0.0
+
+
+def _response(resp_id: str, msg_id: str, body: dict, text: str, status: str, n_in: int, n_out: int) -> dict:
+    output = []
+    if status == "completed":
+        output = [{
+            "id": msg_id, "type": "message", "role": "assistant", "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": [], "logprobs": []}],}]
+    return {
+        "id": resp_id, "object": "response", "created_at": time.time(), "status": status,
+        "model": body.get("model", "stub"), "output": output, "parallel_tool_calls": True,
+        "tool_choice": "auto", "tools": [], "error": None, "incomplete_details": None,
+        "max_output_tokens": body.get("max_output_tokens"),
+        "usage": {
+            "input_tokens": n_in, "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": n_out, "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": n_in + n_out,} if status == "completed" else None,}
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def _stream_events(body: dict, text: str, toks: List[str], n_in: int) -> AsyncIterator[str]:
+    resp_id, msg_id = f"resp_{uuid.uuid4().hex}", f"msg_{uuid.uuid4().hex}"
+    seq = iter(range(1 << 30))
+
+    def ev(type_: str, **fields: Any) -> str:
+        return _sse({"type": type_, "sequence_number": next(seq), **fields})
+
+    yield ev("response.created", response=_response(resp_id, msg_id, body, "", "in_progress", n_in, 0))
+    await asyncio.sleep(_jitter(config.LLM_STUB_TTFT_MS))
+    item = {"id": msg_id, "type": "message", "role": "assistant", "status": "in_progress", "content": []}
+    yield ev("response.output_item.added", output_index=0, item=item)
+    yield ev("response.content_part.added", item_id=msg_id, output_index=0, content_index=0,
+             part={"type": "output_text", "text": "", "annotations": [], "logprobs": []})
+    for i, tok in enumerate(toks):
+        if i:
+            await asyncio.sleep(_jitter(config.LLM_STUB_TOKEN_MS))
+        yield ev("response.output_text.delta", item_id=msg_id, output_index=0, content_index=0, delta=tok, logprobs=[])
+    done_text = "".join(toks)
+    part = {"type": "output_text", "text": done_text, "annotations": [], "logprobs": []}
+    yield ev("response.output_text.done", item_id=msg_id, output_index=0, content_index=0, text=done_text, logprobs=[])
+    yield ev("response.content_part.done", item_id=msg_id, output_index=0, content_index=0, part=part)
+    yield ev("response.output_item.done", output_index=0, item={**item, "status": "completed", "content": [part]})
+    yield ev("response.completed", response=_response(resp_id, msg_id, body, done_text, "completed", n_in, len(toks)))
+
+
+@app.post("/v1/responses")
+async def responses(request: Request):
+    body = await request.json()
+    if config.LLM_STUB_ERROR_RATE and _RNG.random() < config.LLM_STUB_ERROR_RATE:
+        await asyncio.sleep(_jitter(config.LLM_STUB_TTFT_MS))
+        return JSONResponse(status_code=config.LLM_STUB_ERROR_STATUS, content={
+            "error": {"message": "Injected stub error", "type": "server_error", "param": None, "code": None}})
+
+    text = stub_output(body)
+    toks = _tokens(text, body.get("max_output_tokens"))
+    n_in = max(1, len(_prompt_text(body.get("input"))) // 4)  # ~4 chars per token
+    if body.get("stream"):
+        return StreamingResponse(_stream_events(body, text, toks, n_in), media_type="text/event-stream")
+
+    await asyncio.sleep(_jitter(config.LLM_STUB_TTFT_MS) + sum(_jitter(config.LLM_STUB_TOKEN_MS) for _ in toks[1:]))
+    resp_id, msg_id = f"resp_{uuid.uuid4().hex}", f"msg_{uuid.uuid4().hex}"
+    return _response(resp_id, msg_id, body, "".join(toks), "completed", n_in, len(toks))
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "gpt-5", "object": "model", "created": 0, "owned_by": "stub"}]}
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+    ap = argparse.ArgumentParser(description="Offline OpenAI Responses API stub")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8001)
+    args = ap.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,338 @@
+from __future__ import annotations
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from app.schemas import ChatMessage, ChatRequest, FlowState
+
+# Load generator: replays scripted multi-turn journeys (app/loadtest_journeys.json, from demo_inputs.md)
+# as N concurrent simulated sessions and reports throughput, TTFT / turn latency percentiles, LLM calls
+# per turn and errors (console table + JSON report).
+#
+# Each session carries its FlowState and history between turns like the Gradio client does.
+# Targets:
+# - "async": handle_turn_async, all sessions on one event loop (how the UI / API serve turns)
+# - "sync": handle_turn, one thread per concurrent session
+# - "http": POST <url>/agent/stream of a running FastAPI app (uvicorn app.main:app)
+#
+# Without network / tokens, run it against the offline stub (python -m app.llm_stub, LLM_BASE_URL=...).
+#
+#   python -m app.loadtest --concurrency 50 --sessions 500 [--target async|sync|http] [--url ...] [--out report.json]
+
+DEFAULT_JOURNEYS = os.path.join(os.path.dirname(__file__), "loadtest_journeys.json")
+
+
+@dataclass
+class TurnResult:
+    journey: str
+    turn: int
+    ttft_s: Optional[float]  # first non-empty delta, None when the turn produced no text
+    latency_s: float
+    error: Optional[str] = None
+
+
+@dataclass
+class Journey:
+    name: str
+    flow: str
+    turns: List[str]
+
+
+def load_journeys(path: str = DEFAULT_JOURNEYS) -> List[Journey]:
+    with open(path, encoding="utf-8") as f:
+        return [Journey(d["name"], d.get("flow", ""), list(d["turns"])) for d in json.load(f)]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile (p in 0..100), None for no values."""
+    if not values:
+        return None
+    s = sorted(values)
+    k = max(0, min(len(s) - 1, math.ceil(p / 100 * len(s)) - 1))
+    return s[k]
+
+
+@dataclass
+class Session:
+    """Client side state of one conversation, like the Gradio client keeps it."""
+    journey: Journey
+    flow: FlowState = field(default_factory=FlowState)
+    history: List[ChatMessage] = field(default_factory=list)
+
+    def request(self, message: str) -> ChatRequest:
+        return ChatRequest(message=message, history=list(self.history), flow=self.flow)
+
+
+# --- targets: one turn each, returning (ttft, latency) and updating the session ---
+
+def _sync_turn(session: Session, message: str) -> Tuple[Optional[float], float]:
+    from app.orchestrator import handle_turn
+    t0 = time.perf_counter()
+    ttft, last = None, None
+    for delta, partial in handle_turn(session.request(message)):
+        if ttft is None and delta.strip():
+            ttft = time.perf_counter() - t0
+        last = partial
+    if last is not None:
+        session.flow, session.history = last.flow, last.history
+    return ttft, time.perf_counter() - t0
+
+
+async def _async_turn(session: Session, message: str) -> Tuple[Optional[float], float]:
+    from app.orchestrator_async import handle_turn_async
+    t0 = time.perf_counter()
+    ttft, last = None, None
+    async for delta, partial in handle_turn_async(session.request(message)):
+        if ttft is None and delta.strip():
+            ttft = time.perf_counter() - t0
+        last = partial
+    if last is not None:
+        session.flow, session.history = last.flow, last.history
+    return ttft, time.perf_counter() - t0
+
+
+async def _http_turn(client, url: str, session: Session, message: str) -> Tuple[Optional[float], float]:
+    t0 = time.perf_counter()
+    ttft, final = None, None
+    req = session.request(message)
+    async with client.stream("POST", f"{url}/agent/stream", json=req.model_dump()) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            if "delta" in d:
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+            else:
+                final = d
+    if final is None:
+        raise RuntimeError("stream ended without a final line")
+    # the endpoint returns the flow, the client keeps the history itself
+    session.flow = FlowState(**final["flow"])
+    session.history = req.history + [ChatMessage(role="user", content=message), ChatMessage(role="assistant", content=final["answer"])]
+    return ttft, time.perf_counter() - t0
+
+
+def _llm_requests(target: str, url: Optional[str], client=None) -> Optional[int]:
+    # LLM requests sent so far, from the shared client's pool stats (server side for http)
+    if target == "http":
+        try:
+            stats = client.get(f"{url}/llm/pool/stats").json()
+        except Exception:
+            return None
+    else:
+        from app.llm_client import pool_stats
+        stats = pool_stats()
+    return stats["sync"]["requests"] + stats["async"]["requests"]
+
+
+# --- runners ---
+
+def _record(results: List[TurnResult], journey: Journey, i: int, t0: float, outcome: Any) -> bool:
+    if isinstance(outcome, BaseException):
+        results.append(TurnResult(journey.name, i, None, time.perf_counter() - t0, f"{type(outcome).__name__}: {outcome}"[:200]))
+        return False
+    ttft, latency = outcome
+    results.append(TurnResult(journey.name, i, ttft, latency))
+    return True
+
+
+async def _run_async(journeys: List[Journey], concurrency: int, sessions: int, think_s: float,
+                     target: str, url: Optional[str]) -> List[TurnResult]:
+    results: List[TurnResult] = []
+    next_session = iter(range(sessions))
+    client = None
+    if target == "http":
+        from app.llm_client import httpx
+        client = httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency))
+
+    async def worker():
+        for n in next_session:  # shared iterator: each worker takes the next session number
+            session = Session(journeys[n % len(journeys)])
+            for i, message in enumerate(session.journey.turns):
+                t0 = time.perf_counter()
+                try:
+                    outcome = await (_http_turn(client, url, session, message) if target == "http" else _async_turn(session, message))
+                except Exception as e:
+                    outcome = e
+                if not _record(results, session.journey, i, t0, outcome):
+                    break  # the rest of the journey depends on this turn
+                if think_s:
+                    await asyncio.sleep(think_s)
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    finally:
+        if client is not None:
+            await client.aclose()
+    return results
+
+
+def _run_sync(journeys: List[Journey], concurrency: int, sessions: int, think_s: float) -> List[TurnResult]:
+    results: List[TurnResult] = []
+    lock = threading.Lock()
+    counter = iter(range(sessions))
+
+    def worker():
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            session = Session(journeys[n % len(journeys)])
+            for i, message in enumerate(session.journey.turns):
+                t0 = time.perf_counter()
+                try:
+                    outcome = _sync_turn(session, message)
+                except Exception as e:
+                    outcome = e
+                with lock:
+                    ok = _record(results, session.journey, i, t0, outcome)
+                if not ok:
+                    break
+                if think_s:
+                    time.sleep(think_s)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for f in [pool.submit(worker) for _ in range(concurrency)]:
+            f.result()
+    return results
+
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    ms = lambda v: round(v * 1000, 1) if v is not None else None
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(max(values)) if values else None,
+    }
+
+
+def build_report(results: List[TurnResult], elapsed_s: float, llm_requests: Optional[int], settings: dict) -> dict:
+    ok = [r for r in results if r.error is None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    per_journey = {}
+    for name in sorted({r.journey for r in results}):
+        rs = [r for r in ok if r.journey == name]
+        per_journey[name] = {
+            "turns": len(rs),
+            "errors": sum(1 for r in results if r.journey == name and r.error),
+            "turn_p50_ms": _summary([r.latency_s for r in rs])["p50_ms"],
+            "turn_p95_ms": _summary([r.latency_s for r in rs])["p95_ms"],}
+    return {
+        "settings": settings,
+        "elapsed_s": round(elapsed_s, 3),
+        "turns": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": round((len(results) - len(ok)) / len(results), 4) if results else 0.0,
+        "throughput_turns_per_s": round(len(ok) / elapsed_s, 2) if elapsed_s else None,
+        "llm_calls_per_turn": round(llm_requests / len(results), 3) if llm_requests is not None and results else None,
+        "ttft": _summary([r.ttft_s for r in ok if r.ttft_s is not None]),
+        "turn_latency": _summary([r.latency_s for r in ok]),
+        "journeys": per_journey,
+        "error_types": errors,
+    }
+
+
+def format_table(report: dict) -> str:
+    s = report["settings"]
+    lines = [
+        f"target={s['target']} concurrency={s['concurrency']} sessions={s['sessions']} elapsed={report['elapsed_s']}s",
+        f"turns={report['turns']} errors={report['errors']} ({report['error_rate']:.2%}) "
+        f"throughput={report['throughput_turns_per_s']} turns/s llm_calls/turn={report['llm_calls_per_turn']}",
+        "",
+        f"{'metric':<14}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}   (ms)",
+    ]
+    for key in ("ttft", "turn_latency"):
+        m = report[key]
+        cells = [m[k] if m[k] is not None else "-" for k in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        lines.append(f"{key:<14}{m['count']:>8}" + "".join(f"{c:>10}" for c in cells))
+    lines += ["", f"{'journey':<36}{'turns':>7}{'errors':>8}{'p50':>10}{'p95':>10}"]
+    for name, j in report["journeys"].items():
+        p50, p95 = (j[k] if j[k] is not None else "-" for k in ("turn_p50_ms", "turn_p95_ms"))
+        lines.append(f"{name:<36}{j['turns']:>7}{j['errors']:>8}{p50:>10}{p95:>10}")
+    for err, n in list(report["error_types"].items())[:5]:
+        lines.append(f"error x{n}: {err}")
+    return "\n".join(lines)
+
+
+async def _measure_async(journeys: List[Journey], concurrency: int, sessions: int, think_s: float,
+                         target: str, url: Optional[str], stats_client) -> Tuple[List[TurnResult], float, Optional[int]]:
+    if target == "async":
+        from app.llm_client import awarm_up
+        await awarm_up(once=True)  # on this loop, the async client's connections belong to it
+    before = _llm_requests(target, url, stats_client)
+    t0 = time.perf_counter()
+    results = await _run_async(journeys, concurrency, sessions, think_s, target, url)
+    elapsed = time.perf_counter() - t0
+    after = _llm_requests(target, url, stats_client)
+    return results, elapsed, (after - before if before is not None and after is not None else None)
+
+
+def _measure_sync(journeys: List[Journey], concurrency: int, sessions: int, think_s: float) -> Tuple[List[TurnResult], float, Optional[int]]:
+    from app.llm_client import warm_up
+    warm_up()
+    before = _llm_requests("sync", None)
+    t0 = time.perf_counter()
+    results = _run_sync(journeys, concurrency, sessions, think_s)
+    elapsed = time.perf_counter() - t0
+    return results, elapsed, _llm_requests("sync", None) - before
+
+
+def run(target: str = "async", concurrency: int = 10, sessions: Optional[int] = None, think_ms: float = 0.0,
+        url: Optional[str] = None, journeys_path: str = DEFAULT_JOURNEYS) -> dict:
+    """Run the load test and return the report dict (see build_report); warm-up requests are not counted."""
+    journeys = load_journeys(journeys_path)
+    sessions = sessions or concurrency * len(journeys)
+    settings = {"target": target, "concurrency": concurrency, "sessions": sessions, "think_ms": think_ms, "url": url}
+    if target not in ("async", "sync", "http"):
+        raise ValueError(f"Unknown target: {target!r} (expected 'async', 'sync' or 'http')")
+    if target == "http" and not url:
+        raise ValueError("--url is required for the http target")
+    url = url.rstrip("/") if url else None
+
+    if target == "sync":
+        results, elapsed, llm_requests = _measure_sync(journeys, concurrency, sessions, think_ms / 1000)
+    else:
+        stats_client = None
+        if target == "http":
+            from app.llm_client import httpx
+            stats_client = httpx.Client(timeout=10)
+        try:
+            results, elapsed, llm_requests = asyncio.run(
+                _measure_async(journeys, concurrency, sessions, think_ms / 1000, target, url, stats_client))
+        finally:
+            if stats_client is not None:
+                stats_client.close()
+    return build_report(results, elapsed, llm_requests, settings)
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Replay demo journeys as concurrent sessions")
+    ap.add_argument("--target", default="async", choices=["async", "sync", "http"])
+    ap.add_argument("--url", default=None, help="FastAPI app base URL for --target http, e.g. http://127.0.0.1:8000")
+    ap.add_argument("--concurrency", type=int, default=10, help="sessions running at once")
+    ap.add_argument("--sessions", type=int, default=None, help="total sessions (default: concurrency x journeys)")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="pause between the turns of a session")
+    ap.add_argument("--journeys", default=DEFAULT_JOURNEYS)
+    ap.add_argument("--out", default=None, help="write the JSON report here")
+    args = ap.parse_args()
+
+    report = run(args.target, args.concurrency, args.sessions, args.think_ms, args.url, args.journeys)
+    print(format_table(report))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
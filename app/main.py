@@ -1,9 +1,26 @@
-from fastapi import FastAPI
+import json
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from app.llm import qury_llm
 from fastapi.responses import StreamingResponse
-from app.llm import stream_llm
+from app.llm import render_cache_stats, stream_llm
+from app.ingest import get_ingestor
+from app.schemas import ChatRequest
+from app.orchestrator_async import handle_turn_async
+from app.llm_client import awarm_up, pool_stats, warm_up
+from app import cassette
 
-app = FastAPI() #creating the web-app instance (the object that uvicorn runs)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # open pooled LLM connections before the first request (async one on uvicorn's loop, sync one for /chat)
+    await awarm_up()
+    await run_in_threadpool(warm_up)
+    yield
+
+
+app = FastAPI(lifespan=lifespan) #creating the web-app instance (the object that uvicorn runs)
 
 # with streaming enabled
 @app.post("/chat/stream")
@@ -28,3 +45,62 @@ def chat(input: dict):
     }
 
 
+# pharmacist agent turn (routing + flows), streamed as NDJSON: {"delta": ...} lines, then the final
+# {"answer", "flow", "tool_calls"} line - the client sends the flow back with its next message
+@app.post("/agent/stream")
+async def agent_stream(req: ChatRequest):
+    async def event_generator():
+        last = None
+        async for delta, partial in handle_turn_async(req):
+            last = partial
+            if delta.strip():
+                yield json.dumps({"delta": delta}, ensure_ascii=False) + "\n"
+        if last is not None:
+            yield json.dumps({"answer": last.answer, "flow": last.flow.model_dump(), "tool_calls": [tc.model_dump() for tc in last.tool_calls]}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(event_generator(), media_type="application/x-ndjson")
+
+
+# same turn without streaming
+@app.post("/agent")
+async def agent(req: ChatRequest):
+    last = None
+    async for _delta, partial in handle_turn_async(req):
+        last = partial
+    return last.model_dump(exclude={"history"}) if last is not None else {}
+
+
+# POS stock events (JSONL or CSV body), applied in batches to the inventory store
+@app.post("/inventory/events")
+async def inventory_events(request: Request, format: str = "jsonl"):
+    body = (await request.body()).decode("utf-8")
+    try:
+        # parsing + apply off the event loop, chat streams keep flowing meanwhile
+        stats = await run_in_threadpool(get_ingestor().ingest_lines, body.splitlines(), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return stats.as_dict()
+
+
+# cumulative ingestion metrics (events/sec, apply latency)
+@app.get("/inventory/ingest/stats")
+def inventory_ingest_stats():
+    return get_ingestor().totals.as_dict()
+
+
+# LLM connection pool: connections in use / idle, mean + max wait for a connection
+@app.get("/llm/pool/stats")
+def llm_pool_stats():
+    return pool_stats()
+
+
+# rendered-answer cache of the factual renderers (size, hit rate, evictions)
+@app.get("/llm/render/cache/stats")
+def llm_render_cache_stats():
+    return render_cache_stats()
+
+
+# LLM cassette (record / replay): calls written, or calls served / missed
+@app.get("/llm/cassette/stats")
+def llm_cassette_stats():
+    return cassette.stats()
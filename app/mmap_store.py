@@ -0,0 +1,539 @@
+from __future__ import annotations
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import date
+from functools import cached_property
+from typing import Dict, Iterable, List, Literal, Optional, Tuple
+import numpy as np
+from app.db import MEDICATIONS, USERS, BRANCHES, INVENTORY, PRESCRIPTIONS
+from app.db import Medication, User, Branch, InventoryItem, Prescription, InventoryStatus, RxStatus, final_rx_status
+from app.db import INVENTORY_STATUSES
+from app.indexes import AliasIndex, FuzzyIndex, GeoGrid, MentionAutomaton
+from app.store import CatalogStore, FuzzyMatch, MedMatch, NearbyStock
+from app.store import _branch_alias_map, _entity_patterns, _ingredient_key, _med_alias_entries
+from app.utils import norm_text
+
+# Memory-mapped catalog for CATALOG_BACKEND=mmap.
+#
+# The catalog and its lookup indices are written once into a flat binary file. Every worker
+# process maps the same file, so the pages are shared through the OS page cache (one physical
+# copy however many workers run), a worker starts by reading a small header, and lookups read
+# straight from the mapping without building Python objects for the whole catalog.
+#
+# File layout: 8 byte magic, uint64 header length, JSON header, then 64-byte aligned sections.
+# Each section is a flat array (struct format char + length):
+#   - strings: one UTF-8 blob + offsets, everything else references strings by ordinal
+#   - tables: one array per column (medications, users, branches, prescriptions, alias entries)
+#   - hash indices: sorted 64-bit key hashes + row ordinals, binary searched (hits are
+#     verified against the stored string, so hash collisions are harmless)
+#   - med alias n-gram postings (same as AliasIndex): sorted gram hashes + CSR offsets
+#   - inventory: the uint8 (branch x medication) status matrix, mapped writable and shared,
+#     so stock updates applied by one worker are seen by all of them
+#
+# Creating or replacing the file happens under an exclusive flock on a sidecar "<path>.lock"
+# file, so workers starting together write it once and all map the same file. A refresh
+# (write_mmap_catalog over an existing file) carries the live inventory cells of the old file
+# over for the branches/medications both catalogs have; stock writers hold the lock shared, so
+# no update lands between that copy and the rename. A worker still mapping the replaced file
+# refuses further stock updates (they would only reach the old file) until it reopens.
+#
+# Like the SQLite backend, only the name keys for the fuzzy matcher, the mention automaton
+# and the branch coordinates grid are built in process memory, lazily.
+
+_MAGIC = b"PHCATMM1"
+_ALIGN = 64
+_RX_STATUSES: Tuple[RxStatus, ...] = ("VALID", "EXPIRED", "CANCELLED")
+_KINDS = ("canonical", "alias")
+_NGRAM = 3
+
+# struct format char -> numpy dtype for the writer
+_DTYPES = {"B": np.uint8, "I": np.uint32, "Q": np.uint64, "i": np.int32, "d": np.float64}
+
+
+def _h(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _grams(key: str) -> set:
+    return {key[j:j + n] for n in range(1, _NGRAM + 1) for j in range(len(key) - n + 1)}
+
+
+class _Writer:
+    def __init__(self):
+        self.sections: Dict[str, Tuple[str, np.ndarray]] = {}
+        self._strings: Dict[str, int] = {}
+        self._blob = bytearray()
+        self._offsets = [0]
+
+    def s(self, text: str) -> int:
+        """Intern a string, returns its ordinal."""
+        i = self._strings.get(text)
+        if i is None:
+            i = len(self._offsets) - 1
+            self._strings[text] = i
+            self._blob += text.encode("utf-8")
+            self._offsets.append(len(self._blob))
+        return i
+
+    def add(self, name: str, fmt: str, values) -> None:
+        self.sections[name] = (fmt, np.asarray(values, dtype=_DTYPES[fmt]))
+
+    def add_hash_index(self, name: str, keyed: Iterable[Tuple[str, int]]) -> None:
+        pairs = sorted((_h(key), value) for key, value in keyed)
+        self.add(f"{name}.h", "Q", [p[0] for p in pairs])
+        self.add(f"{name}.v", "I", [p[1] for p in pairs])
+
+    def write(self, path: str, meta: dict) -> None:
+        self.add("str.off", "Q", self._offsets)
+        self.add("str.blob", "B", np.frombuffer(bytes(self._blob), dtype=np.uint8))
+
+        layout = {}
+        pos = 0
+        for name, (fmt, arr) in self.sections.items():
+            layout[name] = [pos, fmt, int(arr.size)]
+            pos += -(-arr.nbytes // _ALIGN) * _ALIGN
+        digest = hashlib.sha256()
+        for name, (fmt, arr) in self.sections.items():
+            if name != "inv":  # inventory is live data, the version identifies the catalog
+                digest.update(name.encode() + arr.tobytes())
+        header = json.dumps({**meta, "version": digest.hexdigest()[:12], "sections": layout}).encode()
+        data_start = -(-(len(_MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+        # write + rename: workers mapping the previous file keep reading it until they reopen
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC + struct.pack("<Q", len(header)) + header)
+            for name, (fmt, arr) in self.sections.items():
+                f.seek(data_start + layout[name][0])
+                f.write(arr.tobytes())
+            f.truncate(data_start + pos)
+        os.replace(tmp, path)
+
+
+@contextmanager
+def _file_lock(path: str, shared: bool = False):
+    """flock on the sidecar lock file of a catalog file (exclusive unless shared)."""
+    with open(f"{path}.lock", "a+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def write_mmap_catalog(
+    path: str,
+    medications: List[Medication],
+    users: List[User],
+    branches: List[Branch],
+    inventory: List[InventoryItem],
+    prescriptions: List[Prescription],
+    keep_stock: bool = True,) -> None:
+    """
+    Serialize a catalog and its lookup indices into a flat binary file for MmapStore.
+    When the file already exists its live stock is kept (keep_stock=False resets it to inventory).
+    """
+    with _file_lock(path):
+        _write_catalog(path, medications, users, branches, inventory, prescriptions, keep_stock)
+
+
+def _write_catalog(
+    path: str,
+    medications: List[Medication],
+    users: List[User],
+    branches: List[Branch],
+    inventory: List[InventoryItem],
+    prescriptions: List[Prescription],
+    keep_stock: bool,) -> None:
+    # caller holds the exclusive file lock
+    w = _Writer()
+    s = w.s
+
+    # medications + alias entries (priority order, grouped per medication)
+    entries = _med_alias_entries(medications)
+    med_ord = {m.med_id: i for i, m in enumerate(medications)}
+    w.add("med.id", "I", [s(m.med_id) for m in medications])
+    w.add("med.name", "I", [s(m.display_name) for m in medications])
+    w.add("med.ingredient", "I", [s(m.active_ingredient) for m in medications])
+    w.add("med.rx", "B", [int(m.rx_required) for m in medications])
+    w.add("med.label", "I", [s(m.label_summary) for m in medications])
+    lo = []
+    pos = 0
+    for m in medications:
+        lo.append(pos)
+        pos += 1 + len(m.aliases)
+    w.add("med.entry_lo", "I", lo + [pos])
+    w.add("entry.med", "I", [med_ord[med_id] for med_id, _, _ in entries])
+    w.add("entry.value", "I", [s(val) for _, val, _ in entries])
+    w.add("entry.kind", "B", [_KINDS.index(kind) for _, _, kind in entries])
+    keys = [norm_text(val) for _, val, _ in entries]
+    w.add("entry.key", "I", [s(k) for k in keys])
+    w.add_hash_index("med_id", ((m.med_id, i) for i, m in enumerate(medications)))
+    w.add_hash_index("alias", ((k, i) for i, k in enumerate(keys) if k))
+    w.add_hash_index("ingredient", ((_ingredient_key(m.active_ingredient), i) for i, m in enumerate(medications)))
+
+    postings: Dict[int, List[int]] = {}
+    for i, k in enumerate(keys):
+        for g in _grams(k):
+            postings.setdefault(_h(g), []).append(i)
+    gram_h = sorted(postings)
+    off = [0]
+    post: List[int] = []
+    for gh in gram_h:
+        post.extend(sorted(postings[gh]))
+        off.append(len(post))
+    w.add("gram.h", "Q", gram_h)
+    w.add("gram.off", "I", off)
+    w.add("gram.post", "I", post)
+
+    # users
+    w.add("user.id", "I", [s(u.user_id) for u in users])
+    w.add("user.name", "I", [s(u.full_name) for u in users])
+    w.add_hash_index("user_id", ((u.user_id, i) for i, u in enumerate(users)))
+
+    # branches, their aliases as written, and the normalized alias map (dict semantics, like the other backends)
+    nan = float("nan")
+    w.add("branch.id", "I", [s(b.branch_id) for b in branches])
+    w.add("branch.name", "I", [s(b.display_name) for b in branches])
+    w.add("branch.lat", "d", [nan if b.lat is None else b.lat for b in branches])
+    w.add("branch.lon", "d", [nan if b.lon is None else b.lon for b in branches])
+    lo, raw = [], []
+    for b in branches:
+        lo.append(len(raw))
+        raw.extend(s(a) for a in b.aliases)
+    w.add("branch.alias_lo", "I", lo + [len(raw)])
+    w.add("branch.alias", "I", raw)
+    branch_ord = {b.branch_id: i for i, b in enumerate(branches)}
+    alias_map = list(_branch_alias_map(branches).items())
+    w.add("balias.key", "I", [s(k) for k, _ in alias_map])
+    w.add("balias.branch", "I", [branch_ord[br_id] for _, br_id in alias_map])
+    w.add_hash_index("branch_id", ((b.branch_id, i) for i, b in enumerate(branches)))
+    w.add_hash_index("balias", ((k, i) for i, (k, _) in enumerate(alias_map)))
+
+    # inventory matrix (catalog branches x catalog medications)
+    codes = {st: i for i, st in enumerate(INVENTORY_STATUSES)}
+    cells = np.zeros((len(branches), len(medications)), dtype=np.uint8)
+    for item in inventory:
+        b, m = branch_ord.get(item.branch_id), med_ord.get(item.med_id)
+        if b is not None and m is not None:
+            cells[b, m] = codes[item.status]
+    if keep_stock and os.path.exists(path):
+        _carry_stock(MmapStore(path), cells, branch_ord, med_ord)
+    w.add("inv", "B", cells.reshape(-1))
+
+    # prescriptions, ordered by rx_id so per-user ranges come out sorted
+    rxs = sorted(prescriptions, key=lambda p: p.rx_id)
+    w.add("rx.id", "I", [s(p.rx_id) for p in rxs])
+    w.add("rx.user", "I", [s(p.user_id) for p in rxs])
+    w.add("rx.med", "I", [s(p.med_id) for p in rxs])
+    w.add("rx.status", "B", [_RX_STATUSES.index(p.status) for p in rxs])
+    w.add("rx.expires", "i", [p.expires_on.toordinal() for p in rxs])
+    w.add_hash_index("rx_key", ((p.rx_id.upper(), i) for i, p in enumerate(rxs)))
+    w.add_hash_index("rx_user", ((p.user_id.lower(), i) for i, p in enumerate(rxs)))
+
+    w.write(path, {"format": 1, "branches": len(branches), "medications": len(medications)})
+
+
+def _carry_stock(old: "MmapStore", cells: np.ndarray, branch_ord: Dict[str, int], med_ord: Dict[str, int]) -> None:
+    """Copy the old file's live stock into the new matrix, for branches/medications in both."""
+    c = old._col
+    branches = [(i, branch_ord.get(old._str(c["branch.id"][i]))) for i in range(old._n_branches)]
+    meds = [(i, med_ord.get(old._str(c["med.id"][i]))) for i in range(old._n_meds)]
+    branches = [(i, j) for i, j in branches if j is not None]
+    meds = [(i, j) for i, j in meds if j is not None]
+    if branches and meds:
+        old_b, new_b = zip(*branches)
+        old_m, new_m = zip(*meds)
+        cells[np.ix_(new_b, new_m)] = old._inv[np.ix_(old_b, old_m)]
+
+
+class MmapStore(CatalogStore):
+    """
+    The catalog read straight from a memory-mapped snapshot file (see write_mmap_catalog).
+    Open it with MmapStore.open(path) in every worker; the mapping is shared, nothing is copied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "r+b") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE)
+            self._ino = os.fstat(f.fileno()).st_ino
+        if self._mm[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path}: not a catalog snapshot file")
+        (header_len,) = struct.unpack_from("<Q", self._mm, len(_MAGIC))
+        start = len(_MAGIC) + 8
+        header = json.loads(self._mm[start:start + header_len])
+        self.version = header["version"]
+        data_start = -(-(start + header_len) // _ALIGN) * _ALIGN
+
+        buf = memoryview(self._mm)
+        self._col: Dict[str, memoryview] = {}
+        for name, (offset, fmt, length) in header["sections"].items():
+            size = length * struct.calcsize(fmt)
+            view = buf[data_start + offset:data_start + offset + size]
+            self._col[name] = (view if name == "inv" else view.toreadonly()).cast(fmt)
+
+        self._blob = self._col["str.blob"]
+        self._str_off = self._col["str.off"]
+        self._n_branches = header["branches"]
+        self._n_meds = header["medications"]
+        # writable, shared between processes: readers see in-place stock updates immediately
+        self._inv = np.frombuffer(self._mm, dtype=np.uint8, count=self._n_branches * self._n_meds,
+                                  offset=data_start + header["sections"]["inv"][0]).reshape(self._n_branches, self._n_meds)
+        self._status_code = {st: i for i, st in enumerate(INVENTORY_STATUSES)}
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str) -> "MmapStore":
+        """Map a catalog snapshot file, writing it from the synthetic catalog on first use."""
+        if not os.path.exists(path):
+            with _file_lock(path):
+                if not os.path.exists(path):  # another worker may have written it while we waited
+                    _write_catalog(path, MEDICATIONS, USERS, BRANCHES, INVENTORY, PRESCRIPTIONS, keep_stock=False)
+        return cls(path)
+
+    # --- low level helpers ---
+
+    def _str(self, i: int) -> str:
+        off = self._str_off
+        return bytes(self._blob[off[i]:off[i + 1]]).decode("utf-8")
+
+    def _lookup(self, index: str, key: str) -> memoryview:
+        """Row ordinals stored under the key's hash (callers verify the key)."""
+        hashes = self._col[f"{index}.h"]
+        x = _h(key)
+        lo = bisect_left(hashes, x)
+        hi = bisect_right(hashes, x, lo)
+        return self._col[f"{index}.v"][lo:hi]
+
+    def _find(self, index: str, key: str, key_col: str) -> Optional[int]:
+        col = self._col[key_col]
+        for i in self._lookup(index, key):
+            if self._str(col[i]) == key:
+                return i
+        return None
+
+    def _med_ord(self, med_id: str) -> Optional[int]:
+        return self._find("med_id", med_id, "med.id")
+
+    def _branch_ord(self, branch_id: str) -> Optional[int]:
+        return self._find("branch_id", branch_id, "branch.id")
+
+    def _first_per_owner(self, ordinals: Iterable[int], limit: Optional[int] = None) -> List[MedMatch]:
+        # ordinals must be sorted (priority order) - consumed lazily, so a limit stops the verification early
+        c = self._col
+        seen = set()
+        out = []
+        for i in ordinals:
+            owner = c["entry.med"][i]
+            if owner in seen:
+                continue
+            if len(out) == limit:
+                break
+            seen.add(owner)
+            out.append((self._str(c["med.id"][owner]), self._str(c["entry.value"][i]), _KINDS[c["entry.kind"][i]]))
+        return out
+
+    # --- medications ---
+
+    def _medication(self, i: int) -> Medication:
+        c = self._col
+        lo, hi = c["med.entry_lo"][i], c["med.entry_lo"][i + 1]
+        return Medication(
+            med_id=self._str(c["med.id"][i]),
+            display_name=self._str(c["med.name"][i]),
+            aliases=[self._str(c["entry.value"][e]) for e in range(lo, hi) if c["entry.kind"][e] == 1],
+            active_ingredient=self._str(c["med.ingredient"][i]),
+            rx_required=bool(c["med.rx"][i]),
+            label_summary=self._str(c["med.label"][i]),)
+
+    def get_medication(self, med_id: str) -> Optional[Medication]:
+        i = self._med_ord(med_id)
+        return self._medication(i) if i is not None else None
+
+    def match_medications(self, q: str, match_type: Literal["exact", "contains"], limit: Optional[int] = None) -> List[MedMatch]:
+        key_col = self._col["entry.key"]
+        if match_type == "exact":
+            return self._first_per_owner(sorted(i for i in self._lookup("alias", q) if self._str(key_col[i]) == q), limit)
+        if not q:
+            return []
+        gram_h, gram_off, post = self._col["gram.h"], self._col["gram.off"], self._col["gram.post"]
+        n = min(_NGRAM, len(q))
+        shortest = None
+        for j in range(len(q) - n + 1):
+            x = _h(q[j:j + n])
+            g = bisect_left(gram_h, x)
+            if g == len(gram_h) or gram_h[g] != x:
+                return []  # a gram that appears nowhere - no key can contain q
+            rng = (gram_off[g], gram_off[g + 1])
+            if shortest is None or rng[1] - rng[0] < shortest[1] - shortest[0]:
+                shortest = rng
+        return self._first_per_owner((i for i in post[shortest[0]:shortest[1]] if q in self._str(key_col[i])), limit)
+
+    @cached_property
+    def _fuzzy_index(self) -> FuzzyIndex:
+        c = self._col
+        return FuzzyIndex(AliasIndex(
+            (self._str(c["med.id"][c["entry.med"][i]]), self._str(c["entry.value"][i]), _KINDS[c["entry.kind"][i]])
+            for i in range(len(c["entry.med"]))))
+
+    def fuzzy_medications(self, q: str) -> List[FuzzyMatch]:
+        return self._fuzzy_index.search(q)
+
+    def equivalent_medications(self, med_id: str) -> List[str]:
+        i = self._med_ord(med_id)
+        if i is None:
+            return []
+        key = _ingredient_key(self._str(self._col["med.ingredient"][i]))
+        ingr_col = self._col["med.ingredient"]
+        return [
+            self._str(self._col["med.id"][j]) for j in sorted(self._lookup("ingredient", key))
+            if j != i and _ingredient_key(self._str(ingr_col[j])) == key]
+
+    # --- users / branches ---
+
+    def get_user(self, user_id: str) -> Optional[User]:
+        i = self._find("user_id", user_id, "user.id")
+        if i is None:
+            return None
+        return User(user_id=user_id, full_name=self._str(self._col["user.name"][i]))
+
+    def _branch(self, i: int) -> Branch:
+        c = self._col
+        lat, lon = c["branch.lat"][i], c["branch.lon"][i]
+        return Branch(
+            branch_id=self._str(c["branch.id"][i]),
+            display_name=self._str(c["branch.name"][i]),
+            aliases=[self._str(a) for a in c["branch.alias"][c["branch.alias_lo"][i]:c["branch.alias_lo"][i + 1]]],
+            lat=None if lat != lat else lat,  # NaN = no coordinates
+            lon=None if lon != lon else lon,)
+
+    def get_branch(self, branch_id: str) -> Optional[Branch]:
+        i = self._branch_ord(branch_id)
+        return self._branch(i) if i is not None else None
+
+    def branch_for_alias(self, q: str) -> Optional[str]:
+        i = self._find("balias", q, "balias.key")
+        return self._str(self._col["branch.id"][self._col["balias.branch"][i]]) if i is not None else None
+
+    def branches_overlapping(self, q: str) -> List[str]:
+        c = self._col
+        out = []
+        for i in range(len(c["balias.key"])):
+            key = self._str(c["balias.key"][i])
+            if q in key or key in q:
+                out.append(self._str(c["branch.id"][c["balias.branch"][i]]))
+        return out
+
+    # --- inventory ---
+
+    def get_stock(self, branch_id: str, med_id: str) -> InventoryStatus:
+        b, m = self._branch_ord(branch_id), self._med_ord(med_id)
+        if b is None or m is None:
+            return INVENTORY_STATUSES[0]
+        return INVENTORY_STATUSES[self._inv[b, m]]
+
+    def _column_mask(self, m: int, statuses: Iterable[InventoryStatus]) -> np.ndarray:
+        codes = [self._status_code[st] for st in statuses if st in self._status_code]
+        return np.isin(self._inv[:, m], np.array(codes, dtype=np.uint8))
+
+    def branches_with_stock(self, med_id: str, statuses: Iterable[InventoryStatus]) -> List[Tuple[str, InventoryStatus]]:
+        m = self._med_ord(med_id)
+        if m is None:
+            return []
+        column = self._inv[:, m]
+        return [
+            (self._str(self._col["branch.id"][b]), INVENTORY_STATUSES[column[b]])
+            for b in np.flatnonzero(self._column_mask(m, statuses))]
+
+    @cached_property
+    def _branch_grid(self) -> GeoGrid:
+        c = self._col
+        return GeoGrid(
+            (self._str(c["branch.id"][i]), c["branch.lat"][i], c["branch.lon"][i])
+            for i in range(self._n_branches))
+
+    def nearest_branches_with_stock(
+        self, branch_id: str, med_id: str, k: int, statuses: Iterable[InventoryStatus]) -> List[NearbyStock]:
+        b, m = self._branch_ord(branch_id), self._med_ord(med_id)
+        if b is None or m is None:
+            return []
+        lat, lon = self._col["branch.lat"][b], self._col["branch.lon"][b]
+        if lat != lat or lon != lon:
+            return []
+        allowed = self._column_mask(m, statuses)
+        allowed[b] = False
+        grid = self._branch_grid
+        return [
+            (br_id, INVENTORY_STATUSES[self._inv[grid.ord[br_id], m]], dist)
+            for br_id, dist in grid.nearest(lat, lon, k, allowed)]
+
+    def stock_row(self, branch_id: str) -> Dict[str, InventoryStatus]:
+        b = self._branch_ord(branch_id)
+        if b is None:
+            return {}
+        row = self._inv[b]
+        return {self._str(self._col["med.id"][m]): INVENTORY_STATUSES[row[m]] for m in np.flatnonzero(row)}
+
+    def apply_stock_updates(self, updates: List[Tuple[str, str, InventoryStatus]]) -> int:
+        # written into the shared mapping: every worker sees the new status on its next read
+        latest: Dict[Tuple[int, int], int] = {}
+        applied = 0
+        for branch_id, med_id, status in updates:
+            b, m = self._branch_ord(branch_id), self._med_ord(med_id)
+            code = self._status_code.get(status)
+            if b is None or m is None or code is None:
+                continue
+            latest[(b, m)] = code
+            applied += 1
+        if latest:
+            rows = np.fromiter((bm[0] for bm in latest), dtype=np.intp, count=len(latest))
+            cols = np.fromiter((bm[1] for bm in latest), dtype=np.intp, count=len(latest))
+            values = np.fromiter(latest.values(), dtype=np.uint8, count=len(latest))
+            # shared file lock: a refresh can't copy the stock out from under this write
+            with self._write_lock, _file_lock(self.path, shared=True):
+                if os.stat(self.path).st_ino != self._ino:
+                    raise RuntimeError(f"{self.path} was replaced by a catalog refresh, reopen the store to apply stock updates")
+                self._inv[rows, cols] = values
+        return applied
+
+    # --- prescriptions ---
+
+    def _prescription(self, i: int) -> Prescription:
+        c = self._col
+        return Prescription(
+            rx_id=self._str(c["rx.id"][i]),
+            user_id=self._str(c["rx.user"][i]),
+            med_id=self._str(c["rx.med"][i]),
+            status=_RX_STATUSES[c["rx.status"][i]],
+            expires_on=date.fromordinal(c["rx.expires"][i]),)
+
+    def get_prescription(self, rx_id: str) -> Optional[Prescription]:
+        id_col = self._col["rx.id"]
+        for i in self._lookup("rx_key", rx_id):
+            if self._str(id_col[i]).upper() == rx_id:
+                return self._prescription(i)
+        return None
+
+    def prescriptions_for_user(self, user_id: str) -> List[Prescription]:
+        user_col = self._col["rx.user"]
+        return [
+            self._prescription(i) for i in sorted(self._lookup("rx_user", user_id))
+            if self._str(user_col[i]).lower() == user_id]
+
+    def rx_status(self, p: Prescription) -> RxStatus:
+        # the date rule is O(1) per prescription, nothing to materialize in a shared read-only file
+        return final_rx_status(p, date.today())
+
+    @cached_property
+    def mentions(self) -> MentionAutomaton:
+        branches = [self._branch(i) for i in range(self._n_branches)]
+        medications = [self._medication(i) for i in range(self._n_meds)]
+        return MentionAutomaton(_entity_patterns(branches, medications))
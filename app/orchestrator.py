@@ -1,36 +1,106 @@
-from typing import Iterator, Tuple, Optional
-from typing import Iterator, Tuple
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Generator, Iterable, Iterator, NamedTuple, Optional, Tuple
 from app.schemas import ChatRequest, ChatResponse, ChatMessage, FlowState, ToolCallRecord
-from app.llm import extract_med_name,render_user_rx_list_stream
-from app.tools import get_medication_by_name, get_stock,verify_prescription,get_prescriptions_for_user
-from app.simple_detectors import detect_lang,extract_branch_name,extract_user_id,extract_rx_id
+from app.llm import render_user_rx_list_stream
+from app.llm import extract_med_name_async, detect_intent_llm_async, route_and_extract_llm_async
+from app.tools import get_medication_by_name, get_stock,verify_prescription,get_prescriptions_for_user,find_branches_with_stock,find_nearest_branches_with_stock,get_equivalents
+from app.simple_detectors import detect_lang,extract_branch_name,extract_user_id,extract_rx_id,is_where_query,is_stock_query,is_info_query,is_rx_query
 from app.llm import extract_med_name, render_med_info_stream, render_ambiguous_stream, render_not_found_stream, render_ask_med_name_stream,render_rx_verify_stream,render_user_not_found_stream
-from app.llm import detect_intent_llm, render_small_talk_stream, render_ask_rx_or_user_stream,render_rx_not_found_stream
+from app.llm import detect_intent_llm, route_and_extract_llm, render_small_talk_stream, render_ask_rx_or_user_stream,render_rx_not_found_stream
 from app.llm import render_ask_branch_stream,render_ask_med_and_branch_stream,render_ambiguous_branch_stream,render_branch_not_found_stream
 from app.safety import is_medical_advice_request, plausible_branch_name,plausible_med_name,is_smalltalk_or_meta, plausible_rx_id,plausible_user_id
-from app.llm import render_refusal_stream, render_stock_check_stream
-from app.intent import IntentResult
+from app.llm import render_refusal_stream, render_stock_check_stream, render_stock_availability_stream
+from app.intent import IntentResult, TurnParse
+from app.intent_model import detect_intent_local
 from app.tools import get_branch_by_name
-from typing import Optional
-from app.safety import is_cancel
+from app.safety import is_cancel, is_only_smalltalk_or_meta
+from app import cassette, config
+from app.store import CatalogStore, get_store
+from app.cache import LRUCache
+from app.speculative import SpeculativeExecutor
+from app.indexes import Mention
+from app.utils import norm_text
 
 
 
-def _yield_stream(*,stream: Iterator[str],assistant: ChatMessage,history: list[ChatMessage],flow: FlowState,tool_calls: list[ToolCallRecord],) -> Iterator[Tuple[str, ChatResponse]]:
+# Turn effects: the flows below never block on the LLM themselves. Each LLM step is yielded to the
+# turn driver as an effect - handle_turn runs it on the blocking client, handle_turn_async
+# (orchestrator_async.py) awaits it on the async client - so one implementation of the flows serves both.
+class LLMCall(NamedTuple):
+    fn: Callable[..., Any]             # blocking call, used by handle_turn
+    afn: Callable[..., Awaitable[Any]] # same call on the async client, used by handle_turn_async
+    args: tuple
+
+
+class WaitFuture(NamedTuple):
+    future: Future    # speculative call running on the pool
+    default: Any = None  # result when the call failed
+
+
+class Render(NamedTuple):
+    stream: Iterable[str]  # renderer output: LLMTextStream (sync + async) or a deterministic generator
+    assistant: ChatMessage
+    history: list
+    flow: FlowState
+    tool_calls: list
+
+
+def _llm(fn: Callable[..., Any], afn: Callable[..., Awaitable[Any]], *args: Any):
+    """``result = yield from _llm(fn, fn_async, ...)`` - an LLM call run by the turn driver."""
+    return (yield LLMCall(fn, afn, args))
+
+
+def _yield_stream(*,stream: Iterator[str],assistant: ChatMessage,history: list[ChatMessage],flow: FlowState,tool_calls: list[ToolCallRecord],) -> Generator[Render, Any, None]:
     """
     Stream helper.
 
-    Consumes a text-delta iterator, appends each delta to the assistant message,
-    and yields (delta, ChatResponse) so the UI can update incrementally.
+    Hands a text-delta iterator to the turn driver, which appends each delta to the assistant
+    message and yields (delta, ChatResponse) so the UI can update incrementally.
     """
-    for delta in stream:
-        assistant.content += delta
-        partial = ChatResponse(
-            answer=assistant.content,
-            history=history,
-            flow=flow,
-            tool_calls=tool_calls, )
-        yield delta, partial
+    yield Render(stream, assistant, history, flow, tool_calls)
+
+
+def _future_result(item: WaitFuture) -> Any:
+    try:
+        return item.future.result()
+    except Exception:
+        return item.default
+
+
+def _drive(turn) -> Iterator[Tuple[str, ChatResponse]]:
+    """
+    Sync turn driver: runs the LLM effects of a turn generator on the blocking client and streams
+    its renders, passing everything else ((delta, ChatResponse) updates) through.
+    Exceptions of an LLM call are raised inside the turn, where the call was made.
+    """
+    send, exc = None, None
+    try:
+        while True:
+            try:
+                item = turn.throw(exc) if exc is not None else turn.send(send)
+            except StopIteration:
+                return
+            send, exc = None, None
+            if isinstance(item, LLMCall):
+                try:
+                    send = item.fn(*item.args)
+                except Exception as e:
+                    exc = e
+            elif isinstance(item, WaitFuture):
+                send = _future_result(item)
+            elif isinstance(item, Render):
+                for delta in item.stream:
+                    item.assistant.content += delta
+                    partial = ChatResponse(
+                        answer=item.assistant.content,
+                        history=item.history,
+                        flow=item.flow,
+                        tool_calls=item.tool_calls, )
+                    yield delta, partial
+            else:
+                yield item
+    finally:
+        turn.close()
 
 
 def _finalize_flow(flow: FlowState) -> None:
@@ -41,11 +111,209 @@ def _finalize_flow(flow: FlowState) -> None:
     flow.step = "done"
 
 
+def _extract_med_name(text: str, store: CatalogStore) -> Generator[Any, Any, tuple[Optional[str], str]]:
+    """
+    Medication name extraction with a deterministic shortcut.
+
+    A short slot-like answer that already resolves via ``get_medication_by_name``
+    (including typo tolerant fuzzy matching) is used as is, skipping the LLM extractor
+    round trip. Anything else goes to ``extract_med_name``.
+    - Used as ``yield from`` inside a turn (the LLM call is a turn effect)
+    - Returns: (extracted name or None, source) where source is "local" or "llm"
+    """
+    if plausible_med_name(text, store) and get_medication_by_name(text, store=store)["status"] == "OK":
+        return text, "local"
+    extracted = yield from _llm(extract_med_name, extract_med_name_async, text)
+    return extracted, "llm"
+
+
+# hebrew one-letter prefixes glued to the next word ("בתל אביב", "לאדביל")
+_HE_PREFIXES = "בהוכלמש"
+
+
+def _is_word_mention(text: str, m: Mention) -> bool:
+    """The automaton matches plain substrings - for routing only whole-word mentions count ("ibu" in "distribute" doesn't)."""
+    before = text[m.start - 1] if m.start > 0 else ""
+    if before and before in _HE_PREFIXES:
+        before = text[m.start - 2] if m.start > 1 else ""
+    after = text[m.end] if m.end < len(text) else ""
+    return not before.isalnum() and not after.isalnum()
+
+
+def _pre_route(text: str, store: CatalogStore) -> Optional[tuple[IntentResult, str]]:
+    """
+    Deterministic rule-based router, tried before the intent cache and the LLM.
+
+    Only decides when the message is unambiguous, anything else returns None and goes to ``detect_intent_llm``:
+    - explicit prescription / user id (RX-10001, user_009) -> rx_verify
+    - catalog medication + a branch mention or stock/where wording -> stock_check
+    - catalog medication + info wording, or a message that is just the medication name -> med_info
+    - a message that is only greetings / meta questions -> small_talk
+    - prescription wording without an id ("I want to verify my prescription") is never decided here
+    - Returns: (TurnParse with the catalog names / ids found, name of the rule that fired) or None
+    """
+    t = (text or "").strip()
+    if not t:
+        return None
+    lang = detect_lang(t)
+
+    rx_id, user_id = extract_rx_id(t), extract_user_id(t)
+    lowered = t.lower()
+    mentions = [m for m in store.mentions.scan(lowered) if _is_word_mention(lowered, m)]
+    meds = [m for m in mentions if m.kind == "med"]
+    branches = [m for m in mentions if m.kind == "branch"]
+
+    def decide(intent: str, rule: str, confidence: float = 0.95) -> tuple[TurnParse, str]:
+        # the catalog names found are passed on as slots (a single unambiguous mention only)
+        return TurnParse(
+            intent=intent, confidence=confidence, lang=lang, notes=f"rule:{rule}",
+            med_name=meds[0].value if len(meds) == 1 else None,
+            branch_name=branches[0].value if len(branches) == 1 else None,
+            rx_id=rx_id, user_id=user_id,), rule
+
+    if rx_id or user_id:
+        return decide("rx_verify", "rx_or_user_id")
+    stock_words = is_stock_query(t) or is_where_query(t)
+    info_words = is_info_query(t)
+    if is_rx_query(t) and not info_words:
+        return None  # rx_verify or not is for the router, "does Advil need a prescription" is info wording
+
+    if meds:
+        if branches or (stock_words and not info_words):
+            return decide("stock_check", "med_and_branch" if branches else "med_and_stock_wording")
+        if info_words and not stock_words:
+            return decide("med_info", "med_and_info_wording")
+        # the message is (almost) only the medication name, e.g. "Advil?" / "אקמול"
+        rest = lowered[:meds[0].start] + lowered[meds[0].end:]
+        if len(meds) == 1 and not any(ch.isalnum() for ch in rest):
+            return decide("med_info", "med_name_only", 0.9)
+        return None
+
+    if branches and stock_words:
+        return decide("stock_check", "branch_and_stock_wording", 0.9)
+
+    if not branches and is_only_smalltalk_or_meta(t):
+        return decide("small_talk", "greeting_or_meta", 0.9)
+
+    return None
+
+
+# routing results for messages seen before, keyed on the normalized message text
+_INTENT_CACHE = LRUCache(maxsize=config.INTENT_CACHE_SIZE, ttl=config.INTENT_CACHE_TTL or None)
+
+
+# speculative LLM extractor calls started next to the router, capped over all turns
+_SPECULATOR = SpeculativeExecutor(max_inflight=config.SPECULATIVE_MAX_INFLIGHT)
+
+
+def _route_speculative(text: str, tool_calls: list[ToolCallRecord], store: CatalogStore) -> Generator[Any, Any, TurnParse]:
+    """
+    Two-call routing (``detect_intent_llm`` + ``extract_med_name``) without paying for both in sequence.
+
+    The LLM med name extractor starts on the speculative pool before the router call, so the turn waits
+    for max(router, extractor) instead of their sum. The cheap deterministic extractors (branch mention,
+    rx / user id) run inline. Only the slots the chosen intent needs are kept; an extractor the intent
+    doesn't need is cancelled or its result dropped. Nothing is started for greetings / meta questions,
+    for a message that already resolves locally, or over SPECULATIVE_MAX_INFLIGHT - the flow then
+    extracts on its own as before.
+    - Returns: TurnParse (intent + pre-filled slots, see ``_prefill_slots``)
+    """
+    local_med = text if plausible_med_name(text, store) and get_medication_by_name(text, store=store)["status"] == "OK" else None
+    with _SPECULATOR.turn() as spec:
+        if not local_med and not is_smalltalk_or_meta(text):
+            spec.start("extract_med_name", extract_med_name, text)
+
+        intent_result = yield from _llm(detect_intent_llm, detect_intent_llm_async, text)
+        parsed = TurnParse(**intent_result.model_dump())
+        if parsed.intent in ("med_info", "stock_check"):
+            fut = spec.take("extract_med_name")
+            parsed.med_name = local_med or ((yield WaitFuture(fut)) if fut else None)
+        if parsed.intent == "stock_check":
+            parsed.branch_name = extract_branch_name(text, store)
+        if parsed.intent == "rx_verify":
+            parsed.rx_id, parsed.user_id = extract_rx_id(text), extract_user_id(text)
+    if spec.started:
+        tool_calls.append(ToolCallRecord(name="speculative_extract", args={"text": text}, result=spec.summary(),))
+    return parsed
+
+
+def _detect_intent(text: str, tool_calls: list[ToolCallRecord], store: CatalogStore) -> Generator[Any, Any, IntentResult]:
+    """
+    Layered intent routing: rule pre-router -> intent cache -> local intent model -> ``detect_intent_llm``.
+    The deciding layer shows in the trace: ``detect_intent(rules)`` (with the rule name),
+    ``detect_intent(cached)`` (no LLM round trip), ``detect_intent(local)`` (in-process model) or
+    ``detect_intent`` (LLM call); only LLM results with confidence >= INTENT_CACHE_MIN_CONFIDENCE are cached.
+    - INTENT_ROUTER="llm": the local model is skipped
+    - INTENT_ROUTER="local": the local model always decides, no network call
+    - INTENT_ROUTER="local_then_llm_on_low_confidence": the LLM decides when the local confidence
+      is below INTENT_LOCAL_MIN_CONFIDENCE
+    With INTENT_EXTRACT_SLOTS the LLM layer is ``route_and_extract_llm`` (intent + slots in one call),
+    otherwise ``detect_intent_llm`` with the med name extractor running next to it (``_route_speculative``).
+    """
+    if config.INTENT_PRE_ROUTER:
+        routed = _pre_route(text, store)
+        if routed is not None:
+            intent_result, rule = routed
+            tool_calls.append(ToolCallRecord(name="detect_intent(rules)", args={"text": text}, result={**intent_result.model_dump(), "layer": "rules", "rule": rule},))
+            return intent_result
+
+    key = norm_text(text)
+    cached = _INTENT_CACHE.get(key) if key else None
+    if cached is not None:
+        intent_result = cached.model_copy()
+        tool_calls.append(ToolCallRecord(name="detect_intent(cached)", args={"text": text}, result=intent_result.model_dump(),))
+        return intent_result
+
+    mode = config.INTENT_ROUTER
+    if mode in ("local", "local_then_llm_on_low_confidence"):
+        intent_result = detect_intent_local(text)
+        decided = mode == "local" or intent_result.confidence >= config.INTENT_LOCAL_MIN_CONFIDENCE
+        tool_calls.append(ToolCallRecord(name="detect_intent(local)", args={"text": text}, result={**intent_result.model_dump(), "layer": "local", "accepted": decided},))
+        if decided:
+            return intent_result
+
+    if config.INTENT_EXTRACT_SLOTS:
+        intent_result = yield from _llm(route_and_extract_llm, route_and_extract_llm_async, text)
+    else:
+        intent_result = yield from _route_speculative(text, tool_calls, store)
+    tool_calls.append(ToolCallRecord( name="detect_intent", args={"text": text}, result=intent_result.model_dump(),))
+    if key and intent_result.confidence >= config.INTENT_CACHE_MIN_CONFIDENCE:
+        _INTENT_CACHE.put(key, intent_result.model_copy())
+    return intent_result
+
+
+def _prefill_slots(flow: FlowState, parsed: IntentResult, tool_calls: list[ToolCallRecord]) -> None:
+    """
+    Copy the slots the router already extracted (``TurnParse``) into the new flow, so the flow
+    skips its own extraction call. Traced as the usual extractor steps with source="router".
+    """
+    if not isinstance(parsed, TurnParse):
+        return
+    med_name = (parsed.med_name or "").strip()
+    if flow.name in ("med_info", "stock_check") and med_name:
+        flow.slots["med_name"] = med_name
+        tool_calls.append(ToolCallRecord(name="extract_med_name", args={"text": med_name}, result={"extracted": med_name, "source": "router"},))
+        if flow.name == "med_info":
+            flow.step = "lookup"
+    branch_name = (parsed.branch_name or "").strip()
+    if flow.name == "stock_check" and branch_name:
+        flow.slots["branch_name"] = branch_name
+        tool_calls.append(ToolCallRecord(name="extract_branch_name", args={"text": branch_name}, result={"extracted": branch_name, "source": "router"},))
+    if flow.name == "rx_verify":
+        # normalized through the regex extractors, anything that doesn't look like an id is dropped
+        rx, uid = extract_rx_id(parsed.rx_id or ""), extract_user_id(parsed.user_id or "")
+        if rx:
+            flow.slots["rx_id"] = rx
+        if uid:
+            flow.slots["user_id"] = uid
+
+
 def _route_or_continue_flow(
     req: ChatRequest,
     flow: FlowState,
     lang_heuristic: str,
-    tool_calls: list[ToolCallRecord],) -> tuple[FlowState, Optional[IntentResult], str]:
+    tool_calls: list[ToolCallRecord],
+    store: CatalogStore,) -> Generator[Any, Any, tuple[FlowState, Optional[IntentResult], str]]:
     """
     Continue any active flow (stateless but client-owned state).
     Only route when there is no active flow.
@@ -58,8 +326,7 @@ def _route_or_continue_flow(
         # print(f"[DBG] continuing active flow: {flow.name} step={flow.step}") 
         return flow, None, lang_heuristic
 
-    intent_result = detect_intent_llm(req.message)
-    tool_calls.append(ToolCallRecord( name="detect_intent", args={"text": req.message}, result=intent_result.model_dump(),))
+    intent_result = yield from _detect_intent(req.message, tool_calls, store)
 
     if intent_result.intent == "med_info":
         flow = FlowState(name="med_info", step="extract_med_name", slots={}, done=False)
@@ -74,6 +341,8 @@ def _route_or_continue_flow(
     else:
         flow = FlowState(name="small_talk", step="reply", slots={}, done=False)
 
+    _prefill_slots(flow, intent_result, tool_calls)
+
     st_lang = intent_result.lang if intent_result else lang_heuristic
     return flow, intent_result, st_lang
 
@@ -85,7 +354,7 @@ def run_small_talk_flow(
     assistant: ChatMessage,
     history: list[ChatMessage],
     tool_calls: list[ToolCallRecord],
-) -> Iterator[Tuple[str, ChatResponse]]:
+) -> Iterator[Any]:
     """
     Same behavior as your current small_talk branch:
     - stream response
@@ -117,8 +386,8 @@ def run_small_talk_flow(
     return
 
 
-def run_med_info_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: ChatMessage,history: list[ChatMessage],tool_calls: list[ToolCallRecord],
-) -> Iterator[Tuple[str, ChatResponse]]:
+def run_med_info_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: ChatMessage,history: list[ChatMessage],tool_calls: list[ToolCallRecord],store: CatalogStore,
+) -> Iterator[Any]:
     """
     Tool/flow runner for the **med_info** intent.
 
@@ -143,7 +412,8 @@ def run_med_info_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: Ch
     2) ``lookup``
         - Call ``get_medication_by_name(med_name)`` and record the tool call.
         - Handle outcomes:
-            - ``OK``: stream medication facts with ``render_med_info_stream(...)`` then finalize/reset flow.
+            - ``OK``: look up same-ingredient products with ``get_equivalents(med_id)``, stream medication
+              facts with ``render_med_info_stream(...)`` then finalize/reset flow.
               If a ``match_info`` payload exists (e.g., alias match), pass it to the renderer so the
               assistant can transparently explain the match.
             - ``AMBIGUOUS``: ask the user to choose from options, clear the stored name, and go back to
@@ -178,11 +448,13 @@ def run_med_info_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: Ch
     tool_calls : list[ToolCallRecord]
         Per-turn trace list for debugging/review. Each tool invocation (extract/lookup) is appended
         here so you can render a timeline (e.g., via ``trace_markdown``).
+    store : CatalogStore
+        Catalog snapshot pinned by ``handle_turn``; all lookups of the turn go through it.
 
     Returns
     -------
-    Iterator[Tuple[str, ChatResponse]]
-        A streaming iterator yielding ``(delta_text, ChatResponse)`` tuples.
+    Iterator[Any]
+        Turn effects (see ``_turn``), which the driver turns into ``(delta_text, ChatResponse)`` tuples.
         - ``delta_text`` is the incremental chunk to append in the UI.
         - ``ChatResponse`` is the full envelope containing the current assistant answer, updated
           history, updated flow state, and the list of tool call records.
@@ -200,9 +472,9 @@ def run_med_info_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: Ch
     if flow.step == "extract_med_name":
         user_text = req.message.strip()
         awaiting = flow.slots.get("_awaiting")  # may be "med_name" or None
-        extracted = extract_med_name(user_text)
+        extracted, source = yield from _extract_med_name(user_text, store)
         tool_calls.append(
-            ToolCallRecord(name="extract_med_name",args={"text": user_text},result={"extracted": extracted},))
+            ToolCallRecord(name="extract_med_name",args={"text": user_text},result={"extracted": extracted, "source": source},))
         
         candidate = extracted.strip() if extracted else None #Only accept raw user_text as candidate if we explicitly asked for a med name
         if not candidate and awaiting == "med_name": #if no med in the message (but we are in the flow 
@@ -227,17 +499,21 @@ def run_med_info_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: Ch
 
     if flow.step == "lookup":
         med_name = (flow.slots.get("med_name") or "").strip()
-        tool_result = get_medication_by_name(med_name)
+        tool_result = get_medication_by_name(med_name, store=store)
         tool_calls.append(ToolCallRecord(name="get_medication_by_name", args={"name": med_name},result=tool_result,))
 
         if tool_result["status"] == "OK":
             med = tool_result["medication"]
             match_info = tool_result.get("match_info")
             flow.slots.pop("_awaiting", None) #waiting resolved
-            
+
+            # same-ingredient products, precomputed index lookup
+            eq_res = get_equivalents(med["med_id"], store=store)
+            tool_calls.append(ToolCallRecord(name="get_equivalents", args={"med_id": med["med_id"]}, result=eq_res,))
+
             assistant.content = ""
             yield from _yield_stream(
-                stream=render_med_info_stream(lang, med, match_info = match_info),
+                stream=render_med_info_stream(lang, med, match_info = match_info, equivalents=eq_res.get("equivalents")),
                 assistant=assistant,
                 history=history,
                 flow=flow,
@@ -296,7 +572,7 @@ def run_med_info_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: Ch
 
 
 
-def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assistant: ChatMessage, history: list[ChatMessage], tool_calls: list[ToolCallRecord],) -> Iterator[Tuple[str, ChatResponse]]:
+def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assistant: ChatMessage, history: list[ChatMessage], tool_calls: list[ToolCallRecord], store: CatalogStore,) -> Iterator[Any]:
     """
     Tool/flow runner for the **stock_check** intent.
 
@@ -314,13 +590,16 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
         Goal: ensure ``flow.slots["med_name"]`` and ``flow.slots["branch_name"]`` exist.
 
         - Medication collection:
-            - Attempt LLM extraction via ``extract_med_name(req.message)``.
+            - Attempt extraction via ``_extract_med_name(req.message)`` (deterministic lookup for
+              short answers, LLM ``extract_med_name`` otherwise).
             - If extraction fails but we explicitly asked for it
               (``flow.slots["_awaiting"] == "med_name"``), treat raw user message as the candidate.
             - On success, store ``flow.slots["med_name"]``.
 
         - Branch collection:
             - Attempt deterministic extraction via ``extract_branch_name(req.message)``.
+            - If no branch is named but the user asks where the medication is available
+              (``is_where_query``), set ``flow.slots["any_branch"]`` instead of asking for a branch.
             - If extraction fails but we explicitly asked for it
               (``flow.slots["_awaiting"] == "branch_name"``), treat raw user message as the candidate.
             - On success, store ``flow.slots["branch_name"]``.
@@ -346,7 +625,7 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
             - ``OK``: store:
                 - ``flow.slots["med"]`` (the canonical medication record)
                 - ``flow.slots["med_match_info"]`` (optional, e.g., alias match metadata)
-              then advance to ``resolve_branch``.
+              then advance to ``resolve_branch`` (or ``availability`` when ``any_branch`` is set).
 
     3) ``resolve_branch``
         Goal: resolve ``flow.slots["branch_name"]`` to a canonical branch record.
@@ -365,6 +644,9 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
 
         - Calls ``get_stock(branch_id, med_id)`` and records the tool call.
         - Extracts ``stock_status`` from the result (defaults to ``"UNKNOWN"`` if missing).
+        - If the branch is ``OUT_OF_STOCK``/``UNKNOWN``, calls ``find_nearest_branches_with_stock(branch_id, med_id)``
+          and passes the nearest branches that have it as ``alternatives`` to the renderer, plus the
+          same-ingredient products and their stock at this branch (``get_equivalents``) as ``equivalents``.
         - Streams the final answer via ``render_stock_check_stream(lang, med, branch, stock_status, match_info=...)``.
           Passes ``match_info`` (from ``med_match_info``) so the response can transparently explain
           brand/generic alias resolution if needed.
@@ -374,19 +656,27 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
             - yield state-only update (so the client sees the final flow state)
             - yield a final response with ``flow=FlowState()`` so the next turn starts with no active flow.
 
+    5) ``availability``
+        Goal: answer "where is it in stock?" in one turn when no single branch was named.
+
+        - Calls ``find_branches_with_stock(med_id)`` and records the tool call.
+        - Streams the branch list via ``render_stock_availability_stream(...)``, then finalizes and
+          resets the flow like the ``stock`` step.
+
     Parameters
     ----------
     req : ChatRequest
         Current request object holding the user's message (``req.message``) plus session metadata.
     flow : FlowState
         Mutable flow state for this multi-turn interaction. Uses:
-        - ``flow.step``: current step (``collect``, ``resolve_med``, ``resolve_branch``, ``stock``)
+        - ``flow.step``: current step (``collect``, ``resolve_med``, ``resolve_branch``, ``stock``, ``availability``)
         - ``flow.slots``: collected parameters and internal flags:
             - ``"med_name"``: user-provided or extracted medication name (pre-resolution)
             - ``"branch_name"``: user-provided or extracted branch name (pre-resolution)
             - ``"med"``: resolved medication record (post-resolution)
             - ``"branch"``: resolved branch record (post-resolution)
             - ``"med_match_info"``: optional metadata about how the medication name was matched
+            - ``"any_branch"``: set when the user asked for availability across all branches
             - ``"_awaiting"``: internal guard flag indicating what the flow asked the user for next
               (``"med_name"`` / ``"branch_name"``)
     lang : str
@@ -397,11 +687,13 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
         Conversation history, updated as the assistant streams output.
     tool_calls : list[ToolCallRecord]
         Per-turn execution trace list. Each extractor/lookup call is appended for debugging/review.
+    store : CatalogStore
+        Catalog snapshot pinned by ``handle_turn``; all lookups of the turn go through it.
 
     Returns
     -------
-    Iterator[Tuple[str, ChatResponse]]
-        Streaming iterator yielding ``(delta_text, ChatResponse)`` tuples, where:
+    Iterator[Any]
+        Turn effects (see ``_turn``), which the driver turns into ``(delta_text, ChatResponse)`` tuples, where:
         - ``delta_text`` is the incremental chunk to append in the UI
         - ``ChatResponse`` includes the current assistant answer, updated history, updated flow,
           and the list of tool call records.
@@ -412,15 +704,15 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
       medication/branch candidate when the user is responding to a direct prompt for that value.
     - This flow is meant to be factual: it reports stock availability/status but should not provide
       medical advice or treatment recommendations.
-    - If you want consistent streaming behavior across flows, consider migrating the places where you
-      manually yield from renderers (``for delta in ...``) to the shared ``_yield_stream(...)`` helper.
-      (Not required for correctness, but helps keep response envelopes uniform.)
+    - All renders go through the shared ``_yield_stream(...)`` helper, so the turn driver (sync or async)
+      does the streaming and the response envelopes stay uniform.
     """
     # Steps:
     #   - collect: ensure med_name + branch_name in slots
     #   - resolve_med: get_medication_by_name
     #   - resolve_branch: get_branch_by_name
     #   - stock: get_stock
+    #   - availability: find_branches_with_stock (no branch named, "where is it in stock?")
     #   - done
 
 
@@ -430,8 +722,8 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
         awaiting = flow.slots.get("_awaiting") # "med_name" | "branch_name" | None
         # 1) med_name
         if not flow.slots.get("med_name"):
-            extracted = extract_med_name(req.message.strip())
-            tool_calls.append(ToolCallRecord(name="extract_med_name", args={"text": req.message.strip()}, result={"extracted": extracted},))
+            extracted, source = yield from _extract_med_name(req.message.strip(), store)
+            tool_calls.append(ToolCallRecord(name="extract_med_name", args={"text": req.message.strip()}, result={"extracted": extracted, "source": source},))
             candidate = extracted.strip() if extracted else None
             if not candidate and awaiting == "med_name":
                 # only when we explicitly asked for a med name
@@ -442,11 +734,16 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
                     flow.slots.pop("_awaiting", None)
 
         # 2) branch_name (deterministic)
-        if not flow.slots.get("branch_name"):
-            br = extract_branch_name(req.message)
+        if not flow.slots.get("branch_name") and not flow.slots.get("any_branch"):
+            br = extract_branch_name(req.message, store)
             tool_calls.append(ToolCallRecord(name="extract_branch_name", args={"text": req.message}, result={"extracted": br},))
             candidate_br = br.strip() if br else None
-            if not candidate_br and awaiting == "branch_name":
+            if not candidate_br and is_where_query(req.message):
+                # "where is it in stock?" - answer across all branches instead of asking for one
+                flow.slots["any_branch"] = True
+                if awaiting == "branch_name":
+                    flow.slots.pop("_awaiting", None)
+            elif not candidate_br and awaiting == "branch_name":
             # only when we explicitly asked for a branch
                 candidate_br = req.message.strip()
             if candidate_br:
@@ -458,30 +755,24 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
 
         # Ask for what’s missing (minimal)
         missing_med = not flow.slots.get("med_name")
-        missing_branch = not flow.slots.get("branch_name")
+        missing_branch = not flow.slots.get("branch_name") and not flow.slots.get("any_branch")
         if missing_med and missing_branch:
             flow.slots["_awaiting"] = "med_name" # safety mechanism 
             assistant.content = ""
             # You can make a dedicated renderer; for now reuse verbalizer approach or a deterministic string streamer
-            for delta in render_ask_med_and_branch_stream(lang):
-                assistant.content += delta
-                yield delta, ChatResponse(answer=assistant.content, history=history, flow=flow, tool_calls=tool_calls)
+            yield from _yield_stream(stream=render_ask_med_and_branch_stream(lang), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
             return
 
         if missing_med:
             flow.slots["_awaiting"] = "med_name"
             assistant.content = ""
-            for delta in render_ask_med_name_stream(lang):
-                assistant.content += delta
-                yield delta, ChatResponse(answer=assistant.content, history=history, flow=flow, tool_calls=tool_calls)
+            yield from _yield_stream(stream=render_ask_med_name_stream(lang), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
             return
 
         if missing_branch:
             flow.slots["_awaiting"] = "branch_name"
             assistant.content = ""
-            for delta in render_ask_branch_stream(lang):
-                assistant.content += delta
-                yield delta, ChatResponse(answer=assistant.content, history=history, flow=flow, tool_calls=tool_calls)
+            yield from _yield_stream(stream=render_ask_branch_stream(lang), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
             return
 
         flow.step = "resolve_med"
@@ -489,7 +780,7 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
     #  Step: resolve_med 
     if flow.step == "resolve_med":
         med_name = flow.slots["med_name"]
-        med_res = get_medication_by_name(med_name)
+        med_res = get_medication_by_name(med_name, store=store)
         tool_calls.append(ToolCallRecord(name="get_medication_by_name",args={"name": med_name},result=med_res,))
 
         if med_res["status"] == "AMBIGUOUS":
@@ -498,9 +789,7 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
             flow.slots.pop("med_name", None)  # force user to clarify
             flow.slots["_awaiting"] = "med_name"
             assistant.content = ""
-            for delta in render_ambiguous_stream(lang, options):
-                assistant.content += delta
-                yield delta, ChatResponse(answer=assistant.content, history=history, flow=flow, tool_calls=tool_calls)
+            yield from _yield_stream(stream=render_ambiguous_stream(lang, options), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
             return
 
         if med_res["status"] != "OK":
@@ -510,19 +799,17 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
             flow.slots.pop("med_name", None)
             flow.slots.pop("med", None)
             assistant.content = ""
-            for delta in render_not_found_stream(lang):
-                assistant.content += delta
-                yield delta, ChatResponse(answer=assistant.content, history=history, flow=flow, tool_calls=tool_calls)
+            yield from _yield_stream(stream=render_not_found_stream(lang), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
             return
 
         flow.slots["med"] = med_res["medication"]  
         flow.slots["med_match_info"] = med_res.get("match_info")
-        flow.step = "resolve_branch"
+        flow.step = "availability" if flow.slots.get("any_branch") else "resolve_branch"
 
     # Step: resolve_branch 
     if flow.step == "resolve_branch":
         branch_name = flow.slots["branch_name"]
-        br_res = get_branch_by_name(branch_name)
+        br_res = get_branch_by_name(branch_name, store=store)
         tool_calls.append(ToolCallRecord(name="get_branch_by_name", args={"name": branch_name}, result=br_res,))
 
         if br_res["status"] == "AMBIGUOUS":
@@ -531,9 +818,7 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
             flow.slots["_awaiting"] = "branch_name" #safety mechanism
             flow.slots.pop("branch_name", None)
             assistant.content = ""
-            for delta in render_ambiguous_branch_stream(lang, options):
-                assistant.content += delta
-                yield delta, ChatResponse(answer=assistant.content, history=history, flow=flow, tool_calls=tool_calls)
+            yield from _yield_stream(stream=render_ambiguous_branch_stream(lang, options), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
             return
 
         if br_res["status"] != "OK":
@@ -543,30 +828,62 @@ def run_stock_check_flow(*, req: ChatRequest, flow: FlowState, lang: str, assist
             flow.slots.pop("branch_name", None)
             flow.slots.pop("branch", None)
             assistant.content = ""
-            for delta in render_branch_not_found_stream(lang):
-                assistant.content += delta
-                yield delta, ChatResponse(answer=assistant.content, history=history, flow=flow, tool_calls=tool_calls)
+            yield from _yield_stream(stream=render_branch_not_found_stream(lang), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
             return
 
         flow.slots["branch"] = br_res["branch"] #save correct value after it was resolved (status == OK)
         flow.slots.pop("_awaiting", None)  # waiting resolved
         flow.step = "stock"
 
+    # Step: availability (no single branch, the user asked where the medication is in stock)
+    if flow.step == "availability":
+        med = flow.slots["med"]
+        avail_res = find_branches_with_stock(med["med_id"], store=store)
+        tool_calls.append(ToolCallRecord(name="find_branches_with_stock",args={"med_id": med["med_id"], "statuses": avail_res["statuses"]},result=avail_res,))
+
+        assistant.content = ""
+        match_info = flow.slots.get("med_match_info")
+        yield from _yield_stream(stream=render_stock_availability_stream(lang, med, avail_res.get("branches", []), match_info=match_info), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
+
+        flow.slots.pop("_awaiting", None)  # waiting resolved
+        _finalize_flow(flow)
+        # CRITICAL: send updated flow state to client
+        yield from _yield_state_only(assistant=assistant,history=history,flow=flow,tool_calls=tool_calls,)
+         # reset so the client stores "no active flow" for next turn
+        flow_reset = FlowState()
+        yield " ", ChatResponse(
+            answer=assistant.content,
+            history=history,
+            flow=flow_reset,
+            tool_calls=tool_calls,)
+
+        return
+
     #Step: stock 
     if flow.step == "stock":
         med = flow.slots["med"] 
         branch = flow.slots["branch"]
-        stock_res = get_stock(branch["branch_id"], med["med_id"])
+        stock_res = get_stock(branch["branch_id"], med["med_id"], store=store)
         tool_calls.append(ToolCallRecord(name="get_stock",args={"branch_id": branch["branch_id"], "med_id": med["med_id"]},result=stock_res,))
 
         # Always OK in the simple tool, allows expension if time allows
         stock_status = stock_res.get("stock_status", "UNKNOWN")
 
+        # not available here: suggest the nearest branches that have it in the same answer (one lookup, no extra turn)
+        alternatives = None
+        equivalents = None
+        if stock_status in ("OUT_OF_STOCK", "UNKNOWN"):
+            alt_res = find_nearest_branches_with_stock(branch["branch_id"], med["med_id"], k=config.NEAREST_BRANCHES_K, store=store)
+            tool_calls.append(ToolCallRecord(name="find_nearest_branches_with_stock", args={"branch_id": branch["branch_id"], "med_id": med["med_id"], "k": alt_res["k"]}, result=alt_res,))
+            alternatives = alt_res.get("branches", [])
+            # same-ingredient products stocked at this branch
+            eq_res = get_equivalents(med["med_id"], branch_id=branch["branch_id"], store=store)
+            tool_calls.append(ToolCallRecord(name="get_equivalents", args={"med_id": med["med_id"], "branch_id": branch["branch_id"]}, result=eq_res,))
+            equivalents = eq_res.get("equivalents")
+
         assistant.content = ""
         match_info = flow.slots.get("med_match_info")
-        for delta in render_stock_check_stream(lang, med, branch, stock_status, match_info=match_info):
-            assistant.content += delta
-            yield delta, ChatResponse(answer=assistant.content, history=history, flow=flow, tool_calls=tool_calls)
+        yield from _yield_stream(stream=render_stock_check_stream(lang, med, branch, stock_status, match_info=match_info, alternatives=alternatives, equivalents=equivalents), assistant=assistant, history=history, flow=flow, tool_calls=tool_calls,)
 
         flow.slots.pop("_awaiting", None)  # waiting resolved
         _finalize_flow(flow)
@@ -589,12 +906,22 @@ def handle_turn(req: ChatRequest) -> Iterator[Tuple[str, ChatResponse]]:
     Stateless turn orchestrator for the streaming UI.
 
     - Detects language (he/en), appends the user message + an assistant placeholder to history.
+    - Pins the current catalog snapshot (``get_store()``) for the whole turn and records its version
+      in the trace (``catalog_snapshot``); every tool call of the turn reads from that store.
     - Applies a safety override for medical-advice requests (refuse + reset flow).
     - Optionally escapes an in-progress flow if the user is not cooperating / wants to move on.
-    - Routes to (or continues) the active flow using the LLM intent router.
+    - Routes to (or continues) the active flow: rule pre-router first, then the (cached) LLM intent router.
     - Dispatches to the matching flow runner, which streams back (delta, ChatResponse).
     - Falls back to small-talk renderer if nothing matched.
+    - LLM calls and renders are turn effects run here on the blocking client;
+      ``handle_turn_async`` (orchestrator_async.py) runs the same turn on the async client.
+    - With LLM_CASSETTE_MODE=record the turn and its LLM calls are written to the cassette (cassette.py).
     """
+    yield from cassette.record_turn(req, _drive(_turn(req)))
+
+
+def _turn(req: ChatRequest) -> Iterator[Any]:
+    """The turn itself: (delta, ChatResponse) updates interleaved with LLMCall / WaitFuture / Render effects for a driver."""
 
     lang = detect_lang(req.message) #simple heuristic that using encoding to detect hebrew\english
 
@@ -602,6 +929,10 @@ def handle_turn(req: ChatRequest) -> Iterator[Tuple[str, ChatResponse]]:
     flow = req.flow or FlowState()
     tool_calls: list[ToolCallRecord] = []
 
+    # pin one catalog snapshot for the whole turn - a hot reload mid-turn doesn't mix data
+    store = get_store()
+    tool_calls.append(ToolCallRecord(name="catalog_snapshot", args={}, result={"version": store.version},))
+
     # add user message
     history.append(ChatMessage(role="user", content=req.message))
 
@@ -624,14 +955,14 @@ def handle_turn(req: ChatRequest) -> Iterator[Tuple[str, ChatResponse]]:
         return
 
     # safety mechanism gate to escape flow if we are stuck on waiting and user wants to proceed or not co-operating
-    reason = should_escape_flow(flow, req.message)
+    reason = should_escape_flow(flow, req.message, store)
     if reason:
         # tool_calls.append(ToolCallRecord( name="flow_escape", args={"flow": flow.name, "text": req.message}, result={"action": "reset_and_reroute", "reason": reason},))
         flow = FlowState()  # reset so router will route and not continue the current flow
 
     # IMPORTANT: now proceed to normal routing (LLM intent detector)
     # Route / Continue flow 
-    flow, intent_result, st_lang = _route_or_continue_flow(req=req,flow=flow,lang_heuristic=lang,tool_calls=tool_calls,)
+    flow, intent_result, st_lang = yield from _route_or_continue_flow(req=req,flow=flow,lang_heuristic=lang,tool_calls=tool_calls,store=store,)
 
     # print(f"[DBG] flow={flow.name} step={flow.step} lang={lang} intent={getattr(intent_result,'intent',None)}") 
 
@@ -641,11 +972,11 @@ def handle_turn(req: ChatRequest) -> Iterator[Tuple[str, ChatResponse]]:
         return
 
     if flow.name =="rx_verify" and not flow.done:
-        yield from run_rx_verify_flow(req=req,flow=flow,lang=lang,assistant=assistant,history=history,tool_calls=tool_calls,)
+        yield from run_rx_verify_flow(req=req,flow=flow,lang=lang,assistant=assistant,history=history,tool_calls=tool_calls,store=store,)
         return
 
     if flow.name == "stock_check" and not flow.done:
-        yield from run_stock_check_flow(req = req,flow = flow, lang = lang, assistant=assistant, history = history,tool_calls=tool_calls)
+        yield from run_stock_check_flow(req = req,flow = flow, lang = lang, assistant=assistant, history = history,tool_calls=tool_calls, store=store)
         return
 
 
@@ -657,6 +988,7 @@ def handle_turn(req: ChatRequest) -> Iterator[Tuple[str, ChatResponse]]:
             assistant=assistant,
             history=history,
             tool_calls=tool_calls,
+            store=store,
         )
         return
 
@@ -689,7 +1021,7 @@ def _yield_state_only(*,assistant: ChatMessage,history: list[ChatMessage],flow:
         flow=flow,
         tool_calls=tool_calls,)
 
-def run_rx_verify_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: ChatMessage,history: list[ChatMessage],tool_calls: list[ToolCallRecord],) -> Iterator[Tuple[str, ChatResponse]]:
+def run_rx_verify_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: ChatMessage,history: list[ChatMessage],tool_calls: list[ToolCallRecord],store: CatalogStore,) -> Iterator[Any]:
     """
     Tool/flow runner for the **rx_verify** intent.
 
@@ -737,11 +1069,13 @@ def run_rx_verify_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: C
         Conversation history updated as output is streamed.
     tool_calls : list[ToolCallRecord]
         Per-turn tool trace list populated with extractor calls and DB/tool calls.
+    store : CatalogStore
+        Catalog snapshot pinned by ``handle_turn``; all lookups of the turn go through it.
 
     Returns
     -------
-    Iterator[Tuple[str, ChatResponse]]
-        Streaming iterator yielding ``(delta_text, ChatResponse)`` tuples.
+    Iterator[Any]
+        Turn effects (see ``_turn``), which the driver turns into ``(delta_text, ChatResponse)`` tuples.
 
     Notes
     -----
@@ -756,8 +1090,8 @@ def run_rx_verify_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: C
         text = req.message.strip()
 
         # try to extract rx_id / user_id using the extractors (regex based) Optional: use an LLM to do it
-        rx = extract_rx_id(text)
-        uid = extract_user_id(text)
+        rx = extract_rx_id(text) or flow.slots.get("rx_id")  # slots may be pre-filled by the router
+        uid = extract_user_id(text) or flow.slots.get("user_id")
 
         tool_calls.append(ToolCallRecord(name="extract_rx_id",args={"text": text},result={"extracted": rx},))
         tool_calls.append(ToolCallRecord(name="extract_user_id",args={"text": text},result={"extracted": uid},))
@@ -801,7 +1135,7 @@ def run_rx_verify_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: C
         
         rx_id = (flow.slots.get("rx_id") or "").strip()
         
-        res = verify_prescription(rx_id)
+        res = verify_prescription(rx_id, store=store)
         
         tool_calls.append(ToolCallRecord(name="verify_prescription",args={"rx_id": rx_id},result=res,))
 
@@ -841,7 +1175,7 @@ def run_rx_verify_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: C
 
     if flow.step == "list_user_rx":
         user_id = (flow.slots.get("user_id") or "").strip().lower()
-        res = get_prescriptions_for_user(user_id)
+        res = get_prescriptions_for_user(user_id, store=store)
         tool_calls.append(ToolCallRecord(name="get_prescriptions_for_user",args={"user_id": user_id},result=res,))
 
         if res["status"] != "OK":
@@ -882,7 +1216,7 @@ def run_rx_verify_flow(*,req: ChatRequest,flow: FlowState,lang: str,assistant: C
 
 # a safety mechanism which is in charge of not getting stuck inside flows when waiting for the user to fill missing slots
 
-def should_escape_flow(flow: FlowState, user_text: str) -> Optional[str]:
+def should_escape_flow(flow: FlowState, user_text: str, store: Optional[CatalogStore] = None) -> Optional[str]:
     """
     Decide whether to abort the current flow and reroute.
 
@@ -904,9 +1238,9 @@ def should_escape_flow(flow: FlowState, user_text: str) -> Optional[str]:
 
     # If we're awaiting a slot and user gave a plausible slot answer,
     # DO NOT escape and let the flow resolve it.
-    if awaiting == "med_name" and plausible_med_name(user_text):
+    if awaiting == "med_name" and plausible_med_name(user_text, store):
         return None #not to cancel and not to re-route
-    if awaiting == "branch_name" and plausible_branch_name(user_text):
+    if awaiting == "branch_name" and plausible_branch_name(user_text, store):
         return None #not to cancel and not to re-route
      # Rx flow await states
     if awaiting == "rx_id" and plausible_rx_id(user_text):
@@ -0,0 +1,92 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Tuple
+from app import cassette, config
+from app.schemas import ChatRequest, ChatResponse
+from app.orchestrator import LLMCall, Render, WaitFuture, _turn
+
+# Async turn driver: the same turn as handle_turn (orchestrator.py), with every LLM call awaited on
+# AsyncOpenAI and every answer streamed with `async for`. An in-flight turn holds no thread while it
+# waits on the model, so one event loop can serve many concurrent streaming conversations.
+#
+# The flow logic between effects (catalog lookups, fuzzy matching, SQLite queries, mention scans) runs
+# on a small thread pool (ASYNC_TURN_STEP_THREADS), so a slow lookup in one turn doesn't stall the other
+# streams on the loop. It is still Python under the GIL: the loop keeps being scheduled, but CPU-heavy
+# steps of many turns don't run in parallel. Deterministic answer renderers are iterated on the loop.
+
+_STEPS = ThreadPoolExecutor(max_workers=config.ASYNC_TURN_STEP_THREADS, thread_name_prefix="turn-step") if config.ASYNC_TURN_STEP_THREADS > 0 else None
+_DONE = object()
+
+
+def _advance(turn, send: Any, exc: BaseException | None) -> Any:
+    # one deterministic step of the turn, up to its next effect / update (_DONE when it returned)
+    try:
+        return turn.throw(exc) if exc is not None else turn.send(send)
+    except StopIteration:
+        return _DONE
+
+
+async def _step(turn, send: Any, exc: BaseException | None) -> Any:
+    if _STEPS is None:
+        return _advance(turn, send, exc)
+    fut = asyncio.get_running_loop().run_in_executor(_STEPS, contextvars.copy_context().run, _advance, turn, send, exc)
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        await asyncio.wait([fut])  # the step can't be interrupted; let it finish before the turn is closed
+        raise
+
+
+async def _await_future(item: WaitFuture) -> Any:
+    # speculative extractor running on the thread pool (orchestrator._route_speculative)
+    try:
+        return await asyncio.wrap_future(item.future)
+    except Exception:
+        return item.default
+
+
+def handle_turn_async(req: ChatRequest) -> AsyncIterator[Tuple[str, ChatResponse]]:
+    """
+    Async variant of ``handle_turn``: same routing, flows, trace and (delta, ChatResponse) updates.
+
+    - ``LLMCall`` effects are awaited through their async twin (``detect_intent_llm_async``, ...)
+    - ``Render`` effects are streamed with ``async for`` (``LLMTextStream``); deterministic renderers
+      are plain generators and are iterated directly
+    - LLM errors are raised inside the turn at the call site, like in the sync driver
+    - the deterministic steps between effects run on the turn step pool (ASYNC_TURN_STEP_THREADS),
+      not on the event loop
+    - With LLM_CASSETTE_MODE=record the turn and its LLM calls are written to the cassette (cassette.py)
+    """
+    return cassette.arecord_turn(req, _drive_async(_turn(req)))
+
+
+async def _drive_async(turn) -> AsyncIterator[Tuple[str, ChatResponse]]:
+    send, exc = None, None
+    try:
+        while True:
+            item = await _step(turn, send, exc)
+            if item is _DONE:
+                return
+            send, exc = None, None
+            if isinstance(item, LLMCall):
+                try:
+                    send = await item.afn(*item.args)
+                except Exception as e:
+                    exc = e
+            elif isinstance(item, WaitFuture):
+                send = await _await_future(item)
+            elif isinstance(item, Render):
+                assistant = item.assistant
+                if hasattr(item.stream, "__aiter__"):
+                    async for delta in item.stream:
+                        assistant.content += delta
+                        yield delta, ChatResponse(answer=assistant.content, history=item.history, flow=item.flow, tool_calls=item.tool_calls)
+                else:
+                    for delta in item.stream:
+                        assistant.content += delta
+                        yield delta, ChatResponse(answer=assistant.content, history=item.history, flow=item.flow, tool_calls=item.tool_calls)
+            else:
+                yield item
+    finally:
+        turn.close()  # client went away mid-turn: release the turn's speculative calls
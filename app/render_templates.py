@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+# Deterministic bilingual answer templates for the factual flows (med_info / stock_check / rx_verify).
+#
+# Same facts as the LLM renderers in llm.py (render_med_info_stream, ...), laid out as fixed
+# Hebrew / English text: no model call, no tokens, sub-millisecond. Used by the "template" and
+# "template_with_llm_polish_async" rendering modes (RENDER_MODE*, see config.py).
+# Catalog text (names, label summaries) is shown as stored in the catalog.
+
+_STOCK_LABELS = {
+    "en": {"IN_STOCK": "in stock", "LOW_STOCK": "low stock", "OUT_OF_STOCK": "out of stock", "UNKNOWN": "unknown"},
+    "he": {"IN_STOCK": "במלאי", "LOW_STOCK": "מלאי נמוך", "OUT_OF_STOCK": "אזל מהמלאי", "UNKNOWN": "לא ידוע"},
+}
+
+_RX_LABELS = {
+    "en": {"VALID": "valid", "EXPIRED": "expired", "CANCELLED": "cancelled"},
+    "he": {"VALID": "בתוקף", "EXPIRED": "פג תוקף", "CANCELLED": "בוטל"},
+}
+
+
+def _lang(lang: str) -> str:
+    return "he" if lang == "he" else "en"
+
+
+def stock_label(lang: str, status: str) -> str:
+    return _STOCK_LABELS[_lang(lang)].get(status, status)
+
+
+def _match_note(lang: str, med: dict, match_info: dict | None) -> str | None:
+    # same clarifications the LLM renderers add: closest spelling match / alias hit
+    if not match_info:
+        return None
+    name = med["display_name"]
+    if match_info.get("match_type") == "fuzzy":
+        typed = match_info.get("input") or ""
+        return (f'הצגתי את {name}, האיות הקרוב ביותר ל-"{typed}".' if lang == "he"
+                else f'Showing {name}, the closest spelling match for "{typed}".')
+    if match_info.get("matched_kind") == "alias":
+        alias = match_info.get("matched_value") or match_info.get("input") or ""
+        return (f'"{alias}" הוא שם נוסף של {name}.' if lang == "he"
+                else f'"{alias}" is another name for {name}.')
+    return None
+
+
+def _branch_text(lang: str, b: dict) -> str:
+    status = stock_label(lang, b["stock_status"])
+    if b.get("distance_km") is not None:
+        return (f'{b["display_name"]} ({status}, {b["distance_km"]} ק"מ)' if lang == "he"
+                else f'{b["display_name"]} ({status}, {b["distance_km"]} km away)')
+    return f'{b["display_name"]} ({status})'
+
+
+def med_info_text(lang: str, med: dict, match_info: dict | None, equivalents: list[dict] | None = None) -> str:
+    lang = _lang(lang)
+    lines = []
+    note = _match_note(lang, med, match_info)
+    if note:
+        lines.append(note)
+    if lang == "he":
+        lines += [
+            f'הנה המידע על {med["display_name"]}:',
+            f'- חומר פעיל: {med["active_ingredient"]}',
+            f'- דורש מרשם: {"כן" if med["rx_required"] else "לא"}',
+            f'- תקציר: {med["label_summary"]}',]
+        if equivalents:
+            lines.append("- מוצרים נוספים עם אותו חומר פעיל: " + ", ".join(e["display_name"] for e in equivalents))
+        lines.append("\nזהו מידע כללי בלבד, להכוונה רפואית פנו לרופא/רוקח.")
+    else:
+        lines += [
+            f'Here is the information about {med["display_name"]}:',
+            f'- Active ingredient: {med["active_ingredient"]}',
+            f'- Prescription required: {"yes" if med["rx_required"] else "no"}',
+            f'- Summary: {med["label_summary"]}',]
+        if equivalents:
+            lines.append("- Other products with the same active ingredient: " + ", ".join(e["display_name"] for e in equivalents))
+        lines.append("\nThis is general information only, for medical guidance consult a licensed doctor/pharmacist.")
+    return "\n".join(lines)
+
+
+def stock_check_text(lang: str, med: dict, branch: dict, stock_status: str, match_info: dict | None,
+                     alternatives: list[dict] | None = None, equivalents: list[dict] | None = None) -> str:
+    lang = _lang(lang)
+    lines = []
+    note = _match_note(lang, med, match_info)
+    if note:
+        lines.append(note)
+    status = stock_label(lang, stock_status)
+    in_stock_equivalents = [e for e in (equivalents or []) if e.get("stock_status") in ("IN_STOCK", "LOW_STOCK")]
+    if lang == "he":
+        lines.append(f'{med["display_name"]} בסניף {branch["display_name"]}: {status}.')
+        if alternatives:
+            lines.append("זמין בסניפים קרובים (הקרוב ביותר ראשון): " + ", ".join(_branch_text(lang, b) for b in alternatives))
+        elif alternatives is not None:
+            lines.append("כרגע לא זמין בסניפים אחרים.")
+        if in_stock_equivalents:
+            lines.append(f'מוצרים עם אותו חומר פעיל בסניף {branch["display_name"]}: '
+                         + ", ".join(f'{e["display_name"]} ({stock_label(lang, e["stock_status"])})' for e in in_stock_equivalents))
+        lines.append("המלאי עשוי להשתנות במהלך היום.")
+    else:
+        lines.append(f'{med["display_name"]} at the {branch["display_name"]} branch: {status}.')
+        if alternatives:
+            lines.append("Available at nearby branches (closest first): " + ", ".join(_branch_text(lang, b) for b in alternatives))
+        elif alternatives is not None:
+            lines.append("It is currently not available at other branches.")
+        if in_stock_equivalents:
+            lines.append(f'Products with the same active ingredient at {branch["display_name"]}: '
+                         + ", ".join(f'{e["display_name"]} ({stock_label(lang, e["stock_status"])})' for e in in_stock_equivalents))
+        lines.append("Availability may change during the day.")
+    return "\n".join(lines)
+
+
+def stock_availability_text(lang: str, med: dict, branches: list[dict], match_info: dict | None) -> str:
+    lang = _lang(lang)
+    lines = []
+    note = _match_note(lang, med, match_info)
+    if note:
+        lines.append(note)
+    if lang == "he":
+        if branches:
+            lines.append(f'{med["display_name"]} זמין בסניפים: ' + ", ".join(_branch_text(lang, b) for b in branches))
+        else:
+            lines.append(f'{med["display_name"]} אינו במלאי כרגע באף סניף.')
+        lines.append("המלאי עשוי להשתנות במהלך היום.")
+    else:
+        if branches:
+            lines.append(f'{med["display_name"]} is available at: ' + ", ".join(_branch_text(lang, b) for b in branches))
+        else:
+            lines.append(f'{med["display_name"]} is currently not in stock at any branch.')
+        lines.append("Availability may change during the day.")
+    return "\n".join(lines)
+
+
+def rx_verify_text(lang: str, rx: dict) -> str:
+    # rx: {rx_id,user_id,user_name,med_name,rx_status,expires_on}
+    lang = _lang(lang)
+    status = _RX_LABELS[lang].get(rx.get("rx_status"), rx.get("rx_status"))
+    if lang == "he":
+        return (f'מרשם {rx.get("rx_id")}: {status}.\n'
+                f'- תרופה: {rx.get("med_name")}\n'
+                f'- בתוקף עד: {rx.get("expires_on")}')
+    return (f'Prescription {rx.get("rx_id")}: {status}.\n'
+            f'- Medication: {rx.get("med_name")}\n'
+            f'- Expires on: {rx.get("expires_on")}')
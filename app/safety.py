@@ -1,6 +1,6 @@
 import re
 from typing import Optional
-from app.db import MEDICATIONS, BRANCHES
+from app.store import CatalogStore, get_store
 from app.simple_detectors import extract_rx_id,extract_user_id
 
 # A lightweight heuristic safety gate to detect medical advice requests
@@ -38,6 +38,14 @@ _META_PAT = re.compile(
 )
 
 
+# the whole message is greetings / meta questions (and punctuation), e.g. "hi!", "שלום, מה אתה יכול לעשות?"
+_SMALLTALK_ONLY_PAT = re.compile(
+    r"^(?:[\s\W]*(?:hi|hello|hey|thanks|thank you|thx|good morning|good evening|what can you do|help|how does this work|"
+    r"היי|הי|שלום|תודה רבה|תודה|בוקר טוב|ערב טוב|מה אתה יכול לעשות|עזרה|איך זה עובד)\b)+[\s\W]*$",
+    re.IGNORECASE,
+)
+
+
 def is_cancel(text: str) -> bool:
     return bool(_CANCEL_PAT.search(text or ""))
 
@@ -45,12 +53,16 @@ def is_smalltalk_or_meta(text: str) -> bool:
     t = text or ""
     return bool(_SMALLTALK_PAT.search(t) or _META_PAT.search(t))
 
+def is_only_smalltalk_or_meta(text: str) -> bool:
+    """True when the message is nothing but greetings / meta questions (is_smalltalk_or_meta matches anywhere)."""
+    return bool(_SMALLTALK_ONLY_PAT.match(text or ""))
+
 def _looks_like_short_answer(text: str) -> bool:
     # when awaiting a slot, answers are usually short
     t = (text or "").strip()
     return 0 < len(t) <= 15 and ("\n" not in t) 
 
-def plausible_med_name(text: str) -> bool:
+def plausible_med_name(text: str, store: Optional[CatalogStore] = None) -> bool:
     """
     returns True if message is a short and contains
     any known med/alias as substring, OR is a single-word token.
@@ -60,11 +72,9 @@ def plausible_med_name(text: str) -> bool:
     if not _looks_like_short_answer(t):
         return False
 
-    # strong: matches known meds/aliases
-    for m in MEDICATIONS:
-        keys = [m.display_name] + list(m.aliases)
-        if any(k.lower() in t for k in keys):
-            return True
+    # strong: mentions a known med/alias (single automaton pass)
+    if (store or get_store()).mentions.longest(t, kind="med"):
+        return True
 
     # weaker: single token which can be a response of an unexisting med
     # still keep flow, the tool will return NOT_FOUND if wrong
@@ -73,7 +83,7 @@ def plausible_med_name(text: str) -> bool:
 
     return False
 
-def plausible_branch_name(text: str) -> bool:
+def plausible_branch_name(text: str, store: Optional[CatalogStore] = None) -> bool:
     """
     returns True if message is a short and contains
     any known branch/alias as substring, OR is a single-word token.
@@ -83,11 +93,9 @@ def plausible_branch_name(text: str) -> bool:
     if not _looks_like_short_answer(t):
         return False
 
-    # strong: matches known meds/aliases
-    for b in BRANCHES:
-        keys = [b.display_name] + list(b.aliases)
-        if any(k.lower() in t for k in keys):
-            return True
+    # strong: mentions a known branch/alias (single automaton pass)
+    if (store or get_store()).mentions.longest(t, kind="branch"):
+        return True
 
     # weaker: single token which can be a response of an unexisting branch
     # still keep flow, the tool will return NOT_FOUND if wrong
@@ -1,7 +1,6 @@
 import re
 from typing import Optional
-from app.db import BRANCHES
-from app.utils import norm
+from app.store import CatalogStore, get_store
 
 # The following detector is used to detect user language and allow bilinguality
 # if user language isn't Hebrew it is asumed to be english
@@ -23,35 +22,61 @@ def detect_lang(text: str) -> str:
 
 
 #used to extract branch name - could be implemented using an LLM like med name but prefered a simple version
-def extract_branch_name(text: str) -> Optional[str]:
+def extract_branch_name(text: str, store: Optional[CatalogStore] = None) -> Optional[str]:
     """
     Very simple deterministic extractor:
     - If any branch alias/display name appears as a whole word/substring, return that alias/display.
     - Returns the matched string (not branch_id). 
+    - Single pass over the message with the shared entity automaton, longest mention wins
+      to avoid "ha" matching "haifa".
     """
-    t = (text or "").strip().lower()
+    t = (text or "").strip()
     if not t:
         return None
 
-    
-    candidates: list[str] = []
-    for b in BRANCHES:
-        keys = [b.display_name] + list(b.aliases)
-        for k in keys:
-            k_norm = norm(k)
-            if not k_norm:
-                continue
-            if k_norm in t:
-                candidates.append(k)
-
-    if not candidates:
-        return None
+    m = (store or get_store()).mentions.longest(t, kind="branch")
+    return m.value if m else None
+
+# "where is it in stock?" style questions - the user wants any branch, not a specific one
+_WHERE_PAT = re.compile(
+    r"\b(where|which branch(es)?|what branch(es)?|any branch|anywhere|any store|other branch(es)?)\b|"
+    r"(איפה|היכן|באיזה סניף|באילו סניפים|בכל סניף|סניף אחר)",
+    re.IGNORECASE,)
+
+def is_where_query(text: str) -> bool:
+    """
+    Deterministic detector for availability questions that don't name a single branch
+    (e.g. "where can I find Advil?", "איפה יש אדביל?").
+    """
+    return bool(_WHERE_PAT.search(text or ""))
+
+# stock / info wording, used by the rule pre-router together with entity mentions
+_STOCK_PAT = re.compile(
+    r"\b(in stock|stock|available|availability|do you have|have you got|carry)\b|"
+    r"(במלאי|מלאי|זמין|זמינה|זמינים|יש לכם|יש לך|יש אצלכם|יש במלאי)",
+    re.IGNORECASE,)
+
+_INFO_PAT = re.compile(
+    r"\b(tell me about|what is|what's|info|information|details|active ingredient|ingredient|"
+    r"prescription required|require[sd]? a prescription|need a prescription|side effects?)\b|"
+    r"(מידע על|מידע|ספר לי על|מה זה|פרטים על|רכיב פעיל|צריך מרשם|דורש מרשם|תופעות לוואי)",
+    re.IGNORECASE,)
 
-    # Prefer longer matches to avoid "ha" matching "haifa"
-    candidates.sort(key=lambda s: len(s), reverse=True)
-    return candidates[0]
+def is_stock_query(text: str) -> bool:
+    """Deterministic detector for stock/availability wording ("in stock", "available", "יש לכם")."""
+    return bool(_STOCK_PAT.search(text or ""))
+
+def is_info_query(text: str) -> bool:
+    """Deterministic detector for medication information wording ("tell me about", "מידע על")."""
+    return bool(_INFO_PAT.search(text or ""))
 
 # next parts are relevant for the prescriptions flow
+_RX_WORDS_PAT = re.compile(r"\b(prescriptions?|rx)\b|(מרשם|מרשמים)", re.IGNORECASE)
+
+def is_rx_query(text: str) -> bool:
+    """Deterministic detector for prescription wording ("my prescription", "rx", "מרשם"), with or without an id."""
+    return bool(_RX_WORDS_PAT.search(text or ""))
+
 
 
 _RX_RE = re.compile(r"\bRX[- ]?\d{5,}\b", re.IGNORECASE)
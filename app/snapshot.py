@@ -0,0 +1,334 @@
+from __future__ import annotations
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+from dataclasses import asdict
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from app.db import MEDICATIONS, USERS, BRANCHES, INVENTORY, PRESCRIPTIONS
+from app.db import Medication, User, Branch, InventoryItem, InventoryStatus, Prescription
+from app.store import CatalogStore, InMemoryStore, set_store
+
+# Versioned catalog snapshots loaded from files, for CATALOG_BACKEND=snapshot.
+#
+# A snapshot directory holds one file per table, either <table>.json (a list of objects)
+# or <table>.csv (header row, list fields such as aliases separated by "|").
+# Loading builds a complete InMemoryStore (all lookup indices); a reload builds a new one off
+# the request path and swaps the process-wide store reference in one assignment. A turn pins
+# the store it started with, so it never sees a half-applied update.
+#
+# The catalog data of a loaded store is never mutated, except for stock: live stock updates
+# (POST /inventory/events, ingest.py) are written into the serving store's inventory matrix and
+# kept in a StockOverlay, which re-applies them to every newly loaded snapshot. A live update
+# is dropped once a reloaded inventory file changes that cell itself (the file is newer).
+
+TABLES = ("medications", "users", "branches", "inventory", "prescriptions")
+
+
+def _table_file(directory: Path, table: str) -> Optional[Path]:
+    for ext in (".json", ".csv"):
+        path = directory / f"{table}{ext}"
+        if path.is_file():
+            return path
+    return None
+
+
+def _rows(path: Path, raw: bytes) -> List[dict]:
+    text = raw.decode("utf-8-sig")
+    if path.suffix == ".json":
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError(f"{path.name}: expected a JSON list of objects")
+        return rows
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _list(value) -> List[str]:
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return [v.strip() for v in str(value or "").split("|") if v.strip()]
+
+
+def _bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def _float(value) -> Optional[float]:
+    if value is None or str(value).strip() == "":
+        return None
+    return float(value)
+
+
+def _medication(r: dict) -> Medication:
+    return Medication(
+        med_id=r["med_id"],
+        display_name=r["display_name"],
+        aliases=_list(r.get("aliases")),
+        active_ingredient=r["active_ingredient"],
+        rx_required=_bool(r["rx_required"]),
+        label_summary=r.get("label_summary") or "",)
+
+
+def _user(r: dict) -> User:
+    return User(user_id=r["user_id"], full_name=r["full_name"])
+
+
+def _branch(r: dict) -> Branch:
+    return Branch(
+        branch_id=r["branch_id"],
+        display_name=r["display_name"],
+        aliases=_list(r.get("aliases")),
+        lat=_float(r.get("lat")),
+        lon=_float(r.get("lon")),)
+
+
+def _inventory_item(r: dict) -> InventoryItem:
+    return InventoryItem(branch_id=r["branch_id"], med_id=r["med_id"], status=r["status"])
+
+
+def _prescription(r: dict) -> Prescription:
+    return Prescription(
+        rx_id=r["rx_id"],
+        user_id=r["user_id"],
+        med_id=r["med_id"],
+        status=r["status"],
+        expires_on=date.fromisoformat(str(r["expires_on"])),)
+
+
+_PARSERS: Dict[str, Callable[[dict], object]] = {
+    "medications": _medication,
+    "users": _user,
+    "branches": _branch,
+    "inventory": _inventory_item,
+    "prescriptions": _prescription,
+}
+
+
+class SnapshotStore(InMemoryStore):
+    """InMemoryStore of a snapshot; with an overlay attached, stock updates go through it and survive reloads."""
+
+    overlay: Optional["StockOverlay"] = None
+
+    def apply_stock_updates(self, updates: List[Tuple[str, str, InventoryStatus]]) -> int:
+        if self.overlay is None:
+            return super().apply_stock_updates(updates)
+        return self.overlay.apply(updates)
+
+
+class StockOverlay:
+    """
+    Live stock updates on top of the snapshot files, for the process-wide snapshot store.
+
+    Every update is applied to the serving store and remembered per (branch_id, med_id) cell,
+    with the file status it replaced. A new snapshot gets the remembered updates replayed
+    before it is swapped in, except for cells whose file status changed since (the new file
+    is newer than the live update, it wins and the cell is forgotten).
+    """
+
+    def __init__(self):
+        self._cells: Dict[Tuple[str, str], Tuple[str, str]] = {}  # cell -> (live status, file status)
+        self._lock = threading.Lock()
+        self.current: Optional[SnapshotStore] = None
+        self.replayed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def apply(self, updates: List[Tuple[str, str, InventoryStatus]]) -> int:
+        """Apply a batch to the serving snapshot (whichever store the caller holds) and remember it."""
+        with self._lock:
+            matrix = self.current.inventory_matrix
+            for branch_id, med_id, status in updates:
+                if branch_id in matrix.branch_ord and med_id in matrix.med_ord and status in matrix.status_code:
+                    cell = (branch_id, med_id)
+                    known = self._cells.get(cell)
+                    self._cells[cell] = (status, known[1] if known else matrix.get(branch_id, med_id))
+            return matrix.apply(updates)
+
+    def swap(self, store: SnapshotStore, publish: Callable[[CatalogStore], None]) -> None:
+        """Replay the live updates onto a freshly loaded store, then publish it as the serving store."""
+        with self._lock:  # no update can land between the replay and the swap
+            matrix = store.inventory_matrix
+            replay = []
+            for cell, (status, file_status) in list(self._cells.items()):
+                if matrix.get(*cell) != file_status:
+                    del self._cells[cell]
+                    self.dropped += 1
+                else:
+                    replay.append((cell[0], cell[1], status))
+            self.replayed += matrix.apply(replay)
+            store.overlay = self
+            self.current = store
+            publish(store)
+
+
+def load_snapshot(directory: str) -> SnapshotStore:
+    """
+    Load a catalog snapshot directory into a new InMemoryStore.
+    The store version is a content hash of the table files, so identical data -> identical version.
+    Raises FileNotFoundError if a table file is missing and ValueError/KeyError on malformed rows.
+    """
+    root = Path(directory)
+    digest = hashlib.sha256()
+    tables: Dict[str, list] = {}
+    for table in TABLES:
+        path = _table_file(root, table)
+        if path is None:
+            raise FileNotFoundError(f"catalog snapshot {root}: missing {table}.json / {table}.csv")
+        raw = path.read_bytes()
+        digest.update(path.name.encode() + b"\0" + raw + b"\0")
+        tables[table] = [_PARSERS[table](r) for r in _rows(path, raw)]
+
+    return SnapshotStore(
+        tables["medications"],
+        tables["users"],
+        tables["branches"],
+        tables["inventory"],
+        tables["prescriptions"],
+        version=digest.hexdigest()[:12],)
+
+
+def _json_default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    raise TypeError(type(o).__name__)
+
+
+def export_snapshot(
+    directory: str,
+    medications: List[Medication] = MEDICATIONS,
+    users: List[User] = USERS,
+    branches: List[Branch] = BRANCHES,
+    inventory: List[InventoryItem] = INVENTORY,
+    prescriptions: List[Prescription] = PRESCRIPTIONS,) -> None:
+    """Write a catalog as a JSON snapshot directory (defaults to the synthetic catalog from db.py)."""
+    root = Path(directory)
+    root.mkdir(parents=True, exist_ok=True)
+    records = {
+        "medications": medications,
+        "users": users,
+        "branches": branches,
+        "inventory": inventory,
+        "prescriptions": prescriptions,
+    }
+    for table, rows in records.items():
+        # write + rename, so a running watcher never reads a half written file
+        tmp = root / f".{table}.json.tmp"
+        tmp.write_text(
+            json.dumps([asdict(r) for r in rows], ensure_ascii=False, indent=1, default=_json_default),
+            encoding="utf-8")
+        os.replace(tmp, root / f"{table}.json")
+
+
+def open_snapshot(directory: str) -> SnapshotStore:
+    """Load a snapshot directory, seeding it with the synthetic catalog on first use."""
+    root = Path(directory)
+    if not any(_table_file(root, t) for t in TABLES):
+        export_snapshot(directory)
+    return load_snapshot(directory)
+
+
+class SnapshotWatcher:
+    """
+    Polls a snapshot directory and swaps in a freshly built store when its files change.
+
+    The new store (and all of its indices) is built on the watcher thread; request
+    handling only ever sees the old or the new store reference. A snapshot that fails
+    to load is skipped (the current store keeps serving) and retried on the next change.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        interval: float = 2.0,
+        on_swap: Callable[[CatalogStore], None] = set_store,):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.on_swap = on_swap
+        self.version: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.swaps = 0
+        self._signature = self._current_signature()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _current_signature(self) -> Tuple:
+        sig = []
+        for table in TABLES:
+            path = _table_file(self.directory, table)
+            if path is None:
+                sig.append((table, None))
+                continue
+            st = path.stat()
+            sig.append((path.name, st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    def poll(self) -> bool:
+        """Reload if the files changed since the last successful load. Returns True when a new store was swapped in."""
+        try:
+            sig = self._current_signature()
+        except OSError as e:
+            self.last_error = str(e)
+            return False
+        if sig == self._signature:
+            return False
+        try:
+            store = load_snapshot(str(self.directory))
+        except Exception as e:  # partial / malformed files: keep serving the current snapshot
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        self._signature = sig
+        self.last_error = None
+        if store.version == self.version:
+            return False  # touched but identical content
+        self.on_swap(store)
+        self.version = store.version
+        self.swaps += 1
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self) -> "SnapshotWatcher":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-snapshot-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_WATCHER: Optional[SnapshotWatcher] = None
+_OVERLAY = StockOverlay()
+
+
+def open_watched_snapshot(directory: str, interval: float) -> SnapshotStore:
+    """Initial snapshot for get_store(), plus a background watcher (interval <= 0 disables reloading)."""
+    global _WATCHER
+    store = open_snapshot(directory)
+    _OVERLAY.swap(store, lambda _store: None)  # get_store() publishes the initial store
+    if interval > 0 and _WATCHER is None:
+        _WATCHER = SnapshotWatcher(directory, interval, on_swap=lambda new: _OVERLAY.swap(new, set_store))
+        _WATCHER.version = store.version
+        _WATCHER.start()
+    return store
+
+
+if __name__ == "__main__":
+    # python -m app.snapshot <dir> : write the synthetic catalog as a snapshot directory
+    import sys
+    target = sys.argv[1] if len(sys.argv) > 1 else "catalog"
+    export_snapshot(target)
+    print(f"catalog snapshot written to {target}/ (version {load_snapshot(target).version})")
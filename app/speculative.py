@@ -0,0 +1,111 @@
+from __future__ import annotations
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Speculative execution of slow calls (LLM extractors) while the router is still deciding.
+#
+# A turn starts the calls it will *probably* need on a shared thread pool, then asks only for
+# the results the chosen intent needs; everything else is cancelled (if not started yet) or
+# discarded when the turn ends. Spend is capped by a process-wide limit on speculative calls in
+# flight - over the cap nothing is started and the flow simply makes the call itself later.
+# A call that is already running can't be interrupted; its result is dropped and its slot is
+# released when it returns.
+
+
+class SpeculativeExecutor:
+    """
+    Shared pool + spend cap for speculative calls.
+
+    - max_inflight: max speculative calls running or queued at once, over all turns (0 disables)
+    - counters: launched / used / discarded / skipped (over the cap), see stats()
+    """
+
+    def __init__(self, max_inflight: int = 8):
+        self.max_inflight = max(0, max_inflight)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="speculative") if self.max_inflight else None
+        self._slots = threading.BoundedSemaphore(self.max_inflight or 1)
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.used = 0
+        self.discarded = 0
+        self.skipped = 0
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Optional[Future]:
+        """Start fn(*args) on the pool, or return None when disabled / over the spend cap."""
+        if self._pool is None or not self._slots.acquire(blocking=False):
+            self._count("skipped")
+            return None
+        try:
+            fut = self._pool.submit(contextvars.copy_context().run, fn, *args)  # keeps the caller's turn context (cassette turn id)
+        except RuntimeError:  # pool shut down (interpreter exit)
+            self._slots.release()
+            self._count("skipped")
+            return None
+        fut.add_done_callback(lambda _f: self._slots.release())  # also runs for cancelled futures
+        self._count("launched")
+        return fut
+
+    def turn(self) -> "SpeculativeTurn":
+        return SpeculativeTurn(self)
+
+    def stats(self) -> dict:
+        return {
+            "max_inflight": self.max_inflight,
+            "launched": self.launched,
+            "used": self.used,
+            "discarded": self.discarded,
+            "skipped": self.skipped,
+        }
+
+
+class SpeculativeTurn:
+    """
+    Per-turn handle (context manager): start named calls, take the ones needed, and on exit
+    cancel / discard the rest.
+    """
+
+    def __init__(self, executor: SpeculativeExecutor):
+        self._executor = executor
+        self._futures: Dict[str, Future] = {}
+        self.started: list[str] = []
+        self.used: list[str] = []
+        self.discarded: list[str] = []
+
+    def start(self, name: str, fn: Callable[..., Any], *args: Any) -> bool:
+        """Start fn(*args) under name; False when it was not started (spend cap)."""
+        fut = self._executor.submit(fn, *args)
+        if fut is None:
+            return False
+        self._futures[name] = fut
+        self.started.append(name)
+        return True
+
+    def take(self, name: str) -> Optional[Future]:
+        """Claim a started call (it won't be discarded); None when it wasn't started."""
+        fut = self._futures.pop(name, None)
+        if fut is not None:
+            self.used.append(name)
+            self._executor._count("used")
+        return fut
+
+    def cancel_rest(self) -> None:
+        for name, fut in self._futures.items():
+            fut.cancel()  # no-op if already running, the result is just dropped
+            self.discarded.append(name)
+            self._executor._count("discarded")
+        self._futures.clear()
+
+    def summary(self) -> dict:
+        return {"started": list(self.started), "used": list(self.used), "discarded": list(self.discarded)}
+
+    def __enter__(self) -> "SpeculativeTurn":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.cancel_rest()
@@ -0,0 +1,646 @@
+from __future__ import annotations
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import date
+from functools import cached_property
+from typing import Dict, Iterable, List, Literal, Optional, Tuple
+import numpy as np
+from app import config
+from app.db import MEDICATIONS, USERS, BRANCHES, INVENTORY, PRESCRIPTIONS
+from app.db import Medication, User, Branch, InventoryItem, Prescription, InventoryStatus, RxStatus, RxStatusView, final_rx_status
+from app.db import INVENTORY_STATUSES
+from app.indexes import AliasIndex, FuzzyIndex, GeoGrid, InventoryMatrix, MentionAutomaton
+from app.utils import norm, norm_text
+
+# Catalog storage backends. The tools in tools.py only talk to the CatalogStore interface,
+# the backend is selected by config.CATALOG_BACKEND:
+# - "memory": the synthetic lists from db.py with in-process indices
+# - "sqlite": the same catalog in an indexed SQLite file, rows are fetched per lookup
+# - "mmap": the catalog and its indices in a flat binary file mapped by every worker (see mmap_store.py)
+# - "snapshot": versioned JSON/CSV catalog files, hot reloaded by swapping in a new in-memory store (see snapshot.py)
+
+MedMatch = Tuple[str, str, str]                 # (med_id, matched_value, matched_kind)
+FuzzyMatch = Tuple[str, str, str, int, float]   # (med_id, matched_value, matched_kind, distance, score)
+NearbyStock = Tuple[str, str, float]            # (branch_id, stock status, distance_km)
+
+
+def _med_alias_entries(medications: Iterable[Medication]) -> List[Tuple[str, str, str]]:
+    # entry order = match priority: medication order, canonical name before aliases
+    return [
+        (m.med_id, val, kind)
+        for m in medications
+        for val, kind in [(m.display_name, "canonical")] + [(a, "alias") for a in m.aliases]]
+
+
+def _ingredient_key(active_ingredient: str) -> str:
+    # "Paracetamol (Acetaminophen)" -> "paracetamol acetaminophen", shared by every product of the ingredient
+    return norm_text(active_ingredient)
+
+
+def _branch_alias_map(branches: Iterable[Branch]) -> Dict[str, str]:
+    return {
+        norm(alias): b.branch_id
+        for b in branches
+        for alias in ([b.display_name] + b.aliases)}
+
+
+def _entity_patterns(branches: Iterable[Branch], medications: Iterable[Medication]) -> List[Tuple[str, str, str]]:
+    return (
+        [("branch", b.branch_id, val) for b in branches for val in [b.display_name] + b.aliases]
+        + [("med", m.med_id, val) for m in medications for val in [m.display_name] + m.aliases])
+
+
+class CatalogStore(ABC):
+    """
+    Repository interface over the pharmacy catalog (medications, users, branches,
+    inventory and prescriptions).
+
+    Name lookups receive input already normalized by the calling tool, and return
+    ids in catalog priority order so that the tools keep deterministic results
+    regardless of the backend.
+    """
+
+    # identifies the catalog data lookups are served from (recorded in the turn's tool trace)
+    version: str = "static"
+
+    @abstractmethod
+    def get_medication(self, med_id: str) -> Optional[Medication]:
+        ...
+
+    @abstractmethod
+    def match_medications(self, q: str, match_type: Literal["exact", "contains"], limit: Optional[int] = None) -> List[MedMatch]:
+        """First matching name/alias per medication, for a normalized query (norm_text); at most limit medications."""
+
+    @abstractmethod
+    def fuzzy_medications(self, q: str) -> List[FuzzyMatch]:
+        """Ranked typo tolerant candidates, first (closest) entry per medication."""
+
+    @abstractmethod
+    def equivalent_medications(self, med_id: str) -> List[str]:
+        """med_ids of the other products with the same active ingredient, in catalog order."""
+
+    @abstractmethod
+    def get_user(self, user_id: str) -> Optional[User]:
+        ...
+
+    @abstractmethod
+    def get_branch(self, branch_id: str) -> Optional[Branch]:
+        ...
+
+    @abstractmethod
+    def branch_for_alias(self, q: str) -> Optional[str]:
+        """branch_id whose alias key equals q."""
+
+    @abstractmethod
+    def branches_overlapping(self, q: str) -> List[str]:
+        """branch_id for every alias key that contains q or is contained in q, in alias order."""
+
+    @abstractmethod
+    def get_stock(self, branch_id: str, med_id: str) -> InventoryStatus:
+        """Stock status of a (branch, medication) pair, "UNKNOWN" when there is no record."""
+
+    @abstractmethod
+    def branches_with_stock(self, med_id: str, statuses: Iterable[InventoryStatus]) -> List[Tuple[str, InventoryStatus]]:
+        """(branch_id, status) for every branch where the medication has one of the statuses, in branch order."""
+
+    @abstractmethod
+    def nearest_branches_with_stock(
+        self, branch_id: str, med_id: str, k: int, statuses: Iterable[InventoryStatus]) -> List[NearbyStock]:
+        """
+        Up to k other branches where the medication has one of the statuses, closest to branch_id first.
+        Empty when branch_id is unknown or has no coordinates.
+        """
+
+    @abstractmethod
+    def stock_row(self, branch_id: str) -> Dict[str, InventoryStatus]:
+        """med_id -> status for every medication with a stock record at the branch."""
+
+    @abstractmethod
+    def apply_stock_updates(self, updates: List[Tuple[str, str, InventoryStatus]]) -> int:
+        """
+        Apply a batch of (branch_id, med_id, status) stock updates, later updates win.
+        Updates for unknown branches/medications or statuses are skipped; returns the number applied.
+        Must not block concurrent readers.
+        """
+
+    @abstractmethod
+    def get_prescription(self, rx_id: str) -> Optional[Prescription]:
+        ...
+
+    @abstractmethod
+    def prescriptions_for_user(self, user_id: str) -> List[Prescription]:
+        """Prescriptions of a (lowercased) user_id, sorted by rx_id."""
+
+    @abstractmethod
+    def rx_status(self, p: Prescription) -> RxStatus:
+        """Final (date aware) status of a prescription."""
+
+    @property
+    @abstractmethod
+    def mentions(self) -> MentionAutomaton:
+        """Entity mention scanner over branch and medication names/aliases."""
+
+
+class InMemoryStore(CatalogStore):
+    """
+    The catalog as plain Python objects with in-process lookup indices, built once.
+    """
+
+    def __init__(
+        self,
+        medications: List[Medication],
+        users: List[User],
+        branches: List[Branch],
+        inventory: List[InventoryItem],
+        prescriptions: List[Prescription],
+        version: str = "synthetic",):
+        self.version = version
+        self.med_by_id: Dict[str, Medication] = {m.med_id: m for m in medications}
+        self.user_by_id: Dict[str, User] = {u.user_id: u for u in users}
+        self.branch_by_id: Dict[str, Branch] = {b.branch_id: b for b in branches}
+
+        # normalized medication name index + typo tolerant trigram-filtered index over the same entries
+        self.med_alias_index = AliasIndex(_med_alias_entries(medications))
+        self.med_fuzzy_index = FuzzyIndex(self.med_alias_index)
+        # active ingredient -> med_ids (generic equivalents), built with the rest of the catalog
+        self.meds_by_ingredient: Dict[str, List[str]] = {}
+        for m in medications:
+            self.meds_by_ingredient.setdefault(_ingredient_key(m.active_ingredient), []).append(m.med_id)
+
+        # lookup maps
+        self.branch_alias_map: Dict[str, str] = _branch_alias_map(branches)
+        # compact uint8 (branch x medication) status matrix, O(1) cell lookup + vectorized row/column queries
+        self.inventory_matrix = InventoryMatrix(
+            [b.branch_id for b in branches],
+            [m.med_id for m in medications],
+            [(i.branch_id, i.med_id, i.status) for i in inventory],
+            INVENTORY_STATUSES,)
+        # branch coordinates, ordinals aligned with the matrix rows so a stock column is directly a mask
+        coords = {b.branch_id: (b.lat, b.lon) for b in branches}
+        self.branch_grid = GeoGrid(
+            (br_id, *coords.get(br_id, (None, None))) for br_id in self.inventory_matrix.branch_ids)
+
+        self.rx_by_id: Dict[str, Prescription] = {p.rx_id.upper(): p for p in prescriptions}
+        # user_id -> prescriptions (sorted by rx_id)
+        self.rx_by_user: Dict[str, List[Prescription]] = {}
+        for p in sorted(prescriptions, key=lambda p: p.rx_id):
+            self.rx_by_user.setdefault(p.user_id.lower(), []).append(p)
+        # materialized final status, refreshed once per day boundary
+        self.rx_status_view = RxStatusView(prescriptions)
+
+        self._mentions = MentionAutomaton(_entity_patterns(branches, medications))
+
+    @classmethod
+    def from_synthetic(cls) -> "InMemoryStore":
+        return cls(MEDICATIONS, USERS, BRANCHES, INVENTORY, PRESCRIPTIONS)
+
+    def get_medication(self, med_id: str) -> Optional[Medication]:
+        return self.med_by_id.get(med_id)
+
+    def match_medications(self, q: str, match_type: Literal["exact", "contains"], limit: Optional[int] = None) -> List[MedMatch]:
+        idx = self.med_alias_index
+        ordinals = idx.exact(q) if match_type == "exact" else idx.contains(q, limit)
+        return idx.first_per_owner(ordinals)[:limit]
+
+    def fuzzy_medications(self, q: str) -> List[FuzzyMatch]:
+        return self.med_fuzzy_index.search(q)
+
+    def equivalent_medications(self, med_id: str) -> List[str]:
+        m = self.med_by_id.get(med_id)
+        if m is None:
+            return []
+        return [other for other in self.meds_by_ingredient.get(_ingredient_key(m.active_ingredient), []) if other != med_id]
+
+    def get_user(self, user_id: str) -> Optional[User]:
+        return self.user_by_id.get(user_id)
+
+    def get_branch(self, branch_id: str) -> Optional[Branch]:
+        return self.branch_by_id.get(branch_id)
+
+    def branch_for_alias(self, q: str) -> Optional[str]:
+        return self.branch_alias_map.get(q)
+
+    def branches_overlapping(self, q: str) -> List[str]:
+        return [br_id for norm_alias, br_id in self.branch_alias_map.items() if q in norm_alias or norm_alias in q]
+
+    def get_stock(self, branch_id: str, med_id: str) -> InventoryStatus:
+        return self.inventory_matrix.get(branch_id, med_id)
+
+    def branches_with_stock(self, med_id: str, statuses: Iterable[InventoryStatus]) -> List[Tuple[str, InventoryStatus]]:
+        return self.inventory_matrix.branches_with(med_id, statuses)
+
+    def nearest_branches_with_stock(
+        self, branch_id: str, med_id: str, k: int, statuses: Iterable[InventoryStatus]) -> List[NearbyStock]:
+        origin = self.branch_by_id.get(branch_id)
+        if origin is None or origin.lat is None or origin.lon is None:
+            return []
+        allowed = self.inventory_matrix.column_mask(med_id, statuses)
+        allowed[self.branch_grid.ord[branch_id]] = False
+        return [
+            (br_id, self.inventory_matrix.get(br_id, med_id), dist)
+            for br_id, dist in self.branch_grid.nearest(origin.lat, origin.lon, k, allowed)]
+
+    def stock_row(self, branch_id: str) -> Dict[str, InventoryStatus]:
+        return self.inventory_matrix.row(branch_id)
+
+    def apply_stock_updates(self, updates: List[Tuple[str, str, InventoryStatus]]) -> int:
+        # inventory is live data: written in place (snapshot.py's SnapshotStore also keeps them across reloads)
+        return self.inventory_matrix.apply(updates)
+
+    def get_prescription(self, rx_id: str) -> Optional[Prescription]:
+        return self.rx_by_id.get(rx_id)
+
+    def prescriptions_for_user(self, user_id: str) -> List[Prescription]:
+        return self.rx_by_user.get(user_id, [])
+
+    def rx_status(self, p: Prescription) -> RxStatus:
+        return self.rx_status_view.status(p)
+
+    @property
+    def mentions(self) -> MentionAutomaton:
+        return self._mentions
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS medications (
+    med_id TEXT PRIMARY KEY, ord INTEGER NOT NULL, display_name TEXT NOT NULL,
+    active_ingredient TEXT NOT NULL, rx_required INTEGER NOT NULL, label_summary TEXT NOT NULL,
+    ingredient_key TEXT NOT NULL DEFAULT '');
+CREATE INDEX IF NOT EXISTS idx_med_ingredient ON medications(ingredient_key, ord);
+CREATE TABLE IF NOT EXISTS med_aliases (
+    ord INTEGER PRIMARY KEY, med_id TEXT NOT NULL, value TEXT NOT NULL, kind TEXT NOT NULL, norm TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_med_aliases_norm ON med_aliases(norm);
+CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, full_name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS branches (
+    branch_id TEXT PRIMARY KEY, ord INTEGER NOT NULL, display_name TEXT NOT NULL, lat REAL, lon REAL);
+CREATE TABLE IF NOT EXISTS branch_aliases (
+    ord INTEGER PRIMARY KEY, branch_id TEXT NOT NULL, value TEXT NOT NULL, norm TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_branch_aliases_norm ON branch_aliases(norm);
+CREATE TABLE IF NOT EXISTS inventory (
+    branch_id TEXT NOT NULL, med_id TEXT NOT NULL, status TEXT NOT NULL,
+    PRIMARY KEY (branch_id, med_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_inventory_med ON inventory(med_id, status);
+CREATE TABLE IF NOT EXISTS prescriptions (
+    rx_key TEXT PRIMARY KEY, rx_id TEXT NOT NULL, user_id TEXT NOT NULL, user_key TEXT NOT NULL,
+    med_id TEXT NOT NULL, status TEXT NOT NULL, expires_on TEXT NOT NULL, final_status TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_rx_user ON prescriptions(user_key, rx_id);
+CREATE INDEX IF NOT EXISTS idx_rx_valid_expiry ON prescriptions(final_status, expires_on);
+"""
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Bring catalog files created by older versions up to the current schema (additive only)."""
+    with conn:
+        # branch coordinates
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(branches)")}
+        for col in ("lat", "lon"):
+            if col not in columns:
+                conn.execute(f"ALTER TABLE branches ADD COLUMN {col} REAL")
+        # active ingredient key (generic equivalents)
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(medications)")}
+        if "ingredient_key" not in columns:
+            conn.execute("ALTER TABLE medications ADD COLUMN ingredient_key TEXT NOT NULL DEFAULT ''")
+            conn.executemany(
+                "UPDATE medications SET ingredient_key = ? WHERE med_id = ?",
+                [(_ingredient_key(ai), med_id) for med_id, ai in conn.execute("SELECT med_id, active_ingredient FROM medications")])
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_med_ingredient ON medications(ingredient_key, ord)")
+
+
+# same rules as final_rx_status: CANCELLED stays cancelled, EXPIRED by flag or by date, otherwise VALID
+_FINAL_STATUS_SQL = (
+    "CASE WHEN status = 'CANCELLED' THEN 'CANCELLED' "
+    "WHEN status = 'EXPIRED' OR expires_on < :today THEN 'EXPIRED' ELSE 'VALID' END")
+
+
+class SQLiteStore(CatalogStore):
+    """
+    The catalog in an SQLite file with indices on normalized aliases, (branch_id, med_id)
+    and user_id. Rows are fetched per lookup, so a worker doesn't hold the catalog in its heap.
+
+    - contains lookups go through an FTS5 trigram index when the SQLite build has one
+    - the final prescription status is a materialized column, refreshed with one UPDATE
+      on the first read after a day boundary
+    - only the name/alias keys are loaded in memory, lazily, for the fuzzy matcher and
+      the mention automaton
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = "sqlite"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._rx_as_of: Optional[date] = None
+        self._has_fts = bool(self._conn().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'med_aliases_fts'").fetchone())
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread (sqlite3 connections are not shared across threads)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        medications: List[Medication],
+        users: List[User],
+        branches: List[Branch],
+        inventory: List[InventoryItem],
+        prescriptions: List[Prescription],) -> "SQLiteStore":
+        """Create (or fill an empty) SQLite catalog from in-memory records."""
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")  # readers never block on the daily status refresh
+        conn.executescript(_SQLITE_SCHEMA)
+        today = date.today()
+        with conn:
+            conn.executemany(
+                "INSERT INTO medications VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(m.med_id, i, m.display_name, m.active_ingredient, int(m.rx_required), m.label_summary,
+                  _ingredient_key(m.active_ingredient))
+                 for i, m in enumerate(medications)])
+            conn.executemany(
+                "INSERT INTO med_aliases VALUES (?, ?, ?, ?, ?)",
+                [(i, med_id, val, kind, norm_text(val))
+                 for i, (med_id, val, kind) in enumerate(_med_alias_entries(medications)) if norm_text(val)])
+            conn.executemany("INSERT INTO users VALUES (?, ?)", [(u.user_id, u.full_name) for u in users])
+            conn.executemany(
+                "INSERT INTO branches VALUES (?, ?, ?, ?, ?)",
+                [(b.branch_id, i, b.display_name, b.lat, b.lon) for i, b in enumerate(branches)])
+            # one row per distinct alias key, keeping the first spelling and the mapping of the in-memory alias map
+            first_value: Dict[str, str] = {}
+            for b in branches:
+                for alias in [b.display_name] + b.aliases:
+                    first_value.setdefault(norm(alias), alias)
+            conn.executemany(
+                "INSERT INTO branch_aliases VALUES (?, ?, ?, ?)",
+                [(i, br_id, first_value[key], key) for i, (key, br_id) in enumerate(_branch_alias_map(branches).items())])
+            conn.executemany(
+                "INSERT OR REPLACE INTO inventory VALUES (?, ?, ?)",
+                [(i.branch_id, i.med_id, i.status) for i in inventory])
+            conn.executemany(
+                "INSERT INTO prescriptions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(p.rx_id.upper(), p.rx_id, p.user_id, p.user_id.lower(), p.med_id, p.status,
+                  p.expires_on.isoformat(), final_rx_status(p, today))
+                 for p in prescriptions])
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('rx_status_as_of', ?)", (today.isoformat(),))
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS med_aliases_fts USING fts5("
+                    "norm, content='med_aliases', content_rowid='ord', tokenize='trigram')")
+                conn.execute("INSERT INTO med_aliases_fts(med_aliases_fts) VALUES ('rebuild')")
+            except sqlite3.OperationalError:
+                pass  # no FTS5/trigram in this SQLite build - contains lookups fall back to a scan
+        conn.close()
+        return cls(path)
+
+    @classmethod
+    def open(cls, path: str) -> "SQLiteStore":
+        """Open an SQLite catalog, seeding it with the synthetic catalog on first use."""
+        conn = sqlite3.connect(path)
+        has_table = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'medications'").fetchone()
+        seeded = has_table and conn.execute("SELECT 1 FROM medications LIMIT 1").fetchone()
+        if seeded:
+            _migrate(conn)
+        conn.close()
+        if not seeded:
+            return cls.create(path, MEDICATIONS, USERS, BRANCHES, INVENTORY, PRESCRIPTIONS)
+        return cls(path)
+
+    def _medication(self, row: sqlite3.Row) -> Medication:
+        aliases = [r["value"] for r in self._conn().execute(
+            "SELECT value FROM med_aliases WHERE med_id = ? AND kind = 'alias' ORDER BY ord", (row["med_id"],))]
+        return Medication(
+            med_id=row["med_id"],
+            display_name=row["display_name"],
+            aliases=aliases,
+            active_ingredient=row["active_ingredient"],
+            rx_required=bool(row["rx_required"]),
+            label_summary=row["label_summary"],)
+
+    def get_medication(self, med_id: str) -> Optional[Medication]:
+        row = self._conn().execute("SELECT * FROM medications WHERE med_id = ?", (med_id,)).fetchone()
+        return self._medication(row) if row else None
+
+    def match_medications(self, q: str, match_type: Literal["exact", "contains"], limit: Optional[int] = None) -> List[MedMatch]:
+        conn = self._conn()
+        if match_type == "exact":
+            rows = conn.execute("SELECT med_id, value, kind FROM med_aliases WHERE norm = ? ORDER BY ord", (q,))
+        elif not q:
+            return []  # instr(norm, '') is true for every row, the other stores match nothing
+        elif self._has_fts and len(q) >= 3:
+            # trigram index narrows the candidates, instr() keeps exact substring semantics (LIKE treats _ and % as wildcards)
+            rows = conn.execute(
+                "SELECT a.med_id, a.value, a.kind FROM med_aliases_fts f JOIN med_aliases a ON a.ord = f.rowid "
+                "WHERE f.norm LIKE ? AND instr(a.norm, ?) > 0 ORDER BY a.ord",
+                (f"%{q}%", q))
+        else:
+            rows = conn.execute(
+                "SELECT med_id, value, kind FROM med_aliases WHERE instr(norm, ?) > 0 ORDER BY ord", (q,))
+        seen = set()
+        out = []
+        for med_id, value, kind in rows:  # rows are stepped lazily, stopping early ends the scan
+            if med_id not in seen:
+                if len(out) == limit:
+                    break
+                seen.add(med_id)
+                out.append((med_id, value, kind))
+        return out
+
+    @cached_property
+    def _fuzzy_index(self) -> FuzzyIndex:
+        rows = self._conn().execute("SELECT med_id, value, kind FROM med_aliases ORDER BY ord")
+        return FuzzyIndex(AliasIndex((r["med_id"], r["value"], r["kind"]) for r in rows))
+
+    def fuzzy_medications(self, q: str) -> List[FuzzyMatch]:
+        return self._fuzzy_index.search(q)
+
+    def equivalent_medications(self, med_id: str) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT e.med_id FROM medications m JOIN medications e ON e.ingredient_key = m.ingredient_key "
+            "WHERE m.med_id = ? AND e.med_id != m.med_id ORDER BY e.ord",
+            (med_id,))
+        return [r["med_id"] for r in rows]
+
+    def get_user(self, user_id: str) -> Optional[User]:
+        row = self._conn().execute("SELECT user_id, full_name FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return User(user_id=row["user_id"], full_name=row["full_name"]) if row else None
+
+    def get_branch(self, branch_id: str) -> Optional[Branch]:
+        conn = self._conn()
+        row = conn.execute("SELECT branch_id, display_name, lat, lon FROM branches WHERE branch_id = ?", (branch_id,)).fetchone()
+        if not row:
+            return None
+        aliases = [r["value"] for r in conn.execute(
+            "SELECT value FROM branch_aliases WHERE branch_id = ? AND value != ? ORDER BY ord",
+            (branch_id, row["display_name"]))]
+        return Branch(
+            branch_id=row["branch_id"], display_name=row["display_name"], aliases=aliases, lat=row["lat"], lon=row["lon"])
+
+    def branch_for_alias(self, q: str) -> Optional[str]:
+        row = self._conn().execute("SELECT branch_id FROM branch_aliases WHERE norm = ?", (q,)).fetchone()
+        return row["branch_id"] if row else None
+
+    def branches_overlapping(self, q: str) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT branch_id FROM branch_aliases WHERE instr(norm, :q) > 0 OR instr(:q, norm) > 0 ORDER BY ord",
+            {"q": q})
+        return [r["branch_id"] for r in rows]
+
+    def get_stock(self, branch_id: str, med_id: str) -> InventoryStatus:
+        row = self._conn().execute(
+            "SELECT status FROM inventory WHERE branch_id = ? AND med_id = ?", (branch_id, med_id)).fetchone()
+        return row["status"] if row else "UNKNOWN"
+
+    def branches_with_stock(self, med_id: str, statuses: Iterable[InventoryStatus]) -> List[Tuple[str, InventoryStatus]]:
+        statuses = list(statuses)
+        if not statuses:
+            return []
+        marks = ", ".join("?" for _ in statuses)
+        rows = self._conn().execute(
+            "SELECT i.branch_id, i.status FROM inventory i JOIN branches b ON b.branch_id = i.branch_id "
+            f"WHERE i.med_id = ? AND i.status IN ({marks}) ORDER BY b.ord",
+            (med_id, *statuses))
+        return [(r["branch_id"], r["status"]) for r in rows]
+
+    @cached_property
+    def _branch_grid(self) -> GeoGrid:
+        rows = self._conn().execute("SELECT branch_id, lat, lon FROM branches ORDER BY ord")
+        return GeoGrid((r["branch_id"], r["lat"], r["lon"]) for r in rows)
+
+    def nearest_branches_with_stock(
+        self, branch_id: str, med_id: str, k: int, statuses: Iterable[InventoryStatus]) -> List[NearbyStock]:
+        grid = self._branch_grid
+        origin = grid.ord.get(branch_id)
+        if origin is None or not grid.located[origin]:
+            return []
+        status_by_branch = dict(self.branches_with_stock(med_id, statuses))
+        allowed = np.zeros(len(grid), dtype=bool)
+        for br_id in status_by_branch:
+            if br_id in grid.ord:
+                allowed[grid.ord[br_id]] = True
+        allowed[origin] = False
+        lat, lon = self._conn().execute(
+            "SELECT lat, lon FROM branches WHERE branch_id = ?", (branch_id,)).fetchone()
+        return [(br_id, status_by_branch[br_id], dist) for br_id, dist in grid.nearest(lat, lon, k, allowed)]
+
+    def stock_row(self, branch_id: str) -> Dict[str, InventoryStatus]:
+        rows = self._conn().execute(
+            "SELECT i.med_id, i.status FROM inventory i JOIN medications m ON m.med_id = i.med_id "
+            "WHERE i.branch_id = ? ORDER BY m.ord",
+            (branch_id,))
+        return {r["med_id"]: r["status"] for r in rows if r["status"] != "UNKNOWN"}
+
+    @cached_property
+    def _entity_ids(self) -> Tuple[frozenset, frozenset]:
+        conn = self._conn()
+        return (
+            frozenset(r[0] for r in conn.execute("SELECT branch_id FROM branches")),
+            frozenset(r[0] for r in conn.execute("SELECT med_id FROM medications")))
+
+    def apply_stock_updates(self, updates: List[Tuple[str, str, InventoryStatus]]) -> int:
+        branch_ids, med_ids = self._entity_ids
+        rows = [
+            (b, m, st) for b, m, st in updates
+            if b in branch_ids and m in med_ids and st in INVENTORY_STATUSES]
+        if rows:
+            # one transaction per batch; WAL readers keep reading the last committed state meanwhile
+            conn = self._conn()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO inventory VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def _refresh_rx_status(self) -> None:
+        """Materialized final_status: one UPDATE per day boundary instead of a per-row date check."""
+        today = date.today()
+        if today == self._rx_as_of:
+            return
+        with self._lock:
+            if today == self._rx_as_of:
+                return
+            conn = self._conn()
+            row = conn.execute("SELECT value FROM meta WHERE key = 'rx_status_as_of'").fetchone()
+            as_of = date.fromisoformat(row["value"]) if row else None
+            with conn:
+                if as_of is None or today < as_of:
+                    conn.execute(f"UPDATE prescriptions SET final_status = {_FINAL_STATUS_SQL}", {"today": today.isoformat()})
+                elif today > as_of:
+                    conn.execute(
+                        "UPDATE prescriptions SET final_status = 'EXPIRED' WHERE final_status = 'VALID' AND expires_on < ?",
+                        (today.isoformat(),))
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('rx_status_as_of', ?)", (today.isoformat(),))
+            self._rx_as_of = today
+
+    def _prescription(self, row: sqlite3.Row) -> Prescription:
+        return Prescription(
+            rx_id=row["rx_id"],
+            user_id=row["user_id"],
+            med_id=row["med_id"],
+            status=row["status"],
+            expires_on=date.fromisoformat(row["expires_on"]),)
+
+    def get_prescription(self, rx_id: str) -> Optional[Prescription]:
+        row = self._conn().execute("SELECT * FROM prescriptions WHERE rx_key = ?", (rx_id,)).fetchone()
+        return self._prescription(row) if row else None
+
+    def prescriptions_for_user(self, user_id: str) -> List[Prescription]:
+        rows = self._conn().execute("SELECT * FROM prescriptions WHERE user_key = ? ORDER BY rx_id", (user_id,))
+        return [self._prescription(r) for r in rows]
+
+    def rx_status(self, p: Prescription) -> RxStatus:
+        self._refresh_rx_status()
+        row = self._conn().execute(
+            "SELECT final_status FROM prescriptions WHERE rx_key = ?", (p.rx_id.upper(),)).fetchone()
+        return row["final_status"] if row else p.status
+
+    @cached_property
+    def mentions(self) -> MentionAutomaton:
+        conn = self._conn()
+        branch_rows = conn.execute("SELECT branch_id, value FROM branch_aliases ORDER BY ord").fetchall()
+        med_rows = conn.execute("SELECT med_id, value FROM med_aliases ORDER BY ord").fetchall()
+        return MentionAutomaton(
+            [("branch", r["branch_id"], r["value"]) for r in branch_rows]
+            + [("med", r["med_id"], r["value"]) for r in med_rows])
+
+
+_STORE: Optional[CatalogStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def _create_store(backend: str) -> CatalogStore:
+    if backend == "memory":
+        return InMemoryStore.from_synthetic()
+    if backend == "sqlite":
+        return SQLiteStore.open(config.CATALOG_SQLITE_PATH)
+    if backend == "mmap":
+        from app.mmap_store import MmapStore  # mmap_store.py builds on this module
+        return MmapStore.open(config.CATALOG_MMAP_PATH)
+    if backend == "snapshot":
+        from app.snapshot import open_watched_snapshot  # snapshot.py builds on this module
+        return open_watched_snapshot(config.CATALOG_SNAPSHOT_DIR, config.CATALOG_RELOAD_INTERVAL)
+    raise ValueError(f"Unknown CATALOG_BACKEND: {backend!r} (expected 'memory', 'sqlite', 'mmap' or 'snapshot')")
+
+
+def get_store() -> CatalogStore:
+    """The process-wide catalog store, created on first use from config.CATALOG_BACKEND."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = _create_store(config.CATALOG_BACKEND)
+    return _STORE
+
+
+def set_store(store: CatalogStore) -> None:
+    """
+    Replace the process-wide catalog store (e.g. a different backend or dataset).
+    Turns already running keep the store they started with.
+    """
+    global _STORE
+    with _STORE_LOCK:
+        _STORE = store
@@ -0,0 +1,116 @@
+from __future__ import annotations
+import math
+import random
+from datetime import date, timedelta
+from typing import Iterator, List, NamedTuple
+from app.db import INVENTORY_STATUSES, Branch, InventoryItem, Medication, Prescription, User
+
+# Scalable synthetic catalog for benchmarks: the same record types as db.py, sized by a row count.
+#
+# For `rows` = N (10^3 .. 10^7):
+# - prescriptions: N, inventory: N (capped by branches x medications), users: N / 5
+# - medications: N / 20 (min 50), each with 2 English + 2 Hebrew aliases
+# - branches: sqrt(N) (min 10), each with an English + a Hebrew alias, coordinates inside Israel
+# Names are built from syllables of the record number, so they are unique, pronounceable and
+# need no digits (like real names, they exercise the alias / fuzzy / mention indices).
+# Generation is deterministic for a given (rows, seed).
+
+_EN_SYL = ["ba", "ce", "di", "fo", "gu", "ka", "le", "mi", "no", "pu", "ra", "se", "ti", "vo", "xa", "zu",
+           "bel", "cor", "dan", "fen", "gal", "lin", "mor", "nex", "pra", "rol", "sta", "tor", "val", "zen"]
+_HE_SYL = ["בא", "גו", "דה", "זי", "חו", "טה", "יו", "כא", "לי", "מו", "נה", "סי", "פו", "צה", "קו", "רא",
+           "שי", "תו", "בל", "גל", "דן", "מור", "נר", "פל", "רן", "של", "תם", "אל", "אור", "גן"]
+_EN_SUFFIX = ["", "ex", "ol", "in", "ax", "ine", "ide", "ate"]
+_HE_SUFFIX = ["", "קס", "ול", "ין", "קס", "ין", "יד", "ט"]
+
+
+class Catalog(NamedTuple):
+    medications: List[Medication]
+    users: List[User]
+    branches: List[Branch]
+    inventory: List[InventoryItem]
+    prescriptions: List[Prescription]
+
+
+def _word(n: int, syllables: List[str], salt: int) -> str:
+    # base-len(syllables) spelling of an injective map of (n, salt), so every name is distinct
+    k = len(syllables)
+    n = n * 7919 + salt * 104729 + k ** 2  # spread consecutive numbers over different first syllables
+    out = []
+    while n:
+        n, r = divmod(n, k)
+        out.append(syllables[r])
+    return "".join(out)
+
+
+def en_name(n: int, salt: int = 0) -> str:
+    return _word(n, _EN_SYL, salt).capitalize() + _EN_SUFFIX[(n + salt) % len(_EN_SUFFIX)]
+
+
+def he_name(n: int, salt: int = 0) -> str:
+    return _word(n, _HE_SYL, salt) + _HE_SUFFIX[(n + salt) % len(_HE_SUFFIX)]
+
+
+def catalog_sizes(rows: int) -> dict:
+    meds = max(50, rows // 20)
+    branches = max(10, math.isqrt(rows))
+    return {
+        "medications": meds,
+        "branches": branches,
+        "users": max(10, rows // 5),
+        "inventory": min(rows, meds * branches),
+        "prescriptions": rows,
+    }
+
+
+def generate_catalog(rows: int, seed: int = 0) -> Catalog:
+    """A synthetic catalog with ~`rows` inventory and prescription rows (see catalog_sizes)."""
+    sizes = catalog_sizes(rows)
+    rng = random.Random(seed)
+    n_meds, n_br = sizes["medications"], sizes["branches"]
+    n_ingredients = max(10, n_meds // 3)  # ~3 products per active ingredient (equivalents)
+
+    medications = [
+        Medication(
+            med_id=f"med_{i:07d}",
+            display_name=en_name(i),
+            aliases=[en_name(i, 1), en_name(i, 2), he_name(i), he_name(i, 1)],
+            active_ingredient=en_name(i % n_ingredients, 3).lower(),
+            rx_required=rng.random() < 0.3,
+            label_summary=f"Synthetic product {i} for benchmarks.",)
+        for i in range(n_meds)]
+    branches = [
+        Branch(
+            branch_id=f"br_{i:06d}",
+            display_name=f"{en_name(i, 5)} Center",
+            aliases=[en_name(i, 5), he_name(i, 5)],
+            lat=round(29.5 + rng.random() * 3.8, 5),
+            lon=round(34.3 + rng.random() * 1.5, 5),)
+        for i in range(n_br)]
+    users = [User(user_id=f"user_{i:03d}", full_name=f"{en_name(i, 7)} {en_name(i, 8)}") for i in range(sizes["users"])]
+    inventory = list(_inventory(sizes["inventory"], n_br, n_meds, rng))
+
+    today = date.today()
+    rx_statuses = ("VALID", "VALID", "VALID", "EXPIRED", "CANCELLED")
+    prescriptions = [
+        Prescription(
+            rx_id=f"RX-{10001 + i}",
+            user_id=f"user_{rng.randrange(sizes['users']):03d}",
+            med_id=f"med_{rng.randrange(n_meds):07d}",
+            status=rng.choice(rx_statuses),
+            expires_on=today + timedelta(days=rng.randint(-365, 365)),)
+        for i in range(sizes["prescriptions"])]
+    return Catalog(medications, users, branches, inventory, prescriptions)
+
+
+def _inventory(n: int, n_br: int, n_meds: int, rng: random.Random) -> Iterator[InventoryItem]:
+    # n distinct (branch, medication) cells: a random stride walk over the full grid
+    cells = n_br * n_meds
+    stride = rng.randrange(1, cells)
+    while math.gcd(stride, cells) != 1:
+        stride += 1
+    statuses = INVENTORY_STATUSES[1:]
+    cell = rng.randrange(cells)
+    for _ in range(n):
+        b, m = divmod(cell, n_meds)
+        yield InventoryItem(branch_id=f"br_{b:06d}", med_id=f"med_{m:07d}", status=statuses[rng.randrange(len(statuses))])
+        cell = (cell + stride) % cells
@@ -1,40 +1,30 @@
 from __future__ import annotations
 from dataclasses import asdict
 from typing import Any, Dict, List, Literal, Optional, Tuple
-from app.db import MEDICATIONS, Medication
-from app.db import BRANCHES, BRANCH_BY_ID, BRANCH_ALIAS_MAP
-import re
-from app.db import INVENTORY_MAP
-from datetime import date
-from app.db import RX_BY_ID, MED_BY_ID, USER_BY_ID
-from app.db import PRESCRIPTIONS, USER_BY_ID, MED_BY_ID
-from datetime import date
+from app.db import Medication
+from app.store import CatalogStore, get_store
+from app.utils import norm_text
 
 
 
 
 ToolStatus = Literal["OK", "NOT_FOUND", "AMBIGUOUS"] #define possible tool outcomes
 
+# an AMBIGUOUS medication lookup lists at most this many options (more than one is all the lookup needs to know)
+MAX_MED_MATCHES = 10
+
 
 
 def _norm(s: str) -> str:
     """
-    Normalize text for deterministic matching:
+    Normalize text for deterministic matching (same normalization the db indices are built with):
     - lowercase
     - remove punctuation
     - collapse whitespace
     """
-    if not s:
-        return ""
-
-    s = s.lower()
-    # replace any non-letter/digit with space (works for Hebrew too)
-    s = re.sub(r"[^\w\u0590-\u05FF]+", " ", s)
-    # collapse multiple spaces
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    return norm_text(s)
 
-def get_medication_by_name(name: str) -> Dict[str, Any]:
+def get_medication_by_name(name: str, *, store: Optional[CatalogStore] = None) -> Dict[str, Any]:
     """
     Tool Name: get_medication_by_name
     Resolve a user-provided medication name to a single medication record
@@ -55,6 +45,10 @@ def get_medication_by_name(name: str) -> Dict[str, Any]:
             case-insensitive, ignores leading/trailing whitespace, and uses
             normalized string comparison.
 
+        store (CatalogStore | None):
+            Catalog snapshot to read from (keyword only). Defaults to the
+            current store, `get_store()`.
+
     Matching Strategy:
         The lookup proceeds deterministically in ordered stages:
         1. Exact normalized match:
@@ -63,6 +57,12 @@ def get_medication_by_name(name: str) -> Dict[str, Any]:
         2. Contains match (only if no exact matches found):
             - Against canonical display name
             - Against aliases
+        3. Fuzzy match (only if nothing matched literally):
+            - Bounded edit distance (1 edit for 4-5 chars, 2 edits for longer
+              inputs) over Hebrew-aware folded names and aliases, so typos
+              such as "Iboprofen" or "ןאדביל" resolve locally.
+            - A single closest candidate is returned as OK, ties at the
+              closest distance are returned as AMBIGUOUS.
 
         For each medication, the first successful match is recorded along
         with metadata describing how the match occurred.
@@ -74,9 +74,13 @@ def get_medication_by_name(name: str) -> Dict[str, Any]:
                 Indicates the outcome of the lookup.
             - matches (list[dict]):
                 Present only when status == "AMBIGUOUS". Contains candidate
-                medications with:
+                medications (at most MAX_MED_MATCHES exact / contains ones,
+                in catalog order) with:
                     - med_id (str)
                     - display_name (str)
+                    - match_type (str) and score (float):
+                        Only for fuzzy candidates: the ones tied at the
+                        closest distance, in catalog order.
             - medication (dict | None):
                 Present only when status == "OK". When present, contains:
                     - med_id (str)
@@ -96,8 +100,11 @@ def get_medication_by_name(name: str) -> Dict[str, Any]:
                     - matched_kind (Literal["canonical", "alias"]):
                         Whether the match came from the canonical name or
                         an alias.
-                    - match_type (Literal["exact", "contains"]):
-                        Whether the match was exact or substring-based.
+                    - match_type (Literal["exact", "contains", "fuzzy"]):
+                        Whether the match was exact, substring-based or
+                        typo tolerant.
+                    - score (float):
+                        Only for fuzzy matches, similarity in [0,1].
 
     Error Handling:
         This function does not raise exceptions.
@@ -127,36 +134,40 @@ def get_medication_by_name(name: str) -> Dict[str, Any]:
     if not q:
         return {"status": "NOT_FOUND", "matches": [], "medication": None} 
 
-    # store tuples: (Medication, matched_value, matched_kind, match_type)
-    hits: List[tuple[Medication, str, str, str]] = []
+    store = store or get_store()
 
-    
-   # 1) exact normalized match
-    for m in MEDICATIONS:
-        candidates = [(m.display_name, "canonical")] + [(a, "alias") for a in m.aliases]
-        for val, kind in candidates:
-            if _norm(val) == q:
-                hits.append((m, val, kind, "exact"))
-                break  # stop at first match for this med
-    
-     # 2) contains match only if no exact matches
-    if not hits:
-        for m in MEDICATIONS:
-            candidates = [(m.display_name, "canonical")] + [(a, "alias") for a in m.aliases]
-            for val, kind in candidates:
-                if q in _norm(val):
-                    hits.append((m, val, kind, "contains"))
-                    break
+    # 1) exact normalized match (indexed alias lookup in the catalog store)
+    match_type = "exact"
+    hits = store.match_medications(q, "exact", MAX_MED_MATCHES)
 
+    # 2) contains match only if no exact matches
     if not hits:
-        return {"status": "NOT_FOUND", "matches": [], "medication": None}
-
-    # de-dupe meds while preserving first match info
-    by_id: Dict[str, tuple[Medication, str, str, str]] = {}
-    for m, val, kind, mtype in hits:
-        if m.med_id not in by_id:
-            by_id[m.med_id] = (m, val, kind, mtype)
-
+        match_type = "contains"
+        hits = store.match_medications(q, "contains", MAX_MED_MATCHES)
+
+    if hits:
+        # de-duped by the store, first match info per med: med_id -> (Medication, matched_value, matched_kind, match_type)
+        by_id: Dict[str, tuple[Medication, str, str, str]] = {
+            med_id: (store.get_medication(med_id), val, kind, match_type)
+            for med_id, val, kind in hits}
+        scores: Dict[str, float] = {}
+    else:
+        # 3) fuzzy match (typos) only if nothing matched literally: bounded edit distance over Hebrew-folded aliases
+        ranked = store.fuzzy_medications(q)
+        if not ranked:
+            return {"status": "NOT_FOUND", "matches": [], "medication": None}
+        match_type = "fuzzy"
+        # a single closest candidate resolves the typo, ties at the best distance are left to the user
+        if len(ranked) > 1 and ranked[0][3] == ranked[1][3]:
+            return {
+                "status": "AMBIGUOUS",
+                "matches": [
+                    {"med_id": med_id, "display_name": store.get_medication(med_id).display_name, "match_type": match_type, "score": score}
+                    for med_id, _, _, dist, score in ranked[:MAX_MED_MATCHES] if dist == ranked[0][3]],
+                "medication": None,}
+        med_id, val, kind, _, score = ranked[0]
+        by_id = {med_id: (store.get_medication(med_id), val, kind, match_type)}
+        scores = {med_id: score}
 
     # Fallback: in case identified multiple meds e.g. because the user inserted an abbreviation which fits two meds
     # Important for multistep-flow in which the agent clarifies ambiguity with the user intended and avoids LLM inference and potential hallucination
@@ -183,13 +194,14 @@ def get_medication_by_name(name: str) -> Dict[str, Any]:
             "normalized": q,
             "matched_value": matched_value,
             "matched_kind": matched_kind,   # "alias" or "canonical"
-            "match_type": match_type,       # "exact" or "contains"
+            "match_type": match_type,       # "exact", "contains" or "fuzzy"
+            **({"score": scores[m.med_id]} if m.med_id in scores else {}),
         },
     }
 
 
 
-def get_branch_by_name(name: str) -> Dict[str, Any]:
+def get_branch_by_name(name: str, *, store: Optional[CatalogStore] = None) -> Dict[str, Any]:
     """
     Tool Name: get_branch_by_name
     Resolve a user-provided pharmacy branch name to a single branch record
@@ -209,6 +221,10 @@ def get_branch_by_name(name: str) -> Dict[str, Any]:
             resilient to extra whitespace, punctuation, and basic
             formatting differences via normalization.
 
+        store (CatalogStore | None):
+            Catalog snapshot to read from (keyword only). Defaults to the
+            current store, `get_store()`.
+
     Returns:
         dict:
             A structured result with a strict schema:
@@ -249,18 +265,19 @@ def get_branch_by_name(name: str) -> Dict[str, Any]:
     if not q:
         return {"status": "NOT_FOUND"}
 
+    store = store or get_store()
+
     # Exact alias match
-    if q in BRANCH_ALIAS_MAP:
-        br_id = BRANCH_ALIAS_MAP[q]
-        b = BRANCH_BY_ID[br_id]
+    br_id = store.branch_for_alias(q)
+    if br_id:
+        b = store.get_branch(br_id)
         return {"status": "OK", "branch": {"branch_id": b.branch_id, "display_name": b.display_name}}
 
     # Substring: contains query or query contains name
     matches = []
-    for norm_alias, br_id in BRANCH_ALIAS_MAP.items():
-        if q in norm_alias or norm_alias in q:
-            b = BRANCH_BY_ID[br_id]
-            matches.append({"branch_id": b.branch_id, "display_name": b.display_name})
+    for br_id in store.branches_overlapping(q):
+        b = store.get_branch(br_id)
+        matches.append({"branch_id": b.branch_id, "display_name": b.display_name})
 
     if len(matches) == 1:
         return {"status": "OK", "branch": matches[0]}
@@ -270,7 +287,7 @@ def get_branch_by_name(name: str) -> Dict[str, Any]:
 
 
 
-def get_stock(branch_id: str, med_id: str) -> dict:
+def get_stock(branch_id: str, med_id: str, *, store: Optional[CatalogStore] = None) -> dict:
     """
     Tool Name: get_stock
     Resolve the stock availability of a specific medication at a specific
@@ -296,6 +313,10 @@ def get_stock(branch_id: str, med_id: str) -> dict:
             or lookup step and must correspond to a known medication in the
             database.
 
+        store (CatalogStore | None):
+            Catalog snapshot to read from (keyword only). Defaults to the
+            current store, `get_store()`.
+
     Returns:
         dict:
             A structured result with a strict schema:
@@ -325,13 +346,244 @@ def get_stock(branch_id: str, med_id: str) -> dict:
             may suggest checking another branch or contacting the pharmacy
             directly.
     """
-    key = (branch_id, med_id)
-    stock = INVENTORY_MAP.get(key, "UNKNOWN")
+    stock = (store or get_store()).get_stock(branch_id, med_id)
     return {"status": "OK", "stock_status": stock}
 
 
 
-def verify_prescription(rx_id: str) -> dict:
+def find_branches_with_stock(med_id: str, statuses: Optional[List[str]] = None, *, store: Optional[CatalogStore] = None) -> dict:
+    """
+    Tool Name: find_branches_with_stock
+    Resolve every pharmacy branch where a specific medication currently has
+    one of the requested stock statuses, using a deterministic lookup.
+
+    Purpose:
+        Answer "where is it in stock?" in a single step instead of checking
+        branch by branch. The lookup reads the medication's column of the
+        inventory (med -> branches view of the stock matrix), so the
+        agent can list alternatives, e.g. when the requested branch is out of
+        stock, without extra LLM round trips.
+
+    Parameters:
+        med_id (str):
+            The unique identifier of the medication. This value is expected
+            to be resolved earlier in the flow via `get_medication_by_name`.
+
+        statuses (list[str] | None):
+            Stock statuses to look for. Defaults to ["IN_STOCK", "LOW_STOCK"]
+            i.e., branches where the medication is available.
+
+        store (CatalogStore | None):
+            Catalog snapshot to read from (keyword only). Defaults to the
+            current store, `get_store()`.
+
+    Returns:
+        dict:
+            A structured result with a strict schema:
+            - status (Literal["OK", "NOT_FOUND"]):
+                Indicates whether the medication exists.
+            - med_id (str):
+                The requested medication identifier.
+            - statuses (list[str]):
+                The stock statuses that were searched for.
+            - branches (list[dict]):
+                Present only when status == "OK", in branch order. Each
+                contains:
+                    - branch_id (str)
+                    - display_name (str)
+                    - stock_status (str)
+
+    Error Handling:
+        This function does not raise exceptions. If med_id is empty or
+        unknown, status="NOT_FOUND" is returned. A known medication with no
+        matching branch returns status="OK" with an empty branches list.
+
+    Fallback Behavior:
+        - OK with branches:
+            The calling flow may present the branches directly as factual
+            availability information.
+        - OK with no branches:
+            The calling flow should state that the medication is currently
+            not available in any branch.
+        - NOT_FOUND:
+            The calling flow should resolve the medication first.
+    """
+    wanted = list(statuses) if statuses else ["IN_STOCK", "LOW_STOCK"]
+    store = store or get_store()
+    if not med_id or not store.get_medication(med_id):
+        return {"status": "NOT_FOUND", "med_id": med_id, "statuses": wanted}
+
+    branches = []
+    for branch_id, stock_status in store.branches_with_stock(med_id, wanted):
+        b = store.get_branch(branch_id)
+        branches.append({
+            "branch_id": branch_id,
+            "display_name": b.display_name if b else branch_id,
+            "stock_status": stock_status,})
+
+    return {"status": "OK", "med_id": med_id, "statuses": wanted, "branches": branches}
+
+
+
+def find_nearest_branches_with_stock(branch_id: str, med_id: str, k: int = 3, statuses: Optional[List[str]] = None, *, store: Optional[CatalogStore] = None) -> dict:
+    """
+    Tool Name: find_nearest_branches_with_stock
+    Resolve the k branches closest to a given branch where a specific
+    medication has one of the requested stock statuses, using a deterministic
+    spatial lookup.
+
+    Purpose:
+        Offer useful alternatives when the requested branch is out of stock:
+        the nearest branches that have the medication, ranked by distance,
+        instead of every branch in catalog order. The lookup is a grid index
+        over branch coordinates restricted to the medication's stock column,
+        so it runs inline before rendering without extra LLM round trips.
+
+    Parameters:
+        branch_id (str):
+            The unique identifier of the origin branch (the one that is out
+            of stock). Resolved earlier in the flow via `get_branch_by_name`.
+
+        med_id (str):
+            The unique identifier of the medication, resolved earlier in the
+            flow via `get_medication_by_name`.
+
+        k (int):
+            Maximum number of branches to return. Defaults to 3.
+
+        statuses (list[str] | None):
+            Stock statuses to look for. Defaults to ["IN_STOCK", "LOW_STOCK"].
+
+        store (CatalogStore | None):
+            Catalog snapshot to read from (keyword only). Defaults to the
+            current store, `get_store()`.
+
+    Returns:
+        dict:
+            A structured result with a strict schema:
+            - status (Literal["OK", "NOT_FOUND"]):
+                Indicates whether both the branch and the medication exist.
+            - branch_id (str), med_id (str), k (int), statuses (list[str]):
+                Echo of the request.
+            - branches (list[dict]):
+                Present only when status == "OK", closest first, never
+                including the origin branch. Each contains:
+                    - branch_id (str)
+                    - display_name (str)
+                    - stock_status (str)
+                    - distance_km (float | None)
+
+    Error Handling:
+        This function does not raise exceptions. Unknown ids return
+        status="NOT_FOUND". No matching branch returns status="OK" with an
+        empty branches list.
+
+    Fallback Behavior:
+        - If the origin branch has no coordinates, the first k matching
+          branches in catalog order are returned with distance_km=None.
+        - OK with no branches:
+            The calling flow should state that the medication is not available
+            in any other branch.
+    """
+    wanted = list(statuses) if statuses else ["IN_STOCK", "LOW_STOCK"]
+    result = {"status": "NOT_FOUND", "branch_id": branch_id, "med_id": med_id, "k": k, "statuses": wanted}
+    store = store or get_store()
+    origin = store.get_branch(branch_id) if branch_id else None
+    if not origin or not med_id or not store.get_medication(med_id):
+        return result
+
+    if origin.lat is not None and origin.lon is not None:
+        nearby = store.nearest_branches_with_stock(branch_id, med_id, k, wanted)
+    else:
+        nearby = [(br_id, st, None) for br_id, st in store.branches_with_stock(med_id, wanted) if br_id != branch_id][:k]
+
+    branches = []
+    for br_id, stock_status, distance_km in nearby:
+        b = store.get_branch(br_id)
+        branches.append({
+            "branch_id": br_id,
+            "display_name": b.display_name if b else br_id,
+            "stock_status": stock_status,
+            "distance_km": distance_km,})
+
+    result.update(status="OK", branches=branches)
+    return result
+
+
+
+def get_equivalents(med_id: str, branch_id: Optional[str] = None, *, store: Optional[CatalogStore] = None) -> dict:
+    """
+    Tool Name: get_equivalents
+    Resolve the other medications in the catalog that share the same active
+    ingredient (generic equivalents) as a given medication.
+
+    Purpose:
+        Let the agent mention same-ingredient products, e.g. a different brand
+        that is in stock when the requested one is not, using the precomputed
+        ingredient -> medications index of the catalog (no LLM involvement).
+
+    Parameters:
+        med_id (str):
+            The unique identifier of the medication, resolved earlier in the
+            flow via `get_medication_by_name`.
+
+        branch_id (str | None):
+            Optional branch identifier. When provided, each equivalent also
+            carries its stock status at that branch.
+
+        store (CatalogStore | None):
+            Catalog snapshot to read from (keyword only). Defaults to the
+            current store, `get_store()`.
+
+    Returns:
+        dict:
+            A structured result with a strict schema:
+            - status (Literal["OK", "NOT_FOUND"]):
+                Indicates whether the medication exists.
+            - med_id (str):
+                The requested medication identifier.
+            - active_ingredient (str):
+                Present only when status == "OK".
+            - equivalents (list[dict]):
+                Present only when status == "OK", in catalog order. Each
+                contains:
+                    - med_id (str)
+                    - display_name (str)
+                    - rx_required (bool)
+                    - stock_status (str), only when branch_id is provided
+
+    Error Handling:
+        This function does not raise exceptions. An unknown med_id returns
+        status="NOT_FOUND". A medication without equivalents returns
+        status="OK" with an empty equivalents list.
+
+    Fallback Behavior:
+        - OK with equivalents:
+            The calling flow may list them as factual catalog information only
+            (no substitution advice).
+        - OK with no equivalents or NOT_FOUND:
+            The calling flow should not mention equivalents.
+    """
+    store = store or get_store()
+    med = store.get_medication(med_id) if med_id else None
+    if not med:
+        return {"status": "NOT_FOUND", "med_id": med_id}
+
+    equivalents = []
+    for other_id in store.equivalent_medications(med_id):
+        other = store.get_medication(other_id)
+        if not other:
+            continue
+        item = {"med_id": other.med_id, "display_name": other.display_name, "rx_required": other.rx_required}
+        if branch_id:
+            item["stock_status"] = store.get_stock(branch_id, other.med_id)
+        equivalents.append(item)
+
+    return {"status": "OK", "med_id": med_id, "active_ingredient": med.active_ingredient, "equivalents": equivalents}
+
+
+
+def verify_prescription(rx_id: str, *, store: Optional[CatalogStore] = None) -> dict:
     """
     Tool Name: verify_prescription
     Resolve and validate a prescription record using a deterministic,
@@ -351,6 +603,10 @@ def verify_prescription(rx_id: str) -> dict:
             whitespace. The identifier is normalized to uppercase prior to
             matching.
 
+        store (CatalogStore | None):
+            Catalog snapshot to read from (keyword only). Defaults to the
+            current store, `get_store()`.
+
     Returns:
         dict:
             A structured result with a strict schema:
@@ -403,22 +659,19 @@ def verify_prescription(rx_id: str) -> dict:
     if not rx_id:
         return {"status": "NOT_FOUND"}
 
-    p = RX_BY_ID.get(rx_id)
+    store = store or get_store()
+    p = store.get_prescription(rx_id)
     if not p:
         return {"status": "NOT_FOUND"}
     
-    today = date.today()
-    is_expired_by_date = today > p.expires_on
-    med = MED_BY_ID.get(p.med_id)
-    user = USER_BY_ID.get(p.user_id)
+    med = store.get_medication(p.med_id)
+    user = store.get_user(p.user_id)
 
-    # status rules:
+    # status rules (materialized by the store, refreshed once per day):
     # - CANCELLED always cancelled
     # - EXPIRED if explicit status EXPIRED OR expired by date
     # - otherwise VALID
-    final = p.status
-    if p.status != "CANCELLED" and is_expired_by_date:
-        final = "EXPIRED" #to verify expired meds which are valid in db but in fact expired 
+    final = store.rx_status(p)
 
     return {
         "status": "OK",
@@ -434,7 +687,7 @@ def verify_prescription(rx_id: str) -> dict:
     }
 
 
-def get_prescriptions_for_user(user_id: str) -> dict:
+def get_prescriptions_for_user(user_id: str, *, store: Optional[CatalogStore] = None) -> dict:
     """
     Tool Name: get_prescriptions_for_user
     Resolve and list all prescriptions associated with a specific user
@@ -454,6 +707,10 @@ def get_prescriptions_for_user(user_id: str) -> dict:
             leading/trailing whitespace and is case-insensitive; the value
             is normalized to lowercase prior to matching.
 
+        store (CatalogStore | None):
+            Catalog snapshot to read from (keyword only). Defaults to the
+            current store, `get_store()`.
+
     Returns:
         dict:
             A structured result with a strict schema:
@@ -499,7 +756,7 @@ def get_prescriptions_for_user(user_id: str) -> dict:
         - The returned list of prescriptions is sorted by rx_id to ensure
           stable ordering across repeated calls with the same data.
         - All status computations are derived solely from stored fields and
-          the current date.
+          the current date (materialized per day by the catalog store).
 
     Fallback Behavior:
         - OK:
@@ -519,32 +776,21 @@ def get_prescriptions_for_user(user_id: str) -> dict:
     if not uid:
         return {"status": "NOT_FOUND"}
 
-    user = USER_BY_ID.get(uid)
+    store = store or get_store()
+    user = store.get_user(uid)
     if not user:
         return {"status": "NOT_FOUND"}
 
-    today = date.today()
     out = []
-    for p in PRESCRIPTIONS: #can be iptimized using a dedicated index
-        if p.user_id.lower() != uid:
-            continue
-
-        med = MED_BY_ID.get(p.med_id)
-        # Recompute final status same way verify_prescription does based on facts such as the date
-        final = p.status
-        if p.status != "CANCELLED" and today > p.expires_on:
-            final = "EXPIRED"
-
+    for p in store.prescriptions_for_user(uid): # dedicated user index, already sorted by rx_id
+        med = store.get_medication(p.med_id)
         out.append({
             "rx_id": p.rx_id,
             "med_id": p.med_id,
             "med_name": med.display_name if med else None,
-            "rx_status": final,
+            "rx_status": store.rx_status(p), # same materialized status verify_prescription uses
             "expires_on": p.expires_on.isoformat(),})
 
-    # sorting (optional)
-    out.sort(key=lambda r: r["rx_id"])
-
     return {
         "status": "OK",
         "user": {"user_id": uid, "user_name": user.full_name},
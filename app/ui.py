@@ -1,17 +1,26 @@
 import gradio as gr
 from app.schemas import ChatRequest, ChatMessage, FlowState
-from app.orchestrator import handle_turn
+from app.orchestrator_async import handle_turn_async
+from app.llm_client import awarm_up
 
 
 TRACE_LABELS = {
     "safety_gate": "Safety gate activated (medical advice refusal)",
     # "flow_escape": "Escaped flow + rerouted",
     "detect_intent": "Intent routing",
+    "detect_intent(cached)": "Intent routing (cached, no LLM call)",
+    "detect_intent(rules)": "Intent routing (deterministic rules, no LLM call)",
+    "detect_intent(local)": "Intent routing (local model, no LLM call)",
+    "speculative_extract": "Extractors started next to intent routing (unneeded ones discarded)",
     "extract_med_name": "Trying to exract medicine name",
     "extract_branch_name": "Trying to exract branch name",
     "get_medication_by_name": "DB lookup: medication",
     "get_branch_by_name": "DB lookup: branch",
     "get_stock": "DB lookup: inventory status",
+    "find_branches_with_stock": "DB lookup: branches with the medication in stock",
+    "find_nearest_branches_with_stock": "DB lookup: nearest branches with stock",
+    "get_equivalents": "DB lookup: same active ingredient products",
+    "catalog_snapshot": "Catalog snapshot version",
     "verify_prescription": "DB lookup: prescription status",
     "get_prescriptions_for_user": "DB lookup: user prescriptions",
     "render_med_info": "Render medication info answer",
@@ -46,7 +55,7 @@ def normalize_content(content) -> str:
     # Fallback
     return str(content)
 
-def respond(message, history, flow_state,trace_state):
+async def respond(message, history, flow_state,trace_state):
     """
     message: str
     history: list[dict]  (gr.Chatbot type="messages")
@@ -73,7 +82,8 @@ def respond(message, history, flow_state,trace_state):
 
     # Stream orchestrator updates
     last_flow = flow_state or {"name": None, "step": None, "slots": {}, "done": False}
-    for _delta, partial in handle_turn(req):
+    # async turn: the event loop keeps serving other sessions while this one waits on the LLM
+    async for _delta, partial in handle_turn_async(req):
         ui_history = [{"role": m.role, "content": m.content} for m in partial.history] #back to UI history format
         #update flow state
         last_flow = partial.flow.model_dump() #dump to convert back to normal dict for the UI
@@ -107,9 +117,14 @@ def build_ui():
         
         send.click(respond,inputs=[msg, chatbot, flow_state, trace_state],outputs=[chatbot, msg, flow_state, trace_panel],)
         msg.submit(respond,inputs=[msg, chatbot, flow_state, trace_state],outputs=[chatbot, msg, flow_state, trace_panel],)
+        demo.load(_warm_llm_pool) # first page load opens the LLM connections on gradio's event loop
     return demo
 
 
+async def _warm_llm_pool():
+    await awarm_up(once=True)
+
+
 def trace_markdown(tool_calls) -> str:
     """
     Turn tool or internal function calls into a clean per-turn execution timeline (Markdown).
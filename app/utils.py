@@ -1,4 +1,41 @@
+import re
+
+
 def norm(s: str) -> str:
     return (s or "").strip().lower()
 
 
+# precompiled once - norm_text runs on every lookup and on every alias at index build time
+_NON_WORD_RE = re.compile(r"[^\w\u0590-\u05FF]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def norm_text(s: str) -> str:
+    """
+    Normalize text for deterministic matching:
+    - lowercase
+    - remove punctuation
+    - collapse whitespace
+    """
+    if not s:
+        return ""
+    s = s.lower()
+    # replace any non-letter/digit with space (works for Hebrew too)
+    s = _NON_WORD_RE.sub(" ", s)
+    # collapse multiple spaces
+    return _SPACES_RE.sub(" ", s).strip()
+
+
+# Hebrew-aware folding for fuzzy matching: niqqud/cantillation marks are dropped,
+# final letter forms are mapped to their regular form (ן -> נ) and geresh/gershayim removed
+_HE_MARKS_RE = re.compile(r"[\u0591-\u05C7\u05F3\u05F4]")
+_HE_FINALS = str.maketrans({"ך": "כ", "ם": "מ", "ן": "נ", "ף": "פ", "ץ": "צ"})
+
+
+def fold_text(s: str) -> str:
+    """
+    norm_text + Hebrew-aware folding, used as the key space of the fuzzy matcher
+    so that e.g. "ןאדביל" and "נאדביל" are the same string.
+    """
+    s = _HE_MARKS_RE.sub("", norm_text(s))
+    return s.translate(_HE_FINALS)
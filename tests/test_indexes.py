@@ -0,0 +1,178 @@
+import math
+import random
+import numpy as np
+import pytest
+from app.indexes import AliasIndex, FuzzyIndex, GeoGrid, MentionAutomaton, fuzzy_budget, levenshtein
+from app.utils import fold_text, norm_text
+
+# Every index is checked against a plain scan over the same entries.
+
+_LATIN = "abdeilnoprst"
+_HEBREW = "אבדהולמנסרתךםןף"
+
+
+def _word(rng, alphabet, lo=3, hi=9):
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(lo, hi)))
+
+
+def _entries(seed=0, owners=150):
+    # (owner, value, kind) in priority order, Latin and Hebrew names with shared fragments and final letters
+    rng = random.Random(seed)
+    out = []
+    for o in range(owners):
+        owner = f"med_{o:03d}"
+        out.append((owner, _word(rng, _LATIN).title(), "canonical"))
+        for _ in range(rng.randint(0, 3)):
+            out.append((owner, _word(rng, rng.choice([_LATIN, _HEBREW])), "alias"))
+    return out
+
+
+def _queries(entries, seed=1, n=200):
+    # substrings and typos of real keys, plus random strings
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        key = norm_text(rng.choice(entries)[1])
+        r = rng.random()
+        if r < 0.3:
+            i = rng.randrange(len(key))
+            out.append(key[i:i + rng.randint(1, 4)])
+        elif r < 0.7:
+            chars = list(key)
+            for _ in range(rng.randint(1, 2)):
+                op, i = rng.randrange(3), rng.randrange(len(chars))
+                alphabet = _HEBREW if "֐" <= chars[i] <= "׿" else _LATIN
+                if op == 0:
+                    chars[i] = rng.choice(alphabet)
+                elif op == 1 and len(chars) > 1:
+                    del chars[i]
+                else:
+                    chars.insert(i, rng.choice(alphabet))
+            out.append("".join(chars))
+        else:
+            out.append(_word(rng, rng.choice([_LATIN, _HEBREW]), 1, 8))
+    return out
+
+
+@pytest.fixture(scope="module")
+def entries():
+    return _entries()
+
+
+@pytest.fixture(scope="module")
+def index(entries):
+    return AliasIndex(entries)
+
+
+def test_alias_exact_and_contains_match_a_scan(entries, index):
+    keys = [norm_text(v) for _, v, _ in entries]
+    for q in _queries(entries) + [norm_text(v) for _, v, _ in entries[:50]]:
+        assert index.exact(q) == [i for i, k in enumerate(keys) if k == q]
+        assert index.contains(q) == [i for i, k in enumerate(keys) if q in k]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 10])
+def test_alias_contains_limit_keeps_the_first_owners(entries, index, limit):
+    for q in _queries(entries, seed=2) + ["a", "e", "ל"]:
+        full = index.first_per_owner(index.contains(q))
+        assert index.first_per_owner(index.contains(q, limit)) == full[:limit]
+
+
+def test_levenshtein_bound():
+    rng = random.Random(3)
+    for _ in range(500):
+        a, b = _word(rng, "abc", 0, 8), _word(rng, "abc", 0, 8)
+        d = levenshtein(a, b)
+        assert d == levenshtein(b, a)
+        for k in range(4):
+            assert levenshtein(a, b, k) == min(d, k + 1)
+
+
+def test_fuzzy_matches_a_scan_on_folded_keys(entries, index):
+    fuzzy = FuzzyIndex(index)
+    folded = [fold_text(k) for k in index.keys]
+    for q in _queries(entries, seed=4) + ["ןאדביל", "נאדביל"]:
+        fq = fold_text(q)
+        k = fuzzy_budget(fq)
+        hits = sorted((d, i) for i, key in enumerate(folded) if (d := levenshtein(fq, key)) <= k) if k else []
+        seen, expected = set(), []
+        for d, i in hits:
+            if index.owners[i] not in seen:
+                seen.add(index.owners[i])
+                expected.append((index.owners[i], index.values[i], index.kinds[i], d))
+        assert [r[:4] for r in fuzzy.search(q)] == expected, q
+
+
+def test_fuzzy_folds_hebrew_final_letters():
+    fuzzy = FuzzyIndex(AliasIndex([("med_001", "נאדביל", "alias")]))
+    assert [(r[0], r[3]) for r in fuzzy.search("ןאדביל")] == [("med_001", 0)]
+
+
+def _scan_mentions(patterns, text):
+    # every occurrence of every (first per kind + key) pattern, then longest first / priority, non-overlapping
+    t = text.lower()
+    found, seen = [], set()
+    for p, (kind, entity_id, value) in enumerate(patterns):
+        key = value.strip().lower()
+        if not key or (kind, key) in seen:
+            continue
+        seen.add((kind, key))
+        start = t.find(key)
+        while start != -1:
+            found.append((-len(key), p, start, start + len(key), kind, entity_id, value))
+            start = t.find(key, start + 1)
+    chosen = []
+    for _, _, start, end, kind, entity_id, value in sorted(found, key=lambda f: (f[0], f[1])):
+        if all(end <= c[0] or start >= c[1] for c in chosen):
+            chosen.append((start, end, kind, entity_id, value))
+    longest = min(found, key=lambda f: (f[0], f[1]))[2:] if found else None
+    return sorted(chosen), longest, sorted(f[2:] for f in found)
+
+
+def test_mentions_match_a_scan():
+    rng = random.Random(5)
+    patterns = [(rng.choice(["med", "branch"]), f"id_{i}", _word(rng, "abn", 1, 4)) for i in range(60)]
+    patterns += [("med", "id_x", "Ban"), ("branch", "id_y", "ban")]  # same key, two kinds
+    automaton = MentionAutomaton(patterns)
+    for _ in range(300):
+        text = _word(rng, "abnAB ", 0, 30)
+        chosen, longest, found = _scan_mentions(patterns, text)
+        assert [tuple(m) for m in automaton.scan(text)] == chosen, text
+        got = automaton.longest(text)
+        assert (tuple(got) if got else None) == longest, text
+        assert sorted(tuple(m) for m in automaton.find_all(text)) == found, text
+
+
+def test_mentions_prefer_the_longest_overlap():
+    automaton = MentionAutomaton([("med", "m1", "Advil"), ("med", "m2", "Advil Forte"), ("branch", "b1", "forte center")])
+    assert [(m.entity_id, m.start) for m in automaton.scan("do you have advil forte?")] == [("m2", 12)]
+    # "forte center" is longer than "advil forte", the med mention falls back to "advil"
+    assert [m.entity_id for m in automaton.scan("advil forte center")] == ["m1", "b1"]
+    assert automaton.longest("advil forte center", kind="med").entity_id == "m2"
+
+
+def _grid_points(seed=6, n=400):
+    rng = random.Random(seed)
+    pts = [(f"br_{i:03d}", 31 + rng.random() * 2, 34 + rng.random() * 1.5) for i in range(n)]
+    pts[7] = ("br_007", None, None)
+    pts[99] = ("br_099", None, 34.5)
+    return pts
+
+
+@pytest.mark.parametrize("brute_force_max", [0, 64])
+def test_grid_nearest_matches_a_scan(brute_force_max):
+    pts = _grid_points()
+    grid = GeoGrid(pts, brute_force_max=brute_force_max)
+    rng = random.Random(7)
+    for _ in range(100):
+        qlat, qlon = 31 + rng.random() * 2, 34 + rng.random() * 1.5
+        k = rng.randint(1, 12)
+        allowed = np.array([rng.random() < rng.choice([0.05, 0.5, 1.0]) for _ in pts])
+        qx = math.radians(qlon) * grid._cos_lat0 * 6371.0
+        qy = math.radians(qlat) * 6371.0
+        expected = sorted(
+            (math.hypot(grid.x[i] - qx, grid.y[i] - qy), i) for i in range(len(pts)) if allowed[i] and grid.located[i])[:k]
+        got = grid.nearest(qlat, qlon, k, allowed)
+        assert [pid for pid, _ in got] == [pts[i][0] for _, i in expected]
+        assert [d for _, d in got] == [round(d, 1) for d, _ in expected]
+    assert "br_007" not in [pid for pid, _ in grid.nearest(31, 34, len(pts))]
@@ -0,0 +1,36 @@
+import pytest
+from app.orchestrator import _pre_route
+from app.store import InMemoryStore
+
+
+@pytest.fixture(scope="module")
+def store():
+    return InMemoryStore.from_synthetic()
+
+
+@pytest.mark.parametrize("text", [
+    "Hi, I want to verify my prescription",
+    "hello, can you check my prescriptions?",
+    "I need help with my prescription",
+    "שלום, אני רוצה לבדוק מרשם",
+    "hi there, where is the nearest pharmacy",
+    "help me find a pharmacy",
+])
+def test_mixed_messages_go_to_the_router(store, text):
+    assert _pre_route(text, store) is None
+
+
+@pytest.mark.parametrize("text", ["hi!", "Hello", "thanks!!", "help", "hey, what can you do?", "שלום", "תודה רבה", "שלום, מה אתה יכול לעשות?"])
+def test_greeting_only_is_small_talk(store, text):
+    parsed, rule = _pre_route(text, store)
+    assert (parsed.intent, rule) == ("small_talk", "greeting_or_meta")
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("RX-10001", "rx_verify"),
+    ("hi, do you have advil?", "stock_check"),
+    ("Does Advil need a prescription?", "med_info"),
+    ("advil", "med_info"),
+])
+def test_unambiguous_rules(store, text, intent):
+    assert _pre_route(text, store)[0].intent == intent
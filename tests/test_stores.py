@@ -0,0 +1,109 @@
+import random
+import pytest
+from app.mmap_store import MmapStore, write_mmap_catalog
+from app.store import InMemoryStore, SQLiteStore
+from app.synthetic import generate_catalog
+from app.utils import norm_text
+
+# The SQLite and memory-mapped backends must answer every lookup exactly like InMemoryStore.
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return generate_catalog(2000, seed=3)
+
+
+@pytest.fixture(scope="module")
+def reference(catalog):
+    return InMemoryStore(*catalog)
+
+
+@pytest.fixture(scope="module", params=["sqlite", "mmap"])
+def store(request, catalog, tmp_path_factory):
+    workdir = tmp_path_factory.mktemp(request.param)
+    if request.param == "sqlite":
+        return SQLiteStore.create(str(workdir / "catalog.sqlite3"), *catalog)
+    path = str(workdir / "catalog.mmap")
+    write_mmap_catalog(path, *catalog)
+    return MmapStore(path)
+
+
+def _name_queries(catalog, n=300):
+    rng = random.Random(0)
+    names = [v for m in catalog.medications for v in [m.display_name, *m.aliases]]
+    out = ["", "zzqxv", "a", "א"]
+    for _ in range(n):
+        key = norm_text(rng.choice(names))
+        i = rng.randrange(len(key))
+        out += [key, key[i:i + rng.randint(1, 5)], key[:i] + key[i + 1:]]
+    return out
+
+
+def test_medication_lookups(catalog, reference, store):
+    for q in _name_queries(catalog):
+        for match_type in ("exact", "contains"):
+            assert store.match_medications(q, match_type) == reference.match_medications(q, match_type), (q, match_type)
+            assert store.match_medications(q, match_type, 3) == reference.match_medications(q, match_type, 3), (q, match_type)
+        assert store.fuzzy_medications(q) == reference.fuzzy_medications(q), q
+    for m in catalog.medications[:50]:
+        assert store.get_medication(m.med_id) == reference.get_medication(m.med_id)
+        assert store.equivalent_medications(m.med_id) == reference.equivalent_medications(m.med_id)
+    assert store.get_medication("nope") is None
+
+
+def test_branch_lookups(catalog, reference, store):
+    for b in catalog.branches:
+        assert store.get_branch(b.branch_id) == reference.get_branch(b.branch_id)
+        for alias in b.aliases:
+            q = norm_text(alias)
+            assert store.branch_for_alias(q) == reference.branch_for_alias(q)
+            assert store.branches_overlapping(q) == reference.branches_overlapping(q)
+    assert store.branch_for_alias("nowhere") is None
+
+
+def test_stock_lookups(catalog, reference, store):
+    rng = random.Random(1)
+    statuses = ["IN_STOCK", "LOW_STOCK"]
+    for _ in range(100):
+        b, m = rng.choice(catalog.branches).branch_id, rng.choice(catalog.medications).med_id
+        assert store.get_stock(b, m) == reference.get_stock(b, m)
+        assert store.branches_with_stock(m, statuses) == reference.branches_with_stock(m, statuses)
+        assert store.nearest_branches_with_stock(b, m, 5, statuses) == reference.nearest_branches_with_stock(b, m, 5, statuses)
+        assert store.stock_row(b) == reference.stock_row(b)
+
+
+def test_prescription_lookups(catalog, reference, store):
+    for p in catalog.prescriptions[:100]:
+        assert store.get_prescription(p.rx_id) == reference.get_prescription(p.rx_id)
+        assert store.rx_status(p) == reference.rx_status(p)
+        assert store.prescriptions_for_user(p.user_id) == reference.prescriptions_for_user(p.user_id)
+    assert store.get_prescription("RX-1") is None
+
+
+def test_mentions(catalog, reference, store):
+    m, b = catalog.medications[5], catalog.branches[2]
+    text = f"do you have {m.display_name} in {b.aliases[0]}?".lower()
+    assert store.mentions.scan(text) == reference.mentions.scan(text)
+
+
+def test_mmap_open_creates_the_file_once(tmp_path):
+    path = str(tmp_path / "catalog.mmap")
+    first = MmapStore.open(path)
+    assert MmapStore.open(path).version == first.version
+
+
+def test_mmap_refresh_keeps_live_stock(catalog, tmp_path):
+    path = str(tmp_path / "catalog.mmap")
+    write_mmap_catalog(path, *catalog)
+    store = MmapStore(path)
+    b, m = catalog.branches[0].branch_id, catalog.medications[0].med_id
+    status = "OUT_OF_STOCK" if store.get_stock(b, m) != "OUT_OF_STOCK" else "IN_STOCK"
+    assert store.apply_stock_updates([(b, m, status)]) == 1
+
+    write_mmap_catalog(path, *catalog)
+    assert MmapStore(path).get_stock(b, m) == status
+    with pytest.raises(RuntimeError):
+        store.apply_stock_updates([(b, m, status)])  # still mapping the replaced file
+
+    write_mmap_catalog(path, *catalog, keep_stock=False)
+    assert MmapStore(path).get_stock(b, m) == InMemoryStore(*catalog).get_stock(b, m)
@@ -0,0 +1,33 @@
+from app.db import Medication
+from app.store import InMemoryStore
+from app.tools import MAX_MED_MATCHES, get_medication_by_name
+
+
+def _med(med_id, name):
+    return Medication(med_id=med_id, display_name=name, aliases=[], active_ingredient=name, rx_required=False, label_summary="")
+
+
+def _store(names):
+    return InMemoryStore([_med(f"m{i}", n) for i, n in enumerate(names)], [], [], [], [])
+
+
+def test_fuzzy_tie_lists_only_the_closest_candidates():
+    store = _store(["Bolanixer", "Dolanixer", "Tolanikez"])
+    assert [r[3] for r in store.fuzzy_medications("Tolanixer")] == [1, 1, 2]
+    res = get_medication_by_name("Tolanixer", store=store)
+    assert res["status"] == "AMBIGUOUS"
+    assert [m["med_id"] for m in res["matches"]] == ["m0", "m1"]
+
+
+def test_single_closest_fuzzy_candidate_resolves():
+    res = get_medication_by_name("Dolanikez", store=_store(["Bolanixer", "Tolanikez"]))
+    assert res["status"] == "OK"
+    assert res["medication"]["med_id"] == "m1"
+    assert res["match_info"]["match_type"] == "fuzzy"
+
+
+def test_contains_matches_are_capped():
+    store = _store([f"Zorbamol {i}" for i in range(MAX_MED_MATCHES + 5)])
+    res = get_medication_by_name("zorba", store=store)
+    assert res["status"] == "AMBIGUOUS"
+    assert [m["med_id"] for m in res["matches"]] == [f"m{i}" for i in range(MAX_MED_MATCHES)]